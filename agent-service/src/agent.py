@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 import logging
+from .llm import EchoBackend, LLMBackend
 
 logger = logging.getLogger(__name__)
 
@@ -15,41 +16,76 @@ class BaseAgent(ABC):
         self,
         message: str,
         knowledge: Optional[Dict] = None,
-        tools: Optional[List[Dict]] = None
+        tools: Optional[List[Dict]] = None,
+        history: Optional[List[Dict]] = None
     ) -> str:
-        """处理消息"""
+        """处理消息，history 为该会话之前的对话（只读，由调用方维护）"""
         pass
     
+    async def stream_message(
+        self,
+        message: str,
+        knowledge: Optional[Dict] = None,
+        tools: Optional[List[Dict]] = None,
+        history: Optional[List[Dict]] = None
+    ) -> AsyncIterator[str]:
+        """流式处理消息，逐块返回响应；默认把 process_message 的完整结果作为一块返回"""
+        yield await self.process_message(message=message, knowledge=knowledge, tools=tools, history=history)
+    
     def clear_memory(self):
         """清空记忆"""
         self.memory = []
         logger.info(f"Cleared memory for agent {self.name}")
 
+def _knowledge_snippets(knowledge: Optional[Dict]) -> List[str]:
+    """取出知识检索结果中的文档内容（结果形如 {"document": {"content": ...}, "similarity": ...}），跳过格式不对的条目"""
+    snippets = []
+    for result in (knowledge or {}).get("results") or []:
+        document = result.get("document") if isinstance(result, dict) else None
+        content = document.get("content") if isinstance(document, dict) else None
+        if isinstance(content, str) and content:
+            snippets.append(content)
+    return snippets
+
 class ChatAgent(BaseAgent):
-    def __init__(self, name: str, description: str):
+    def __init__(self, name: str, description: str, backend: Optional[LLMBackend] = None):
         super().__init__(name, description)
-        self.conversation_history = []
+        self.backend = backend or EchoBackend()
+    
+    def _build_messages(
+        self,
+        message: str,
+        knowledge: Optional[Dict],
+        tools: Optional[List[Dict]],
+        history: Optional[List[Dict]]
+    ) -> List[Dict]:
+        """系统提示（含知识检索结果与可用工具）、会话历史与当前消息"""
+        system = f"You are {self.name}, {self.description}."
+        snippets = _knowledge_snippets(knowledge)
+        if snippets:
+            system += "\n\nRelevant knowledge:\n" + "\n".join(f"- {snippet}" for snippet in snippets)
+        if tools:
+            names = ", ".join(str(tool.get("name", tool)) for tool in tools)
+            system += f"\n\nAvailable tools: {names}"
+        return [{"role": "system", "content": system}, *(history or []), {"role": "user", "content": message}]
+    
+    async def stream_message(
+        self,
+        message: str,
+        knowledge: Optional[Dict] = None,
+        tools: Optional[List[Dict]] = None,
+        history: Optional[List[Dict]] = None
+    ) -> AsyncIterator[str]:
+        """由 LLM 后端逐块生成响应"""
+        async for chunk in self.backend.stream(self._build_messages(message, knowledge, tools, history)):
+            yield chunk
     
     async def process_message(
         self,
         message: str,
         knowledge: Optional[Dict] = None,
-        tools: Optional[List[Dict]] = None
+        tools: Optional[List[Dict]] = None,
+        history: Optional[List[Dict]] = None
     ) -> str:
         """处理聊天消息"""
-        # 添加消息到历史记录
-        self.conversation_history.append({"role": "user", "content": message})
-        
-        # 处理消息（这里应该调用实际的LLM）
-        response = f"Echo: {message}"  # 示例响应
-        
-        # 添加响应到历史记录
-        self.conversation_history.append({"role": "assistant", "content": response})
-        
-        return response
-    
-    def clear_memory(self):
-        """清空聊天历史"""
-        super().clear_memory()
-        self.conversation_history = []
-        logger.info(f"Cleared conversation history for agent {self.name}") 
\ No newline at end of file
+        return "".join([chunk async for chunk in self.stream_message(message, knowledge, tools, history)]) 
\ No newline at end of file
@@ -0,0 +1,65 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 依赖的服务地址
+KNOWLEDGE_SERVICE_URL = os.getenv("KNOWLEDGE_SERVICE_URL", "http://knowledge-service").rstrip("/")
+TOOL_SERVICE_URL = os.getenv("TOOL_SERVICE_URL", "http://tool-service").rstrip("/")
+
+# 到依赖服务的共享连接池：最大连接数、最大空闲长连接数、空闲连接保活时间（秒）
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# 单次调用超时（秒）：超时的知识检索或工具获取被跳过，不阻塞消息处理
+KNOWLEDGE_TIMEOUT = float(os.getenv("KNOWLEDGE_TIMEOUT", "2"))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "2"))
+
+# 工具定义缓存：TTL（秒）与最大条目数
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "300"))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1000"))
+
+# LLM 后端: echo（确定性的本地替身，用于测试）/ openai（OpenAI 兼容的流式接口）
+LLM_BACKEND = os.getenv("LLM_BACKEND", "echo")
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1").rstrip("/")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# echo 后端每个分块之间的延迟（秒），用于模拟生成速度
+ECHO_CHUNK_DELAY = float(os.getenv("ECHO_CHUNK_DELAY", "0"))
+
+# 会话记忆：每个会话保留的历史 token 预算、内存中会话数上限与空闲超时（秒）
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "3000"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "1800"))
+# 被淘汰会话的落盘目录，客户端重新连接时恢复（为空时直接丢弃）；落盘会话的过期时间（秒）与文件数上限
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR", "")
+SESSION_SPILL_TTL = float(os.getenv("SESSION_SPILL_TTL", str(7 * 24 * 3600)))
+SESSION_SPILL_MAX_FILES = int(os.getenv("SESSION_SPILL_MAX_FILES", "100000"))
+
+# 每个 WebSocket 连接同时处理的最大请求数，超出时直接返回错误
+MAX_IN_FLIGHT_PER_CONNECTION = int(os.getenv("MAX_IN_FLIGHT_PER_CONNECTION", "4"))
+
+# 每个 WebSocket 连接的点对点与广播发送队列长度；慢消费者策略: drop_oldest（丢弃最旧的广播）/ disconnect（广播队列满时断开）
+SEND_QUEUE_SIZE = int(os.getenv("SEND_QUEUE_SIZE", "256"))
+SLOW_CONSUMER_POLICY = os.getenv("SLOW_CONSUMER_POLICY", "drop_oldest")
+# 广播背板: local（单进程）/ redis（多个 agent-service 进程之间通过 Redis pub/sub 广播）
+BROADCAST_BACKPLANE = os.getenv("BROADCAST_BACKPLANE", "local")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+BROADCAST_CHANNEL = os.getenv("BROADCAST_CHANNEL", "agent-broadcast")
+
+# 响应缓存：按规范化消息精确匹配，按 agent、工具与知识库版本隔离
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+# 相似问题匹配：配置嵌入模型后通过 OPENAI_API_BASE 的 Embeddings 接口计算消息向量，余弦相似度不低于阈值即命中；
+# 未配置模型时只做精确匹配；嵌入调用超时（秒）
+SEMANTIC_CACHE_EMBEDDING_MODEL = os.getenv("SEMANTIC_CACHE_EMBEDDING_MODEL", "")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_EMBEDDING_TIMEOUT = float(os.getenv("SEMANTIC_CACHE_EMBEDDING_TIMEOUT", "2"))
+# 只缓存没有对话历史的首轮消息（后续轮次的回答依赖上下文）
+SEMANTIC_CACHE_FIRST_TURN_ONLY = os.getenv("SEMANTIC_CACHE_FIRST_TURN_ONLY", "true").lower() == "true"
+# 知识库版本号的本地缓存时间（秒），知识库写入后最多这么久缓存失效
+KNOWLEDGE_VERSION_TTL = float(os.getenv("KNOWLEDGE_VERSION_TTL", "5"))
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import httpx
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """带过期时间的 LRU 缓存，同一个键的并发未命中合并为一次加载，加载失败不缓存"""
+
+    def __init__(self, ttl: float, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        cached = self._entries.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cached[0]
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            # 加载在独立任务中进行，不属于任何一个调用方：某个调用方被取消时其他等待者照常拿到结果
+            task = asyncio.ensure_future(load())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._loaded(key, done))
+        return await asyncio.shield(task)
+
+    def _loaded(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 读取异常同时避免 "exception was never retrieved" 警告；失败的结果不缓存
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._entries[key] = (task.result(), time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+class ContextGatherer:
+    """为一条消息准备 LLM 之前需要的上下文：知识检索结果与工具定义
+
+    使用共享的连接池客户端，知识检索和所有工具获取并发进行，总耗时约为最慢的一次调用；
+    每次调用单独限时，失败或超时的调用被跳过而不是让整条消息失败。
+    """
+
+    def __init__(
+        self,
+        knowledge_url: str,
+        tool_url: str,
+        limits: httpx.Limits,
+        knowledge_timeout: float = 2,
+        tool_timeout: float = 2,
+        tool_cache_ttl: float = 300,
+        tool_cache_max_entries: int = 1000,
+        version_ttl: float = 5
+    ):
+        self.knowledge_client = httpx.AsyncClient(base_url=knowledge_url, limits=limits)
+        self.tool_client = httpx.AsyncClient(base_url=tool_url, limits=limits)
+        self.knowledge_timeout = knowledge_timeout
+        self.tool_timeout = tool_timeout
+        # 工具定义很少变化，缓存后大多数消息不再请求 tool-service
+        self.tool_cache = TTLCache(tool_cache_ttl, tool_cache_max_entries)
+        # 知识库版本只需要近似最新，短时间内复用上一次的结果
+        self.version_cache = TTLCache(version_ttl, 1)
+        self.failures = 0
+
+    async def search_knowledge(self, query: str) -> Optional[Dict]:
+        """知识检索，失败或超时返回 None"""
+        try:
+            response = await asyncio.wait_for(
+                self.knowledge_client.get("/knowledge/search", params={"query": query}),
+                self.knowledge_timeout
+            )
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, ValueError, asyncio.TimeoutError) as e:
+            self.failures += 1
+            logger.error(f"Error searching knowledge: {str(e) or type(e).__name__}")
+            return None
+
+    async def _fetch_version(self) -> str:
+        response = await asyncio.wait_for(self.knowledge_client.get("/knowledge/version"), self.knowledge_timeout)
+        response.raise_for_status()
+        return str(response.json()["version"])
+
+    async def knowledge_version(self) -> Optional[str]:
+        """知识库当前版本（短时间缓存），获取失败返回 None"""
+        try:
+            return await self.version_cache.get("version", self._fetch_version)
+        except (httpx.HTTPError, ValueError, KeyError, asyncio.TimeoutError) as e:
+            self.failures += 1
+            logger.error(f"Error fetching knowledge version: {str(e) or type(e).__name__}")
+            return None
+
+    async def _fetch_tool(self, name: str) -> Dict:
+        response = await asyncio.wait_for(self.tool_client.get(f"/tools/{name}"), self.tool_timeout)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_tool(self, name: str) -> Optional[Dict]:
+        """获取工具定义（带缓存），失败或超时返回 None"""
+        try:
+            return await self.tool_cache.get(name, lambda: self._fetch_tool(name))
+        except (httpx.HTTPError, ValueError, asyncio.TimeoutError) as e:
+            self.failures += 1
+            logger.error(f"Error fetching tool {name}: {str(e) or type(e).__name__}")
+            return None
+
+    async def gather(self, query: str, tool_names: List[str]) -> Tuple[Optional[Dict], List[Dict]]:
+        """并发获取知识检索结果与工具定义，返回 (knowledge, tools)，tools 保持请求顺序"""
+        knowledge, *tools = await asyncio.gather(
+            self.search_knowledge(query),
+            *(self.get_tool(name) for name in tool_names)
+        )
+        return knowledge, [tool for tool in tools if tool is not None]
+
+    def get_stats(self) -> Dict:
+        return {"failures": self.failures, "tool_cache": self.tool_cache.get_stats()}
+
+    async def close(self) -> None:
+        await self.knowledge_client.aclose()
+        await self.tool_client.aclose()
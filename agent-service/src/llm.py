@@ -0,0 +1,89 @@
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List
+import asyncio
+import httpx
+import json
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class LLMBackend(ABC):
+    """LLM 后端：以异步生成器的形式逐块返回生成的文本"""
+
+    @abstractmethod
+    def stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        """messages 为 OpenAI 格式的对话消息列表"""
+        pass
+
+    async def close(self) -> None:
+        pass
+
+class EchoBackend(LLMBackend):
+    """确定性的本地替身，用于测试：逐词返回 "Echo: <最后一条用户消息>" """
+
+    def __init__(self, chunk_delay: float = 0):
+        self.chunk_delay = chunk_delay
+
+    async def stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        message = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        words = f"Echo: {message}".split(" ")
+        for index, word in enumerate(words):
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield word if index == len(words) - 1 else word + " "
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI 兼容的 Chat Completions 流式接口（SSE），使用长期存在的连接池"""
+
+    def __init__(self, api_base: str, api_key: str, model: str, timeout: float = 60, temperature: float = 0.7):
+        self.model = model
+        self.temperature = temperature
+        self.client = httpx.AsyncClient(
+            base_url=api_base,
+            # 本地部署的兼容服务通常不需要密钥
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else None,
+            timeout=httpx.Timeout(timeout, connect=5)
+        )
+
+    async def stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        payload = {"model": self.model, "messages": messages, "temperature": self.temperature, "stream": True}
+        async with self.client.stream("POST", "/chat/completions", json=payload) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                logger.error(f"LLM request failed with {response.status_code}: {response.text}")
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                content = choices[0].get("delta", {}).get("content") if choices else None
+                if content:
+                    yield content
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+class OpenAIEmbedder:
+    """OpenAI 兼容的 Embeddings 接口，返回 L2 归一化的向量，用于响应缓存的相似问题匹配"""
+
+    def __init__(self, api_base: str, api_key: str, model: str, timeout: float = 2):
+        self.model = model
+        self.client = httpx.AsyncClient(
+            base_url=api_base,
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else None,
+            timeout=httpx.Timeout(timeout, connect=timeout)
+        )
+
+    async def embed(self, text: str) -> np.ndarray:
+        response = await self.client.post("/embeddings", json={"model": self.model, "input": text})
+        response.raise_for_status()
+        vector = np.asarray(response.json()["data"][0]["embedding"], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def close(self) -> None:
+        await self.client.aclose()
@@ -1,10 +1,29 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from typing import Dict, List
+import asyncio
 import json
 import logging
+import time
+import uuid
 import httpx
+from .config import (
+    KNOWLEDGE_SERVICE_URL, TOOL_SERVICE_URL, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY, KNOWLEDGE_TIMEOUT, TOOL_TIMEOUT, TOOL_CACHE_TTL, TOOL_CACHE_MAX_ENTRIES,
+    LLM_BACKEND, OPENAI_API_BASE, OPENAI_API_KEY, LLM_MODEL, LLM_TEMPERATURE, LLM_TIMEOUT, ECHO_CHUNK_DELAY,
+    SESSION_TOKEN_BUDGET, SESSION_MAX_SESSIONS, SESSION_IDLE_TIMEOUT, SESSION_SPILL_DIR,
+    SESSION_SPILL_TTL, SESSION_SPILL_MAX_FILES,
+    MAX_IN_FLIGHT_PER_CONNECTION, SEND_QUEUE_SIZE, SLOW_CONSUMER_POLICY, BROADCAST_BACKPLANE, REDIS_URL,
+    BROADCAST_CHANNEL, SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_FIRST_TURN_ONLY, SEMANTIC_CACHE_EMBEDDING_MODEL, SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_EMBEDDING_TIMEOUT, KNOWLEDGE_VERSION_TTL
+)
+from .context import ContextGatherer
+from .llm import EchoBackend, OpenAIBackend, OpenAIEmbedder
 from .manager import AgentManager
-from .websocket import ConnectionManager
+from .scheduler import RequestScheduler
+from .semantic_cache import SemanticCache
+from .session import SessionStore
+from .websocket import ConnectionManager, LocalBackplane, RedisBackplane
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -12,71 +31,178 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Agent Service")
 
+# LLM 后端
+if LLM_BACKEND == "openai":
+    llm_backend = OpenAIBackend(OPENAI_API_BASE, OPENAI_API_KEY, LLM_MODEL, timeout=LLM_TIMEOUT, temperature=LLM_TEMPERATURE)
+elif LLM_BACKEND == "echo":
+    llm_backend = EchoBackend(chunk_delay=ECHO_CHUNK_DELAY)
+else:
+    raise ValueError(f"Unknown LLM backend: {LLM_BACKEND}")
+
+# 响应缓存相似问题匹配使用的嵌入模型（未配置时只做精确匹配）
+cache_embedder = OpenAIEmbedder(
+    OPENAI_API_BASE,
+    OPENAI_API_KEY,
+    SEMANTIC_CACHE_EMBEDDING_MODEL,
+    timeout=SEMANTIC_CACHE_EMBEDDING_TIMEOUT
+) if SEMANTIC_CACHE_ENABLED and SEMANTIC_CACHE_EMBEDDING_MODEL else None
+
+# 知识检索与工具获取共用长期存在的连接池
+context_gatherer = ContextGatherer(
+    KNOWLEDGE_SERVICE_URL,
+    TOOL_SERVICE_URL,
+    limits=httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    ),
+    knowledge_timeout=KNOWLEDGE_TIMEOUT,
+    tool_timeout=TOOL_TIMEOUT,
+    tool_cache_ttl=TOOL_CACHE_TTL,
+    tool_cache_max_entries=TOOL_CACHE_MAX_ENTRIES,
+    version_ttl=KNOWLEDGE_VERSION_TTL
+)
+# 会话记忆
+session_store = SessionStore(
+    token_budget=SESSION_TOKEN_BUDGET,
+    max_sessions=SESSION_MAX_SESSIONS,
+    idle_timeout=SESSION_IDLE_TIMEOUT,
+    spill_dir=SESSION_SPILL_DIR or None,
+    spill_ttl=SESSION_SPILL_TTL,
+    max_spilled=SESSION_SPILL_MAX_FILES
+)
 # 初始化管理器
-agent_manager = AgentManager()
-connection_manager = ConnectionManager()
+agent_manager = AgentManager(
+    llm_backend,
+    session_store,
+    context=context_gatherer,
+    cache=SemanticCache(
+        ttl=SEMANTIC_CACHE_TTL,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+        similarity_threshold=SEMANTIC_CACHE_THRESHOLD,
+        embed=cache_embedder.embed if cache_embedder is not None else None
+    ) if SEMANTIC_CACHE_ENABLED else None,
+    cache_first_turn_only=SEMANTIC_CACHE_FIRST_TURN_ONLY
+)
+connection_manager = ConnectionManager(
+    max_queue=SEND_QUEUE_SIZE,
+    slow_consumer_policy=SLOW_CONSUMER_POLICY,
+    backplane=RedisBackplane(REDIS_URL, BROADCAST_CHANNEL) if BROADCAST_BACKPLANE == "redis" else LocalBackplane()
+)
+
+@app.on_event("startup")
+async def startup():
+    await connection_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await connection_manager.close()
+    await context_gatherer.close()
+    await llm_backend.close()
+    if cache_embedder is not None:
+        await cache_embedder.close()
+    # 等待已淘汰会话写完磁盘
+    session_store.close()
+
+async def handle_message(client_id: str, request_id: str, message: Dict, started: float, scheduler: RequestScheduler):
+    """处理一条消息：获取上下文并流式生成响应，发出的每一帧都带 request_id"""
+    user_message = message.get("message")
+    try:
+        # 流式处理消息：逐块发送 delta，最后发送完整响应
+        chunks = []
+        async for chunk in agent_manager.stream_message(
+            client_id=client_id,
+            message=user_message,
+            agent=message.get("agent", "default"),
+            tool_names=message.get("tools", []),
+            started=started
+        ):
+            chunks.append(chunk)
+            await connection_manager.send_message(
+                client_id,
+                {"type": "delta", "request_id": request_id, "content": chunk}
+            )
+        
+        # 发送响应
+        await connection_manager.send_message(
+            client_id,
+            {"type": "response", "request_id": request_id, "content": "".join(chunks)}
+        )
+    except asyncio.CancelledError:
+        # 客户端取消或断开时不再发帧；其他原因（如服务关闭）的取消也要给请求一个结束帧
+        if not scheduler.cancelled_by_client(request_id):
+            await connection_manager.send_message(
+                client_id,
+                {"type": "error", "request_id": request_id, "content": "Error: request was cancelled"}
+            )
+        raise
+    except Exception as e:
+        logger.error(f"Error processing message {request_id}: {str(e)}")
+        await connection_manager.send_message(
+            client_id,
+            {"type": "error", "request_id": request_id, "content": f"Error: {str(e)}"}
+        )
 
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
+    """消息格式: {"type": "message", "request_id": ..., "message": ...} 或 {"type": "cancel", "request_id": ...}
+
+    多条消息并发处理，响应按 request_id 标记，可能乱序到达；未提供 request_id 时由服务端生成。
+    """
     await connection_manager.connect(websocket, client_id)
+    scheduler = RequestScheduler(MAX_IN_FLIGHT_PER_CONNECTION)
     try:
         while True:
             # 接收消息
             data = await websocket.receive_text()
-            message = json.loads(data)
-            
-            # 处理消息
-            target_agent = message.get("agent", "default")
-            user_message = message.get("message")
-            
-            if not user_message:
+            started = time.monotonic()
+            try:
+                message = json.loads(data)
+            except ValueError:
                 await connection_manager.send_message(
                     client_id,
-                    {"type": "error", "content": "Message cannot be empty"}
+                    {"type": "error", "content": "Message must be valid JSON"}
                 )
                 continue
+            request_id = str(message.get("request_id") or uuid.uuid4().hex)
             
-            # 获取知识库信息
-            async with httpx.AsyncClient() as client:
-                knowledge = await client.get(
-                    f"http://knowledge-service/knowledge/search",
-                    params={"query": user_message}
-                )
-            
-            # 获取工具
-            tools = []
-            if "tools" in message:
-                async with httpx.AsyncClient() as client:
-                    for tool_name in message["tools"]:
-                        tool = await client.get(
-                            f"http://tool-service/tools/{tool_name}"
-                        )
-                        tools.append(tool.json())
-            
-            # 处理消息
-            response = await agent_manager.process_message(
-                client_id=client_id,
-                message=user_message,
-                agent=target_agent,
-                knowledge=knowledge.json(),
-                tools=tools
-            )
+            # 取消在途请求
+            if message.get("type") == "cancel":
+                if scheduler.cancel(request_id):
+                    await connection_manager.send_message(client_id, {"type": "cancelled", "request_id": request_id})
+                else:
+                    await connection_manager.send_message(
+                        client_id,
+                        {"type": "error", "request_id": request_id, "content": "No such request in flight"}
+                    )
+                continue
             
-            # 发送响应
+            if not message.get("message"):
+                error = "Message cannot be empty"
+            elif request_id in scheduler:
+                error = "Duplicate request_id"
+            elif scheduler.full:
+                error = "Too many requests in flight"
+            else:
+                scheduler.submit(request_id, handle_message(client_id, request_id, message, started, scheduler))
+                continue
             await connection_manager.send_message(
                 client_id,
-                {"type": "response", "content": response}
+                {"type": "error", "request_id": request_id, "content": error}
             )
             
     except WebSocketDisconnect:
-        connection_manager.disconnect(client_id)
+        connection_manager.disconnect(client_id, websocket)
     except Exception as e:
         logger.error(f"Error processing message: {str(e)}")
         await connection_manager.send_message(
             client_id,
             {"type": "error", "content": f"Error: {str(e)}"}
         )
-        connection_manager.disconnect(client_id)
+        connection_manager.disconnect(client_id, websocket)
+    finally:
+        # 客户端已经离开，放弃的请求不再占用知识检索与 LLM 容量
+        await scheduler.cancel_all()
 
 @app.get("/agents")
 async def list_agents():
@@ -86,14 +212,34 @@ async def list_agents():
         "agents": agent_manager.list_agents()
     }
 
+@app.get("/agents/stats")
+async def agent_stats():
+    """上下文获取统计（工具缓存命中率、失败次数）、响应缓存命中率与首字延迟"""
+    return {
+        **context_gatherer.get_stats(),
+        **agent_manager.get_stats(),
+        "connections": connection_manager.get_stats()
+    }
+
+@app.post("/agents/broadcast")
+async def broadcast(message: Dict):
+    """广播消息给所有 agent-service 进程上的所有客户端"""
+    await connection_manager.broadcast({"type": "broadcast", "content": message})
+    return {"success": True}
+
 @app.post("/agents/{agent_name}/clear")
 async def clear_agent_memory(agent_name: str):
     """清空指定Agent的记忆"""
-    success = agent_manager.clear_agent_memory(agent_name)
+    success = await agent_manager.clear_agent_memory(agent_name)
     if not success:
         return {"success": False, "error": "Agent not found"}
     return {"success": True}
 
+@app.get("/health")
+async def health_check():
+    """健康检查端点"""
+    return {"status": "healthy"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8003) 
\ No newline at end of file
@@ -1,19 +1,47 @@
-from typing import Dict, List, Optional
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
 import logging
+import time
 from .agent import BaseAgent, ChatAgent
+from .context import ContextGatherer
+from .llm import LLMBackend
+from .semantic_cache import SemanticCache
+from .session import SessionStore
 
 logger = logging.getLogger(__name__)
 
 class AgentManager:
-    def __init__(self):
+    # 计算首字延迟分位数时保留的最近样本数
+    TTFT_WINDOW = 1000
+
+    def __init__(
+        self,
+        backend: Optional[LLMBackend] = None,
+        sessions: Optional[SessionStore] = None,
+        context: Optional[ContextGatherer] = None,
+        cache: Optional[SemanticCache] = None,
+        cache_first_turn_only: bool = True
+    ):
         self.agents: Dict[str, BaseAgent] = {}
+        self.backend = backend
+        # 每个 client_id 独立的对话历史
+        self.sessions = sessions or SessionStore()
+        # 知识检索与工具获取；为 None 时不附带上下文
+        self.context = context
+        # 可选的响应缓存；默认只用于没有历史的首轮消息，避免依赖上下文的回答被复用
+        self.cache = cache
+        self.cache_first_turn_only = cache_first_turn_only
+        # 首字延迟（毫秒）：从收到消息到发出第一个响应分块
+        self.ttft_ms = deque(maxlen=self.TTFT_WINDOW)
+        self.streams = 0
         self._initialize_default_agents()
     
     def _initialize_default_agents(self):
         """初始化默认的Agent"""
         chat_agent = ChatAgent(
             name="default",
-            description="A general-purpose chat agent"
+            description="A general-purpose chat agent",
+            backend=self.backend
         )
         self.register_agent(chat_agent)
     
@@ -36,11 +64,12 @@ class AgentManager:
             for agent in self.agents.values()
         ]
     
-    def clear_agent_memory(self, name: str) -> bool:
-        """清空指定Agent的记忆"""
+    async def clear_agent_memory(self, name: str) -> bool:
+        """清空指定Agent的记忆以及所有会话的对话历史"""
         agent = self.get_agent(name)
         if agent:
             agent.clear_memory()
+            await self.sessions.clear()
             return True
         return False
     
@@ -49,21 +78,90 @@ class AgentManager:
         client_id: str,
         message: str,
         agent: str = "default",
-        knowledge: Optional[Dict] = None,
-        tools: Optional[List[Dict]] = None
+        tool_names: Optional[List[str]] = None
     ) -> str:
         """处理消息"""
-        target_agent = self.get_agent(agent)
-        if not target_agent:
-            return f"Agent {agent} not found"
-        
         try:
-            response = await target_agent.process_message(
-                message=message,
-                knowledge=knowledge,
-                tools=tools
-            )
-            return response
+            return "".join([chunk async for chunk in self.stream_message(client_id, message, agent, tool_names)])
         except Exception as e:
             logger.error(f"Error processing message: {str(e)}")
-            return f"Error: {str(e)}" 
\ No newline at end of file
+            return f"Error: {str(e)}"
+    
+    async def stream_message(
+        self,
+        client_id: str,
+        message: str,
+        agent: str = "default",
+        tool_names: Optional[List[str]] = None,
+        started: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """流式处理消息，逐块返回响应；started 为收到消息的时间（time.monotonic()），用于统计首字延迟
+
+        缓存命中时跳过知识检索与 LLM，直接返回缓存的完整响应。
+        """
+        started = started if started is not None else time.monotonic()
+        target_agent = self.get_agent(agent)
+        if not target_agent:
+            yield f"Agent {agent} not found"
+            return
+        
+        self.streams += 1
+        history = list((await self.sessions.get(client_id)).history)
+        scope, vector = None, None
+        if self.cache is not None and not (history and self.cache_first_turn_only):
+            version = await self.context.knowledge_version() if self.context is not None else ""
+            # 知识库版本未知时不读也不写缓存
+            if version is not None:
+                scope = SemanticCache.scope(agent, version, tool_names)
+                cached, vector = await self.cache.get(scope, message)
+                if cached is not None:
+                    self._record_ttft(started)
+                    yield cached
+                    await self._remember(client_id, message, cached)
+                    return
+        
+        # 并发获取知识库信息与工具
+        knowledge, tools = None, []
+        if self.context is not None:
+            knowledge, tools = await self.context.gather(message, tool_names or [])
+        
+        first = True
+        chunks = []
+        async for chunk in target_agent.stream_message(message=message, knowledge=knowledge, tools=tools, history=history):
+            if first:
+                self._record_ttft(started)
+                first = False
+            chunks.append(chunk)
+            yield chunk
+        # 只有完整生成的回合才写入会话与缓存
+        response = "".join(chunks)
+        await self._remember(client_id, message, response)
+        if scope is not None:
+            self.cache.put(scope, message, response, (time.monotonic() - started) * 1000, vector)
+    
+    def _record_ttft(self, started: float) -> None:
+        self.ttft_ms.append((time.monotonic() - started) * 1000)
+    
+    async def _remember(self, client_id: str, message: str, response: str) -> None:
+        await self.sessions.append(client_id, "user", message)
+        await self.sessions.append(client_id, "assistant", response)
+    
+    def get_stats(self) -> Dict:
+        """首字延迟统计（最近 TTFT_WINDOW 条消息）、会话存储与响应缓存统计"""
+        stats = {
+            "streams": self.streams,
+            "sessions": self.sessions.get_stats(),
+            "response_cache": self.cache.get_stats() if self.cache is not None else None
+        }
+        samples = sorted(self.ttft_ms)
+        if not samples:
+            return {**stats, "ttft_ms": None}
+        return {
+            **stats,
+            "ttft_ms": {
+                "avg": round(sum(samples) / len(samples), 2),
+                "p50": round(samples[len(samples) // 2], 2),
+                "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+                "max": round(samples[-1], 2)
+            }
+        }
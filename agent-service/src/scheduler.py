@@ -0,0 +1,58 @@
+from typing import Awaitable, Dict, Set
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class RequestScheduler:
+    """单个 WebSocket 连接上的请求调度
+
+    每条消息在独立的任务中处理，慢请求不会阻塞后续消息；在途请求数不超过 max_in_flight，
+    可以按请求 ID 取消，连接断开时取消全部在途请求以释放下游容量。
+    """
+
+    def __init__(self, max_in_flight: int = 4):
+        self.max_in_flight = max_in_flight
+        # 任务完成（包括取消后真正结束）才从 tasks 移除并释放名额
+        self.tasks: Dict[str, asyncio.Task] = {}
+        # 由客户端取消或因断开而取消的请求
+        self.cancelling: Set[str] = set()
+
+    @property
+    def full(self) -> bool:
+        return len(self.tasks) >= self.max_in_flight
+
+    def __contains__(self, request_id: str) -> bool:
+        return request_id in self.tasks
+
+    def submit(self, request_id: str, work: Awaitable) -> None:
+        """在后台任务中执行 work，完成或取消后自动移除；调用方应先检查 full 与重复 ID"""
+        task = asyncio.ensure_future(work)
+        self.tasks[request_id] = task
+        task.add_done_callback(lambda done: self._finished(request_id, done))
+
+    def _finished(self, request_id: str, task: asyncio.Task) -> None:
+        if self.tasks.get(request_id) is task:
+            del self.tasks[request_id]
+            self.cancelling.discard(request_id)
+
+    def cancelled_by_client(self, request_id: str) -> bool:
+        return request_id in self.cancelling
+
+    def cancel(self, request_id: str) -> bool:
+        """取消在途请求，请求不存在、已完成或已在取消中时返回 False"""
+        task = self.tasks.get(request_id)
+        if task is None or request_id in self.cancelling:
+            return False
+        self.cancelling.add(request_id)
+        task.cancel()
+        return True
+
+    async def cancel_all(self) -> None:
+        tasks = list(self.tasks.values())
+        self.cancelling.update(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if tasks:
+            logger.info(f"Cancelled {len(tasks)} in-flight request(s)")
@@ -0,0 +1,176 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import hashlib
+import logging
+import re
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+def normalize(text: str) -> str:
+    """精确匹配前的规范化：小写、去掉标点并合并空白"""
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+class CacheEntry:
+    __slots__ = ("scope", "response", "vector", "expires_at", "cost_ms")
+
+    def __init__(self, scope: str, response: str, vector: Optional[np.ndarray], expires_at: float, cost_ms: float):
+        self.scope = scope
+        self.response = response
+        self.vector = vector
+        self.expires_at = expires_at
+        self.cost_ms = cost_ms
+
+class ScopeIndex:
+    """一个作用域内条目向量的矩阵，容量成倍增长，增删都只改动一行"""
+
+    def __init__(self, dimension: int, initial_capacity: int = 16):
+        self.keys: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.matrix = np.empty((initial_capacity, dimension), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str, vector: np.ndarray) -> None:
+        if len(self.keys) == self.matrix.shape[0]:
+            matrix = np.empty((self.matrix.shape[0] * 2, self.matrix.shape[1]), dtype=np.float32)
+            matrix[:len(self.keys)] = self.matrix
+            self.matrix = matrix
+        self.rows[key] = len(self.keys)
+        self.matrix[len(self.keys)] = vector
+        self.keys.append(key)
+
+    def remove(self, key: str) -> None:
+        """把最后一行移到被删除的位置"""
+        row = self.rows.pop(key)
+        last = self.keys.pop()
+        if last != key:
+            self.keys[row] = last
+            self.rows[last] = row
+            self.matrix[row] = self.matrix[len(self.keys)]
+
+    def nearest(self, vector: np.ndarray) -> Tuple[str, float]:
+        similarities = self.matrix[:len(self.keys)] @ vector
+        best = int(np.argmax(similarities))
+        return self.keys[best], float(similarities[best])
+
+class SemanticCache:
+    """Agent 响应缓存
+
+    第一层按 (作用域, 规范化消息) 的哈希精确匹配。提供 embed（异步的语义嵌入模型，返回 L2 归一化向量）时
+    启用第二层：在同一作用域内按余弦相似度查找最相近的问题，相似度不低于 similarity_threshold 时命中；
+    字符层面的相似不代表语义相同（"100" 与 "1000" 只差一个字符），因此没有嵌入模型时只做精确匹配，
+    嵌入调用失败时本次查找也退回精确匹配。
+    作用域由 agent、请求的工具与知识库版本组成，知识库写入后旧条目不再命中。
+    条目带 TTL，总数超过 max_entries 时按 LRU 淘汰。
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600,
+        max_entries: int = 10000,
+        similarity_threshold: float = 0.92,
+        embed: Optional[Callable[[str], Awaitable[np.ndarray]]] = None
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # 每个作用域的向量矩阵（仅在启用语义匹配时维护）
+        self._scopes: Dict[str, ScopeIndex] = {}
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.embed_errors = 0
+        self.saved_ms = 0.0
+
+    @staticmethod
+    def scope(agent: str, kb_version: str, tools: Optional[List[str]] = None) -> str:
+        return "\0".join([agent, kb_version, *sorted(tools or [])])
+
+    @staticmethod
+    def _key(scope: str, message: str) -> str:
+        return hashlib.sha256(f"{scope}\0{normalize(message)}".encode()).hexdigest()
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        index = self._scopes.get(entry.scope)
+        if index is not None and key in index.rows:
+            index.remove(key)
+            if not len(index):
+                del self._scopes[entry.scope]
+
+    def _hit(self, key: str, entry: CacheEntry) -> str:
+        self._entries.move_to_end(key)
+        self.saved_ms += entry.cost_ms
+        return entry.response
+
+    async def _embed(self, message: str) -> Optional[np.ndarray]:
+        try:
+            return np.asarray(await self.embed(message), dtype=np.float32)
+        except Exception as e:
+            self.embed_errors += 1
+            logger.warning(f"Embedding for response cache failed, using exact match only: {str(e)}")
+            return None
+
+    async def get(self, scope: str, message: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """查找缓存的响应，返回 (响应, 消息向量)；未命中时响应为 None，向量交给 put 复用，不必再算一次嵌入"""
+        now = time.monotonic()
+        key = self._key(scope, message)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                self.exact_hits += 1
+                return self._hit(key, entry), None
+            self._remove(key)
+
+        vector = await self._embed(message) if self.embed is not None else None
+        # 计算嵌入期间其他请求可能改动了索引，重新取
+        index = self._scopes.get(scope)
+        if vector is not None and index is not None:
+            nearest, similarity = index.nearest(vector)
+            if similarity >= self.similarity_threshold:
+                entry = self._entries[nearest]
+                if entry.expires_at > now:
+                    self.semantic_hits += 1
+                    return self._hit(nearest, entry), vector
+                self._remove(nearest)
+
+        self.misses += 1
+        return None, vector
+
+    def put(self, scope: str, message: str, response: str, cost_ms: float, vector: Optional[np.ndarray] = None) -> None:
+        """写入一条响应；cost_ms 为生成它所花的时间，命中时计入节省的延迟；vector 为 get 返回的消息向量"""
+        key = self._key(scope, message)
+        if key in self._entries:
+            self._remove(key)
+        if vector is not None:
+            if scope not in self._scopes:
+                self._scopes[scope] = ScopeIndex(vector.shape[0])
+            self._scopes[scope].add(key, vector)
+        self._entries[key] = CacheEntry(scope, response, vector, time.monotonic() + self.ttl, cost_ms)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._scopes.clear()
+
+    def get_stats(self) -> Dict:
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "semantic": self.embed is not None,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "embed_errors": self.embed_errors,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "saved_ms": round(self.saved_ms, 2)
+        }
@@ -0,0 +1,251 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# 落盘会话目录的清理间隔（秒）
+SPILL_PRUNE_INTERVAL = 600
+TRUNCATION_MARKER = "…"
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数（约 4 个字符一个 token，另加每条消息的格式开销）"""
+    return len(text) // 4 + 4
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """截断文本使其估算 token 数不超过 tokens，保留开头部分"""
+    chars = max(0, tokens - 4) * 4
+    if len(text) <= chars:
+        return text
+    return text[:max(0, chars - len(TRUNCATION_MARKER))] + TRUNCATION_MARKER
+
+class Session:
+    """一个客户端的对话历史，按 token 预算保留最近的消息"""
+
+    __slots__ = ("client_id", "history", "tokens", "last_active")
+
+    def __init__(self, client_id: str, history: Optional[List[Dict]] = None):
+        self.client_id = client_id
+        self.history: List[Dict] = history or []
+        self.tokens = sum(estimate_tokens(message["content"]) for message in self.history)
+        self.last_active = time.monotonic()
+
+    def append(self, role: str, content: str, token_budget: int) -> None:
+        """追加一条消息，超出预算时从最早的一轮开始整轮丢弃
+
+        一轮从一条 user 消息开始，到下一条 user 消息之前结束，历史不会以孤立的 assistant 消息开头；
+        最新一轮本身超出预算时不丢弃，而是截断其中最长的消息。
+        """
+        self.history.append({"role": role, "content": content})
+        self.tokens += estimate_tokens(content)
+        if self.tokens <= token_budget:
+            return
+        latest = max((i for i, message in enumerate(self.history) if message["role"] == "user"), default=0)
+        dropped = 0
+        while self.tokens > token_budget and dropped < latest:
+            self.tokens -= estimate_tokens(self.history[dropped]["content"])
+            dropped += 1
+            # 继续丢弃到下一轮的开头
+            while dropped < latest and self.history[dropped]["role"] != "user":
+                self.tokens -= estimate_tokens(self.history[dropped]["content"])
+                dropped += 1
+        if dropped:
+            del self.history[:dropped]
+        if self.tokens <= token_budget:
+            return
+        # 最新一轮仍超出预算：求一个上限使各消息截断到不超过它后总量恰好在预算内，只截断超过上限的消息
+        sizes = sorted(estimate_tokens(message["content"]) for message in self.history)
+        remaining = token_budget
+        cap = sizes[-1]
+        for i, size in enumerate(sizes):
+            share = remaining // (len(sizes) - i)
+            if size > share:
+                cap = share
+                break
+            remaining -= size
+        for message in self.history:
+            message["content"] = truncate_to_tokens(message["content"], cap)
+        self.tokens = sum(estimate_tokens(message["content"]) for message in self.history)
+
+class SessionStore:
+    """按 client_id 隔离的会话存储
+
+    内存中最多保留 max_sessions 个会话，按 LRU 淘汰，空闲超过 idle_timeout 秒的会话也会被淘汰；
+    配置了 spill_dir 时被淘汰的会话写到磁盘，客户端再次出现时恢复。落盘超过 spill_ttl 秒的会话过期，
+    文件数超过 max_spilled 时删除最旧的文件。
+    落盘、恢复与清理都在一个专用线程中按提交顺序执行，不阻塞事件循环；淘汰时只提交写入，不等待完成。
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 3000,
+        max_sessions: int = 10000,
+        idle_timeout: float = 1800,
+        spill_dir: Optional[str] = None,
+        spill_ttl: float = 7 * 24 * 3600,
+        max_spilled: int = 100000
+    ):
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.spill_dir = spill_dir
+        self.spill_ttl = spill_ttl
+        self.max_spilled = max_spilled
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.evicted = 0
+        self.spilled = 0
+        self.restored = 0
+        self.expired = 0
+        # 以下两项只在 I/O 线程中读写
+        self._spilled_files = 0
+        self._next_prune = 0.0
+        self._io: Optional[ThreadPoolExecutor] = None
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            # 单线程保证同一客户端的写入先于之后的恢复执行
+            self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-spill")
+            self._io.submit(self._prune_spilled)
+
+    def _spill_path(self, client_id: str) -> str:
+        # client_id 来自 URL，取摘要作为文件名
+        return os.path.join(self.spill_dir, hashlib.sha1(client_id.encode()).hexdigest() + ".json")
+
+    def _prune_spilled(self) -> None:
+        """删除过期的落盘会话，文件数仍超过上限时从最旧的开始删除（在 I/O 线程中执行）"""
+        self._next_prune = time.monotonic() + SPILL_PRUNE_INTERVAL
+        try:
+            files = []
+            for entry in os.scandir(self.spill_dir):
+                if entry.name.endswith(".json"):
+                    files.append((entry.stat().st_mtime, entry.path))
+        except OSError as e:
+            logger.error(f"Error scanning session spill directory: {str(e)}")
+            return
+        files.sort()
+        deadline = time.time() - self.spill_ttl
+        excess = len(files) - self.max_spilled
+        removed = 0
+        for mtime, path in files:
+            if mtime >= deadline and removed >= excess:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Error removing spilled session {path}: {str(e)}")
+                continue
+            removed += 1
+        self.expired += removed
+        self._spilled_files = len(files) - removed
+        if removed:
+            logger.info(f"Removed {removed} expired spilled session(s)")
+
+    def _write_spilled(self, client_id: str, history: List[Dict]) -> None:
+        """把会话写到磁盘（在 I/O 线程中执行）"""
+        try:
+            with open(self._spill_path(client_id), "w", encoding="utf-8") as f:
+                json.dump({"client_id": client_id, "history": history}, f, ensure_ascii=False)
+            self.spilled += 1
+            self._spilled_files += 1
+        except OSError as e:
+            logger.error(f"Error spilling session {client_id}: {str(e)}")
+            return
+        if self._spilled_files > self.max_spilled or time.monotonic() >= self._next_prune:
+            self._prune_spilled()
+
+    def _read_spilled(self, client_id: str) -> Optional[List[Dict]]:
+        """读出并删除落盘的会话，不存在或已过期时返回 None（在 I/O 线程中执行）"""
+        path = self._spill_path(client_id)
+        try:
+            expired = os.path.getmtime(path) < time.time() - self.spill_ttl
+            with open(path, encoding="utf-8") as f:
+                data = None if expired else json.load(f)
+            os.remove(path)
+            self._spilled_files -= 1
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Error restoring session {client_id}: {str(e)}")
+            return None
+        if data is None:
+            self.expired += 1
+            return None
+        self.restored += 1
+        return data.get("history")
+
+    def _remove_spilled(self) -> None:
+        """删除全部落盘的会话（在 I/O 线程中执行）"""
+        for name in os.listdir(self.spill_dir):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.spill_dir, name))
+        self._spilled_files = 0
+
+    def _evict(self, session: Session) -> None:
+        self.evicted += 1
+        if self._io is not None and session.history:
+            self._io.submit(self._write_spilled, session.client_id, session.history)
+
+    async def _restore(self, client_id: str) -> Optional[Session]:
+        if self._io is None:
+            return None
+        history = await asyncio.get_running_loop().run_in_executor(self._io, self._read_spilled, client_id)
+        return Session(client_id, history) if history is not None else None
+
+    def evict_idle(self) -> None:
+        """淘汰空闲超时的会话；字典按最近使用排序，从最久未用的开始检查"""
+        deadline = time.monotonic() - self.idle_timeout
+        while self._sessions:
+            client_id, session = next(iter(self._sessions.items()))
+            if session.last_active > deadline:
+                break
+            del self._sessions[client_id]
+            self._evict(session)
+
+    async def get(self, client_id: str) -> Session:
+        """取得（必要时从磁盘恢复或新建）客户端的会话并标记为最近使用"""
+        self.evict_idle()
+        session = self._sessions.get(client_id)
+        if session is None:
+            restored = await self._restore(client_id)
+            # 恢复期间同一客户端的其他请求可能已经建立了会话
+            session = self._sessions.get(client_id) or restored or Session(client_id)
+            self._sessions[client_id] = session
+            while len(self._sessions) > self.max_sessions:
+                _, evicted = self._sessions.popitem(last=False)
+                self._evict(evicted)
+        else:
+            self._sessions.move_to_end(client_id)
+        session.last_active = time.monotonic()
+        return session
+
+    async def append(self, client_id: str, role: str, content: str) -> None:
+        (await self.get(client_id)).append(role, content, self.token_budget)
+
+    async def clear(self) -> None:
+        """清空全部会话（包括已写到磁盘的会话）"""
+        self._sessions.clear()
+        if self._io is not None:
+            await asyncio.get_running_loop().run_in_executor(self._io, self._remove_spilled)
+
+    def close(self) -> None:
+        """等待已提交的落盘写入完成"""
+        if self._io is not None:
+            self._io.shutdown(wait=True)
+
+    def get_stats(self) -> Dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "token_budget": self.token_budget,
+            "evicted": self.evicted,
+            "spilled": self.spilled,
+            "restored": self.restored,
+            "expired": self.expired
+        }
@@ -1,35 +1,228 @@
+from abc import ABC, abstractmethod
+from collections import deque
 from fastapi import WebSocket
-from typing import Dict
+from typing import Callable, Deque, Dict, Optional
+import asyncio
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
-class ConnectionManager:
+class Backplane(ABC):
+    """广播背板：每个 agent-service 进程订阅同一频道，发布的消息会送达所有进程（包括自己）"""
+
+    @abstractmethod
+    async def start(self, deliver: Callable[[str], None]) -> None:
+        """开始接收广播，收到的消息交给 deliver 投递给本进程的连接"""
+        pass
+
+    @abstractmethod
+    async def publish(self, payload: str) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+class LocalBackplane(Backplane):
+    """单进程替身：发布的消息直接投递给本进程"""
+
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-    
+        self._deliver: Optional[Callable[[str], None]] = None
+
+    async def start(self, deliver: Callable[[str], None]) -> None:
+        self._deliver = deliver
+
+    async def publish(self, payload: str) -> None:
+        if self._deliver is not None:
+            self._deliver(payload)
+
+class RedisBackplane(Backplane):
+    """通过 Redis pub/sub 在多个进程之间广播"""
+
+    def __init__(self, url: str, channel: str):
+        # 只有使用 Redis 背板时才需要安装 redis
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.channel = channel
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Callable[[str], None]) -> None:
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(self.channel)
+
+        async def listen() -> None:
+            while True:
+                try:
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            deliver(message["data"].decode())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error receiving broadcasts: {str(e)}")
+                    await asyncio.sleep(1)
+                    try:
+                        await pubsub.subscribe(self.channel)
+                    except Exception:
+                        pass
+
+        self._task = asyncio.ensure_future(listen())
+
+    async def publish(self, payload: str) -> None:
+        await self.client.publish(self.channel, payload)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        await self.client.close()
+
+class Connection:
+    """一个客户端连接：消息先进入有界发送队列，再由独立的写任务按顺序发送
+
+    点对点消息（本连接请求的响应）与广播分别排队：广播积压只会丢弃或断开广播，
+    不会挤掉客户端自己请求的响应帧；写任务优先发送点对点消息。
+    """
+
+    def __init__(self, websocket: WebSocket, client_id: str, max_queue: int):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.max_queue = max_queue
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.broadcasts: Deque[str] = deque()
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.dropped = 0
+        self.writer = asyncio.ensure_future(self._write())
+
+    async def _write(self) -> None:
+        try:
+            while True:
+                if not self.queue.empty():
+                    payload = self.queue.get_nowait()
+                elif self.broadcasts:
+                    payload = self.broadcasts.popleft()
+                else:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                await self.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending message to client {self.client_id}: {str(e)}")
+            self._shutdown()
+
+    def _shutdown(self) -> None:
+        self.closed = True
+        self.broadcasts.clear()
+        # 清空队列，唤醒在 send 中等待空位的协程
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    async def send(self, payload: str) -> None:
+        """点对点消息：队列满时等待，背压传给产生消息的请求"""
+        if not self.closed:
+            await self.queue.put(payload)
+            self._ready.set()
+
+    def offer(self, payload: str, drop_oldest: bool) -> bool:
+        """广播消息：从不等待；广播队列满时丢弃最旧的广播，或返回 False 由调用方断开连接"""
+        if self.closed:
+            return True
+        if len(self.broadcasts) >= self.max_queue:
+            if not drop_oldest:
+                return False
+            self.broadcasts.popleft()
+            self.dropped += 1
+        self.broadcasts.append(payload)
+        self._ready.set()
+        return True
+
+    def close(self) -> None:
+        self.writer.cancel()
+        self._shutdown()
+
+class ConnectionManager:
+    """管理本进程的 WebSocket 连接
+
+    每个连接有独立的有界发送队列和写任务，慢客户端只影响自己。广播消息只序列化一次，
+    经背板送达所有进程后放入各连接的广播队列；广播队列已满的慢消费者按 slow_consumer_policy
+    丢弃最旧的广播（drop_oldest）或被断开（disconnect），点对点消息不受影响。
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 256,
+        slow_consumer_policy: str = "drop_oldest",
+        backplane: Optional[Backplane] = None
+    ):
+        if slow_consumer_policy not in ("drop_oldest", "disconnect"):
+            raise ValueError(f"Unknown slow consumer policy: {slow_consumer_policy}")
+        self.active_connections: Dict[str, Connection] = {}
+        self.max_queue = max_queue
+        self.drop_oldest = slow_consumer_policy == "drop_oldest"
+        self.backplane = backplane or LocalBackplane()
+        self.broadcasts = 0
+        self.slow_disconnects = 0
+
+    async def start(self):
+        """开始接收背板上的广播"""
+        await self.backplane.start(self._fanout)
+
+    async def close(self):
+        await self.backplane.close()
+        for client_id in list(self.active_connections.keys()):
+            self.disconnect(client_id)
+
     async def connect(self, websocket: WebSocket, client_id: str):
         """建立WebSocket连接"""
         await websocket.accept()
-        self.active_connections[client_id] = websocket
+        previous = self.active_connections.get(client_id)
+        if previous is not None:
+            previous.close()
+        self.active_connections[client_id] = Connection(websocket, client_id, self.max_queue)
         logger.info(f"Client {client_id} connected")
-    
-    def disconnect(self, client_id: str):
-        """断开WebSocket连接"""
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
-            logger.info(f"Client {client_id} disconnected")
-    
+
+    def disconnect(self, client_id: str, websocket: Optional[WebSocket] = None):
+        """断开WebSocket连接；指定 websocket 时只在它仍是该客户端的当前连接时移除"""
+        connection = self.active_connections.get(client_id)
+        if connection is None or (websocket is not None and connection.websocket is not websocket):
+            return
+        del self.active_connections[client_id]
+        connection.close()
+        logger.info(f"Client {client_id} disconnected")
+
     async def send_message(self, client_id: str, message: dict):
         """发送消息给指定的客户端"""
-        if client_id in self.active_connections:
-            try:
-                await self.active_connections[client_id].send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending message to client {client_id}: {str(e)}")
-                self.disconnect(client_id)
-    
+        connection = self.active_connections.get(client_id)
+        if connection is not None:
+            await connection.send(json.dumps(message, ensure_ascii=False))
+
     async def broadcast(self, message: dict):
-        """广播消息给所有客户端"""
-        for client_id in list(self.active_connections.keys()):
-            await self.send_message(client_id, message) 
\ No newline at end of file
+        """广播消息给所有进程上的所有客户端，消息只序列化一次"""
+        self.broadcasts += 1
+        await self.backplane.publish(json.dumps(message, ensure_ascii=False))
+
+    def _fanout(self, payload: str):
+        """把一条广播放入本进程每个连接的发送队列，不等待任何客户端"""
+        for client_id, connection in list(self.active_connections.items()):
+            if not connection.offer(payload, self.drop_oldest):
+                self.slow_disconnects += 1
+                logger.warning(f"Disconnecting slow consumer {client_id}")
+                self.disconnect(client_id)
+                asyncio.ensure_future(self._close_slow(connection.websocket))
+
+    @staticmethod
+    async def _close_slow(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def get_stats(self) -> Dict:
+        return {
+            "connections": len(self.active_connections),
+            "broadcasts": self.broadcasts,
+            "slow_disconnects": self.slow_disconnects,
+            "dropped": sum(connection.dropped for connection in self.active_connections.values())
+        }
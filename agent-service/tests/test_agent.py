@@ -0,0 +1,39 @@
+from src.agent import ChatAgent
+
+
+def test_build_messages_uses_knowledge_document_content():
+    # knowledge-service /knowledge/search 的真实返回结构
+    knowledge = {
+        "success": True,
+        "results": [
+            {
+                "document": {
+                    "id": "doc-1",
+                    "content": "Refunds are accepted within 30 days.",
+                    "metadata": {"source": "faq"},
+                    "created_at": "2024-01-01T00:00:00"
+                },
+                "similarity": 0.87
+            },
+            {"similarity": 0.5},
+            {"document": {"id": "doc-2", "metadata": {}}, "similarity": 0.4},
+            "not a result"
+        ]
+    }
+    agent = ChatAgent("default", "a helpful assistant")
+
+    system = agent._build_messages("refund?", knowledge, None, None)[0]["content"]
+
+    assert "- Refunds are accepted within 30 days." in system
+    assert "doc-1" not in system
+    assert "similarity" not in system
+    assert "source" not in system
+
+
+def test_build_messages_without_knowledge_has_no_knowledge_section():
+    agent = ChatAgent("default", "a helpful assistant")
+
+    messages = agent._build_messages("hi", {"results": []}, None, [{"role": "user", "content": "earlier"}])
+
+    assert "Relevant knowledge" not in messages[0]["content"]
+    assert messages[1:] == [{"role": "user", "content": "earlier"}, {"role": "user", "content": "hi"}]
@@ -0,0 +1,100 @@
+import asyncio
+
+import src.main as main
+from src.scheduler import RequestScheduler
+
+
+def test_slot_is_held_until_cancelled_work_finishes():
+    async def scenario():
+        scheduler = RequestScheduler(max_in_flight=1)
+        frames = []
+        cleanup = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                # 取消后仍有收尾工作（发送结束帧等），完成前名额不能释放
+                await cleanup.wait()
+                frames.append("final")
+                raise
+
+        scheduler.submit("r1", work())
+        await asyncio.sleep(0)
+        assert scheduler.cancel("r1")
+        assert not scheduler.cancel("r1")
+        await asyncio.sleep(0)
+        assert scheduler.full and "r1" in scheduler
+
+        cleanup.set()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        assert frames == ["final"]
+        assert not scheduler.full and "r1" not in scheduler
+        assert not scheduler.cancelled_by_client("r1")
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_request_sends_final_frame(monkeypatch):
+    async def scenario():
+        frames = []
+        streaming = asyncio.Event()
+
+        async def stream_message(**kwargs):
+            yield "partial"
+            streaming.set()
+            await asyncio.sleep(3600)
+
+        async def send_message(client_id, frame):
+            frames.append(frame)
+
+        monkeypatch.setattr(main.agent_manager, "stream_message", stream_message)
+        monkeypatch.setattr(main.connection_manager, "send_message", send_message)
+
+        # 非客户端发起的取消（如服务关闭）：请求仍以一个 error 帧结束，并释放名额
+        scheduler = RequestScheduler(max_in_flight=1)
+        scheduler.submit("r1", main.handle_message("c1", "r1", {"message": "hi"}, 0.0, scheduler))
+        await streaming.wait()
+        task = scheduler.tasks["r1"]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert [frame["type"] for frame in frames] == ["delta", "error"]
+        assert frames[-1]["request_id"] == "r1"
+        assert not scheduler.full
+
+        # 客户端取消：由 websocket 端点回复 cancelled 帧，这里不再重复发帧
+        frames.clear()
+        streaming.clear()
+        scheduler.submit("r2", main.handle_message("c1", "r2", {"message": "hi"}, 0.0, scheduler))
+        await streaming.wait()
+        task = scheduler.tasks["r2"]
+        assert scheduler.cancel("r2")
+        await asyncio.gather(task, return_exceptions=True)
+        assert [frame["type"] for frame in frames] == ["delta"]
+        assert not scheduler.full
+
+    asyncio.run(scenario())
+
+
+def test_client_cancel_replies_cancelled_and_frees_slot(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    async def stream_message(message, **kwargs):
+        if message == "slow":
+            await asyncio.sleep(3600)
+        yield f"Echo: {message}"
+
+    monkeypatch.setattr(main.agent_manager, "stream_message", stream_message)
+    monkeypatch.setattr(main, "MAX_IN_FLIGHT_PER_CONNECTION", 1)
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/ws/c1") as websocket:
+            websocket.send_json({"type": "message", "request_id": "r1", "message": "slow"})
+            websocket.send_json({"type": "cancel", "request_id": "r1"})
+            assert websocket.receive_json() == {"type": "cancelled", "request_id": "r1"}
+            # 唯一的名额已释放，下一条消息可以被处理
+            websocket.send_json({"type": "message", "request_id": "r2", "message": "next"})
+            frames = [websocket.receive_json(), websocket.receive_json()]
+            assert [frame["type"] for frame in frames] == ["delta", "response"]
+            assert all(frame["request_id"] == "r2" for frame in frames)
@@ -1,10 +1,17 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import BackgroundTasks, FastAPI, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
+from jose import JWTError, jwk, jwt
+from jose.utils import base64url_encode
 from datetime import datetime, timedelta
 from typing import Optional
 from pydantic import BaseModel
+from dotenv import load_dotenv
+import hashlib
+import httpx
+import json
 import logging
+import os
+from .passwords import HasherBusy, PasswordHasher
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -13,9 +20,51 @@ logger = logging.getLogger(__name__)
 app = FastAPI(title="Auth Service")
 
 # 配置
-SECRET_KEY = "your-secret-key"  # 在生产环境中应该使用环境变量
-ALGORITHM = "HS256"
+load_dotenv()
+SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key")  # 在生产环境中应该使用环境变量
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# 非对称算法（RS256 / ES256 等）时使用私钥签名，公钥以 JWKS 发布，网关据此本地验证令牌
+PRIVATE_KEY_PATH = os.getenv("JWT_PRIVATE_KEY_PATH", "")
+
+def _load_signing_keys():
+    """返回 (签名密钥, 验证密钥, 公钥 JWK)；对称算法时没有 JWK"""
+    if ALGORITHM.startswith("HS"):
+        return SECRET_KEY, SECRET_KEY, None
+    with open(PRIVATE_KEY_PATH) as f:
+        private_pem = f.read()
+    public_key = jwk.construct(private_pem, ALGORITHM).public_key()
+    public_jwk = {k: v.decode() if isinstance(v, bytes) else v for k, v in public_key.to_dict().items()}
+    # RFC 7638 指纹作为 kid
+    required = {k: public_jwk[k] for k in ("crv", "e", "kty", "n", "x", "y") if k in public_jwk}
+    thumbprint = hashlib.sha256(json.dumps(required, sort_keys=True, separators=(",", ":")).encode()).digest()
+    public_jwk.update({"kid": base64url_encode(thumbprint).decode(), "use": "sig", "alg": ALGORITHM})
+    return private_pem, public_key.to_pem().decode(), public_jwk
+
+SIGNING_KEY, VERIFY_KEY, PUBLIC_JWK = _load_signing_keys()
+
+# 用户服务：查询凭据与记录登录，使用长期存在的连接池
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://localhost:8002").rstrip("/")
+USER_SERVICE_TIMEOUT = float(os.getenv("USER_SERVICE_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+# bcrypt 成本（修改后用户下次登录时自动重新哈希）、哈希线程数（默认 CPU 核数）与最大排队数
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or None
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "0")) or None
+LOGIN_RETRY_AFTER = int(os.getenv("LOGIN_RETRY_AFTER", "1"))
+
+user_client = httpx.AsyncClient(
+    base_url=USER_SERVICE_URL,
+    timeout=USER_SERVICE_TIMEOUT,
+    limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS)
+)
+password_hasher = PasswordHasher(BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await user_client.aclose()
+    password_hasher.close()
 
 # 模型
 class Token(BaseModel):
@@ -34,6 +83,12 @@ class User(BaseModel):
 class UserInDB(User):
     hashed_password: str
 
+class UserCredentials(BaseModel):
+    id: int
+    username: str
+    hashed_password: Optional[str] = None
+    is_active: bool = True
+
 # 工具函数
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -42,31 +97,60 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    headers = {"kid": PUBLIC_JWK["kid"]} if PUBLIC_JWK else None
+    encoded_jwt = jwt.encode(to_encode, SIGNING_KEY, algorithm=ALGORITHM, headers=headers)
     return encoded_jwt
 
+async def get_user_credentials(username: str) -> Optional[UserCredentials]:
+    """从用户服务查询凭据，用户不存在时返回 None"""
+    try:
+        response = await user_client.get("/internal/users/credentials", params={"username": username})
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return UserCredentials(**response.json())
+    except httpx.HTTPError as e:
+        logger.error(f"Error fetching user {username}: {str(e)}")
+        raise HTTPException(status_code=503, detail="User service unavailable")
+
+async def record_login(user_id: int, new_hash: Optional[str]):
+    """记录登录时间，哈希成本变化时一并保存新哈希；失败不影响本次登录"""
+    try:
+        response = await user_client.post(f"/internal/users/{user_id}/login", json={"hashed_password": new_hash})
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.error(f"Error recording login for user {user_id}: {str(e)}")
+
 # 路由
 @app.post("/auth/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    # 这里应该调用用户服务验证用户
-    # 为了演示，我们使用一个模拟的用户
-    if form_data.username != "test" or form_data.password != "test":
+async def login_for_access_token(background_tasks: BackgroundTasks, form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await get_user_credentials(form_data.username)
+    try:
+        valid, new_hash = await password_hasher.verify(form_data.password, user.hashed_password if user else None)
+    except HasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress",
+            headers={"Retry-After": str(LOGIN_RETRY_AFTER)},
+        )
+    if not valid or not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    background_tasks.add_task(record_login, user.id, new_hash)
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": form_data.username}, expires_delta=access_token_expires
+        data={"sub": user.username}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/auth/verify")
 async def verify_token(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, VERIFY_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="Invalid token")
@@ -74,6 +158,21 @@ async def verify_token(token: str):
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+@app.get("/auth/stats")
+async def auth_stats():
+    """密码哈希线程池统计"""
+    return password_hasher.get_stats()
+
+@app.get("/auth/.well-known/jwks.json")
+async def jwks():
+    """发布验证令牌所需的公钥（对称算法时为空）"""
+    return {"keys": [PUBLIC_JWK] if PUBLIC_JWK else []}
+
+@app.get("/health")
+async def health_check():
+    """健康检查端点"""
+    return {"status": "healthy"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001) 
\ No newline at end of file
@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+from typing import Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+class HasherBusy(Exception):
+    """等待哈希的请求已达上限"""
+    pass
+
+class PasswordHasher:
+    """在有界线程池中执行 bcrypt，避免阻塞事件循环
+
+    bcrypt 计算时释放 GIL，worker 数默认等于 CPU 核数，吞吐随核数增长；排队的请求超过
+    max_pending 时直接拒绝（HasherBusy），登录风暴下不会无限排队拖垮所有请求。
+    """
+
+    def __init__(self, rounds: int = 12, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        # 存储的哈希成本与当前配置不同时，verify_and_update 会返回新哈希
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 16
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    async def _run(self, func: Callable, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HasherBusy()
+        self.pending += 1
+        try:
+            return await asyncio.get_event_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """校验密码，返回 (是否正确, 需要保存的新哈希)；没有哈希时仍做一次等价计算，避免通过耗时判断用户是否存在"""
+        if not hashed_password:
+            await self._run(self.context.dummy_verify)
+            return False, None
+        try:
+            valid, new_hash = await self._run(self.context.verify_and_update, password, hashed_password)
+        except ValueError as e:
+            logger.error(f"Unusable password hash: {str(e)}")
+            return False, None
+        if valid and new_hash:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+    def get_stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed
+        }
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import time
+
+def parse_rate(value: str) -> Optional[Tuple[float, float]]:
+    """解析 "速率:突发容量"（如 "20:40"），只给速率时容量等于速率；空串表示不限流
+
+    速率必须大于 0、容量不小于 1，否则桶永远取不到令牌（速率为 0 时还会除零）。
+    """
+    value = value.strip()
+    if not value:
+        return None
+    rate, _, burst = value.partition(":")
+    rate, burst = float(rate), float(burst or rate)
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"Invalid rate limit '{value}': rate must be > 0 and burst >= 1")
+    return rate, burst
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒补充，最多积累 burst 个"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def wait(self) -> float:
+        """补充令牌但不取走；有可用令牌时返回 0，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> float:
+        """取一个令牌；成功返回 0，否则返回需要等待的秒数"""
+        wait = self.wait()
+        if not wait:
+            self.tokens -= 1
+        return wait
+
+class RateLimiter:
+    """准入控制中的限流部分
+
+    - 路由限流：按最长匹配的路径前缀共享一个令牌桶，保护下游整体容量
+    - 客户端限流：每个客户端（已验证用户，否则为来源 IP）一个令牌桶，桶数量有上限，按 LRU 淘汰
+    """
+
+    def __init__(
+        self,
+        route_limits: Dict[str, Tuple[float, float]],
+        client_limit: Optional[Tuple[float, float]] = None,
+        max_clients: int = 10000
+    ):
+        self.route_limits = sorted(route_limits.items(), key=lambda item: len(item[0]), reverse=True)
+        self._route_buckets = {prefix: TokenBucket(*limit) for prefix, limit in route_limits.items()}
+        self.client_limit = client_limit
+        self.max_clients = max_clients
+        self._client_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.route_rejections = 0
+        self.client_rejections = 0
+
+    def _client_bucket(self, client: str) -> TokenBucket:
+        bucket = self._client_buckets.get(client)
+        if bucket is None:
+            bucket = self._client_buckets[client] = TokenBucket(*self.client_limit)
+            while len(self._client_buckets) > self.max_clients:
+                self._client_buckets.popitem(last=False)
+        else:
+            self._client_buckets.move_to_end(client)
+        return bucket
+
+    def check(self, path: str, client: str) -> float:
+        """返回 0 表示放行，否则返回建议的 Retry-After 秒数
+
+        先检查两个桶，都有令牌时才各取一个：被路由限流拒绝的请求不消耗客户端的配额，反之亦然。
+        """
+        buckets = []
+        if self.client_limit is not None:
+            bucket = self._client_bucket(client)
+            wait = bucket.wait()
+            if wait:
+                self.client_rejections += 1
+                return wait
+            buckets.append(bucket)
+        for prefix, _ in self.route_limits:
+            if path.startswith(prefix):
+                bucket = self._route_buckets[prefix]
+                wait = bucket.wait()
+                if wait:
+                    self.route_rejections += 1
+                    return wait
+                buckets.append(bucket)
+                break
+        for bucket in buckets:
+            bucket.take()
+        return 0.0
+
+    def get_stats(self) -> Dict:
+        return {
+            "route_limits": {prefix: {"rate": rate, "burst": burst} for prefix, (rate, burst) in self.route_limits},
+            "client_limit": {"rate": self.client_limit[0], "burst": self.client_limit[1]} if self.client_limit else None,
+            "tracked_clients": len(self._client_buckets),
+            "route_rejections": self.route_rejections,
+            "client_rejections": self.client_rejections
+        }
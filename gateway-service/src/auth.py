@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from jose import JWTError, jwt
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class TokenError(Exception):
+    """令牌无效、过期或无法验证"""
+    pass
+
+class TokenVerifier:
+    """在网关本地验证 JWT，不再为每个请求调用 auth-service
+
+    HS* 算法使用与 auth-service 相同的共享密钥；RS*/ES* 算法从 auth-service 的 JWKS
+    端点获取公钥（按 kid 缓存，遇到未知 kid 时刷新，刷新有最小间隔）。
+    验证通过的令牌按 SHA-256 摘要缓存到其 exp，缓存条目数有上限，按 LRU 淘汰。
+    """
+
+    def __init__(
+        self,
+        algorithm: str = "HS256",
+        secret_key: Optional[str] = None,
+        fetch_jwks: Optional[Callable[[], Awaitable[Dict]]] = None,
+        max_entries: int = 10000,
+        default_ttl: float = 60,
+        jwks_refresh_interval: float = 30
+    ):
+        self.algorithm = algorithm
+        self.secret_key = secret_key
+        self.fetch_jwks = fetch_jwks
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.jwks_refresh_interval = jwks_refresh_interval
+        self._keys: Dict[str, Dict] = {}
+        self._jwks_fetched_at = 0.0
+        self._verified: "OrderedDict[bytes, Tuple[Dict, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    @property
+    def symmetric(self) -> bool:
+        return self.algorithm.startswith("HS")
+
+    async def _refresh_keys(self) -> None:
+        now = time.monotonic()
+        if self.fetch_jwks is None or now - self._jwks_fetched_at < self.jwks_refresh_interval:
+            return
+        self._jwks_fetched_at = now
+        jwks = await self.fetch_jwks()
+        self._keys = {key.get("kid", ""): key for key in jwks.get("keys", [])}
+        logger.info(f"Loaded {len(self._keys)} signing key(s) from JWKS")
+
+    async def _key_for(self, token: str):
+        if self.symmetric:
+            return self.secret_key
+        try:
+            kid = jwt.get_unverified_header(token).get("kid", "")
+        except JWTError:
+            raise TokenError("Invalid token")
+        if kid not in self._keys:
+            try:
+                await self._refresh_keys()
+            except Exception as e:
+                logger.error(f"Error fetching JWKS: {str(e)}")
+        key = self._keys.get(kid)
+        if key is None:
+            raise TokenError("Unknown signing key")
+        return key
+
+    async def verify(self, token: str) -> Dict:
+        """返回验证通过的 claims，无效时抛出 TokenError"""
+        digest = hashlib.sha256(token.encode()).digest()
+        cached = self._verified.get(digest)
+        if cached is not None:
+            claims, expires_at = cached
+            if expires_at > time.time():
+                self._verified.move_to_end(digest)
+                self.hits += 1
+                return claims
+            del self._verified[digest]
+
+        self.misses += 1
+        try:
+            claims = jwt.decode(token, await self._key_for(token), algorithms=[self.algorithm])
+        except (JWTError, TokenError) as e:
+            self.failures += 1
+            raise TokenError(str(e) if isinstance(e, TokenError) else "Invalid token")
+        if not claims.get("sub"):
+            self.failures += 1
+            raise TokenError("Invalid token")
+
+        expires_at = float(claims.get("exp", time.time() + self.default_ttl))
+        self._verified[digest] = (claims, expires_at)
+        while len(self._verified) > self.max_entries:
+            self._verified.popitem(last=False)
+        return claims
+
+    async def identity_headers(self, authorization: Optional[str], header: bytes) -> List[Tuple[bytes, bytes]]:
+        """从 Authorization 头验证 Bearer 令牌，返回要附加给下游的可信身份头；没有令牌时返回空列表"""
+        if not authorization:
+            return []
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not token.strip():
+            return []
+        claims = await self.verify(token.strip())
+        return [(header, str(claims["sub"]).encode())]
+
+    def get_stats(self) -> Dict:
+        return {
+            "algorithm": self.algorithm,
+            "cached_tokens": len(self._verified),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+            "signing_keys": len(self._keys)
+        }
@@ -0,0 +1,242 @@
+from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import httpx
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """单个上游实例的熔断器
+
+    closed: 正常放行；连续失败达到 failure_threshold 次后转为 open。
+    open: 直接拒绝，open_seconds 后转为 half_open。
+    half_open: 只放行一个试探请求，成功则 closed，失败则重新 open。
+    另外未完成请求数达到 max_outstanding 时也不再放行，避免请求堆积在慢实例上。
+    """
+
+    def __init__(self, failure_threshold: int = 5, open_seconds: float = 30, max_outstanding: int = 100):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_outstanding = max_outstanding
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allows(self, outstanding: int) -> bool:
+        """是否可以向该实例发送新请求（不改变状态）"""
+        if outstanding >= self.max_outstanding:
+            return False
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.open_seconds
+        if self.state == "half_open":
+            return not self._trial_in_flight
+        return True
+
+    def on_request(self) -> None:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = "half_open"
+        if self.state == "half_open":
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+        if self.state != "closed":
+            logger.info("Circuit closed")
+        self.state = "closed"
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+class Instance:
+    """上游服务的一个实例：独立的连接池、健康状态、熔断器与统计"""
+
+    # 延迟与错误率的指数滑动平均系数
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, url: str, client: httpx.AsyncClient, breaker: CircuitBreaker):
+        self.url = url
+        self.client = client
+        self.breaker = breaker
+        self.healthy = True
+        self.health_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.outstanding = 0
+        # 经由该实例中继的 WebSocket 长连接数（不计入 outstanding，避免空闲长连接占满并发上限）
+        self.websockets = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+
+    @property
+    def ejected(self) -> bool:
+        return time.monotonic() < self.ejected_until
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and not self.ejected and self.breaker.allows(self.outstanding)
+
+    def begin(self) -> float:
+        self.outstanding += 1
+        self.requests += 1
+        self.breaker.on_request()
+        return time.monotonic()
+
+    def end(self) -> None:
+        self.outstanding -= 1
+
+    def record(self, started: float, success: bool) -> None:
+        """记录一次请求结果（延迟按收到响应头计算）"""
+        latency = (time.monotonic() - started) * 1000
+        self.latency_ms = latency if self.latency_ms is None else (
+            self.EWMA_ALPHA * latency + (1 - self.EWMA_ALPHA) * self.latency_ms
+        )
+        self.error_rate = self.EWMA_ALPHA * (0.0 if success else 1.0) + (1 - self.EWMA_ALPHA) * self.error_rate
+        if success:
+            self.breaker.record_success()
+        else:
+            self.failures += 1
+            self.breaker.record_failure()
+
+    def get_stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "ejected": self.ejected,
+            "ejections": self.ejections,
+            "circuit": self.breaker.state,
+            "outstanding": self.outstanding,
+            "websockets": self.websockets,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_ms": round(self.latency_ms, 2) if self.latency_ms is not None else None,
+            "error_rate": round(self.error_rate, 3)
+        }
+
+class LoadBalancer:
+    """一个服务的实例池
+
+    strategy 为 p2c（随机取两个可用实例，选未完成请求更少的）或 least_outstanding。
+    被动异常剔除：滑动平均错误率或延迟超过阈值的实例被剔除 ejection_seconds（多次剔除时递增），
+    但始终至少保留一个未剔除的实例。
+    并发上限：整个服务的未完成请求数达到 max_concurrency（0 表示不限）时拒绝新请求，
+    其中 priority_reserve 比例的容量只留给优先请求。
+    """
+
+    def __init__(
+        self,
+        service: str,
+        instances: List[Instance],
+        strategy: str = "p2c",
+        ejection_seconds: float = 30,
+        error_rate_threshold: float = 0.5,
+        latency_threshold_ms: float = 5000,
+        min_requests: int = 10,
+        max_concurrency: int = 0,
+        priority_reserve: float = 0.0
+    ):
+        if strategy not in ("p2c", "least_outstanding"):
+            raise ValueError(f"Unknown load balancing strategy: {strategy}")
+        self.service = service
+        self.instances = instances
+        self.strategy = strategy
+        self.ejection_seconds = ejection_seconds
+        self.error_rate_threshold = error_rate_threshold
+        self.latency_threshold_ms = latency_threshold_ms
+        self.min_requests = min_requests
+        self.max_concurrency = max_concurrency
+        # 普通请求可用的并发数，剩余部分为优先请求保留
+        self.normal_concurrency = max_concurrency - int(max_concurrency * priority_reserve)
+        self.shed = 0
+
+    @property
+    def outstanding(self) -> int:
+        return sum(instance.outstanding for instance in self.instances)
+
+    def admit(self, priority: bool = False) -> bool:
+        """服务整体并发是否还有余量；没有余量时计入 shed，调用方应立即拒绝"""
+        if not self.max_concurrency:
+            return True
+        limit = self.max_concurrency if priority else self.normal_concurrency
+        if self.outstanding < limit:
+            return True
+        self.shed += 1
+        return False
+
+    def choose(self, exclude: Optional[Instance] = None) -> Optional[Instance]:
+        """选出一个可用实例，没有可用实例时返回 None（调用方应快速失败）"""
+        available = [instance for instance in self.instances if instance.available and instance is not exclude]
+        if not available:
+            return None
+        if self.strategy == "p2c" and len(available) > 2:
+            available = random.sample(available, 2)
+        return min(available, key=lambda instance: (instance.outstanding, instance.latency_ms or 0.0))
+
+    def choose_sticky(self, key: str, exclude: Optional[Instance] = None) -> Optional[Instance]:
+        """按 key 做 rendezvous 哈希选出可用实例：同一个 key 总是落在同一实例上，
+        实例上下线只会迁移原本落在该实例上的 key"""
+        available = [instance for instance in self.instances if instance.available and instance is not exclude]
+        if not available:
+            return None
+        return max(available, key=lambda instance: hashlib.md5(f"{instance.url}|{key}".encode()).digest())
+
+    def observe(self, instance: Instance, started: float, success: bool) -> None:
+        """记录请求结果，并按错误率与延迟判断是否剔除该实例"""
+        instance.record(started, success)
+        if instance.requests < self.min_requests or instance.ejected:
+            return
+        outlier = instance.error_rate > self.error_rate_threshold or (
+            instance.latency_ms is not None and instance.latency_ms > self.latency_threshold_ms
+        )
+        remaining = sum(1 for other in self.instances if other.healthy and not other.ejected)
+        if outlier and remaining > 1:
+            instance.ejections += 1
+            instance.ejected_until = time.monotonic() + self.ejection_seconds * instance.ejections
+            # 剔除期结束后重新开始统计，避免旧数据导致立即再次剔除
+            instance.error_rate = 0.0
+            instance.latency_ms = None
+            logger.warning(
+                f"Ejected {self.service} instance {instance.url} for "
+                f"{self.ejection_seconds * instance.ejections:.0f}s"
+            )
+
+    async def probe(self, path: str, timeout: float, unhealthy_threshold: int) -> None:
+        """主动健康检查：并发请求每个实例的健康检查端点，只有 2xx 视为健康（404 说明路径配置有误）"""
+        async def check(instance: Instance) -> None:
+            try:
+                response = await instance.client.get(path, timeout=timeout)
+                ok = response.is_success
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                if not instance.healthy:
+                    logger.info(f"{self.service} instance {instance.url} is healthy again")
+                instance.healthy = True
+                instance.health_failures = 0
+            else:
+                instance.health_failures += 1
+                if instance.healthy and instance.health_failures >= unhealthy_threshold:
+                    instance.healthy = False
+                    logger.warning(f"{self.service} instance {instance.url} failed health checks")
+
+        await asyncio.gather(*(check(instance) for instance in self.instances))
+
+    def get_stats(self) -> Dict:
+        return {
+            "strategy": self.strategy,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "shed": self.shed,
+            "available": sum(1 for instance in self.instances if instance.available),
+            "instances": [instance.get_stats() for instance in self.instances]
+        }
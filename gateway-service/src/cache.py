@@ -0,0 +1,256 @@
+from collections import OrderedDict
+from fastapi import Request
+from fastapi.responses import Response
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlencode
+import asyncio
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class CachedResponse:
+    """缓冲后的上游响应"""
+
+    __slots__ = ("status_code", "headers", "body", "etag", "service", "stored_at", "expires_at")
+
+    def __init__(self, status_code: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.status_code = status_code
+        self.headers = [(key, value) for key, value in headers if key not in (b"content-length", b"etag")]
+        self.body = body
+        upstream_etag = dict(headers).get(b"etag")
+        self.etag = upstream_etag.decode() if upstream_etag else f'"{hashlib.sha1(body).hexdigest()}"'
+        self.service = ""
+        self.stored_at = 0.0
+        self.expires_at = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(key) + len(value) for key, value in self.headers)
+
+    def cacheable(self, max_entry_bytes: int) -> bool:
+        headers = dict(self.headers)
+        cache_control = headers.get(b"cache-control", b"").lower()
+        return (
+            self.status_code == 200
+            and b"set-cookie" not in headers
+            and b"no-store" not in cache_control
+            and b"private" not in cache_control
+            and len(self.body) <= max_entry_bytes
+        )
+
+class LoadAbandoned(Exception):
+    """发起加载的请求在完成前被取消，等待者需要重新加载"""
+    pass
+
+class ResponseCache:
+    """网关响应缓存：只缓存幂等 GET
+
+    - 键：方法、路径、排序后的查询参数以及 vary_headers 中选定的请求头
+    - 每个路由前缀单独配置 TTL，按字节数限制的 LRU 淘汰
+    - 同一个键的并发未命中合并为一次上游请求；超过单条上限的响应不缓冲，直接流式返回
+    - 支持 ETag / If-None-Match 返回 304
+    - 同一服务前缀上的写请求使其全部缓存失效
+    """
+
+    def __init__(
+        self,
+        ttls: Dict[str, float],
+        max_bytes: int = 32 * 1024 * 1024,
+        max_entry_bytes: int = 1024 * 1024,
+        vary_headers: Tuple[str, ...] = ("authorization", "accept", "accept-encoding")
+    ):
+        # 最长前缀优先匹配
+        self.ttls = sorted(ttls.items(), key=lambda item: len(item[0]), reverse=True)
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.vary_headers = tuple(header.lower() for header in vary_headers)
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # 每次写请求递增，加载期间发生写入的结果不再写入缓存
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def ttl_for(self, path: str) -> Optional[float]:
+        for prefix, ttl in self.ttls:
+            if path.startswith(prefix):
+                return ttl
+        return None
+
+    def key(self, request: Request) -> str:
+        query = urlencode(sorted(parse_qsl(request.url.query, keep_blank_values=True)))
+        varied = "\0".join(request.headers.get(header, "") for header in self.vary_headers)
+        payload = f"{request.method}\0{request.url.path}\0{query}\0{varied}".encode()
+        return hashlib.sha256(payload).hexdigest()
+
+    def _remember(self, key: str, entry: CachedResponse) -> None:
+        """放入 LRU 并按字节上限淘汰最久未用的条目"""
+        self._discard(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _lookup(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def _load(
+        self,
+        key: str,
+        service: str,
+        ttl: float,
+        load: Callable[[], Awaitable[Union[CachedResponse, Response]]]
+    ) -> Union[CachedResponse, Response]:
+        """加载并在可缓存时写入；同一个键的并发调用共享同一次加载"""
+        while True:
+            # 重试时其他等待者可能已经加载并写入了缓存
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry
+            future = self._inflight.get(key)
+            if future is None:
+                return await self._lead(key, service, ttl, load)
+            self.coalesced += 1
+            try:
+                entry = await asyncio.shield(future)
+            except LoadAbandoned:
+                # 发起者被取消，由等待者之一重新发起加载
+                continue
+            if isinstance(entry, CachedResponse):
+                return entry
+            # 响应过大未被缓冲，流无法共享，各自请求上游
+            return await load()
+
+    async def _lead(
+        self,
+        key: str,
+        service: str,
+        ttl: float,
+        load: Callable[[], Awaitable[Union[CachedResponse, Response]]]
+    ) -> Union[CachedResponse, Response]:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generations.get(service, 0)
+        try:
+            entry = await load()
+        except BaseException as e:
+            # 包括取消：必须结束共享的 future，否则等待者会永远挂起
+            future.set_exception(e if isinstance(e, Exception) else LoadAbandoned())
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        if (
+            isinstance(entry, CachedResponse)
+            and entry.cacheable(self.max_entry_bytes)
+            and self._generations.get(service, 0) == generation
+        ):
+            entry.service = service
+            entry.stored_at = time.monotonic()
+            entry.expires_at = entry.stored_at + ttl
+            self._remember(key, entry)
+        future.set_result(entry)
+        return entry
+
+    async def serve(
+        self,
+        request: Request,
+        service: str,
+        ttl: float,
+        load: Callable[[], Awaitable[Union[CachedResponse, Response]]]
+    ) -> Response:
+        """从缓存返回响应，未命中时（合并并发请求后）从上游加载
+
+        load 在响应体超过 max_entry_bytes 时应停止缓冲并返回流式响应，该响应原样返回、不缓存。
+        """
+        key = self.key(request)
+        if_none_match = request.headers.get("if-none-match")
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            # 客户端持有的 ETag 仍与缓存条目一致时直接返回 304，不读取响应体
+            if self._matches(if_none_match, entry.etag):
+                return self._not_modified(entry, "HIT")
+            return self._respond(entry, "HIT")
+
+        self.misses += 1
+        entry = await self._load(key, service, ttl, load)
+        if not isinstance(entry, CachedResponse):
+            return entry
+        if entry.status_code == 200 and self._matches(if_none_match, entry.etag):
+            return self._not_modified(entry, "MISS")
+        return self._respond(entry, "MISS")
+
+    @staticmethod
+    def _extra_headers(entry: CachedResponse, status: str) -> List[Tuple[bytes, bytes]]:
+        age = str(int(time.monotonic() - entry.stored_at)) if entry.stored_at else "0"
+        return [(b"etag", entry.etag.encode()), (b"x-cache", status.encode()), (b"age", age.encode())]
+
+    def _not_modified(self, entry: CachedResponse, status: str) -> Response:
+        self.not_modified += 1
+        response = Response(status_code=304)
+        response.raw_headers = self._extra_headers(entry, status)
+        return response
+
+    def _respond(self, entry: CachedResponse, status: str) -> Response:
+        extra = self._extra_headers(entry, status)
+        response = Response(content=entry.body, status_code=entry.status_code)
+        response.raw_headers = entry.headers + [(b"content-length", str(len(entry.body)).encode())] + extra
+        return response
+
+    @staticmethod
+    def _matches(if_none_match: Optional[str], etag: str) -> bool:
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        # 弱比较：忽略 W/ 前缀
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag.removeprefix("W/") in candidates
+
+    def invalidate(self, service: str) -> None:
+        """写请求后清除该服务前缀下的全部缓存"""
+        self._generations[service] = self._generations.get(service, 0) + 1
+        stale = [key for key, entry in self._entries.items() if entry.service == service]
+        for key in stale:
+            self._discard(key)
+        if stale:
+            self.invalidations += len(stale)
+            logger.info(f"Invalidated {len(stale)} cached response(s) for {service}")
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,129 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def _urls(name: str, default: str) -> list:
+    """逗号分隔的实例地址列表"""
+    return [url.strip().rstrip("/") for url in os.getenv(name, default).split(",") if url.strip()]
+
+# 服务路由配置：每个服务可配置多个实例（逗号分隔），由负载均衡器选择
+SERVICE_ROUTES = {
+    "auth": _urls("AUTH_SERVICE_URL", "http://localhost:8101"),
+    "user": _urls("USER_SERVICE_URL", "http://localhost:8102"),
+    "agent": _urls("AGENT_SERVICE_URL", "http://localhost:8103"),
+    "knowledge": _urls("KNOWLEDGE_SERVICE_URL", "http://localhost:8104"),
+    "frontend": _urls("FRONTEND_SERVICE_URL", "http://localhost:8105")
+}
+
+# 路径前缀别名：agent-service 的接口挂在 /agents 下
+SERVICE_ALIASES = {"agents": "agent"}
+
+# 每个上游的连接池：最大连接数、最大空闲长连接数、空闲连接保活时间（秒）
+PROXY_MAX_CONNECTIONS = int(os.getenv("PROXY_MAX_CONNECTIONS", "100"))
+PROXY_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("PROXY_MAX_KEEPALIVE_CONNECTIONS", "20"))
+PROXY_KEEPALIVE_EXPIRY = float(os.getenv("PROXY_KEEPALIVE_EXPIRY", "30"))
+
+# 转发超时（秒）：建立连接、读取、写入、等待连接池空闲连接
+PROXY_CONNECT_TIMEOUT = float(os.getenv("PROXY_CONNECT_TIMEOUT", "5"))
+PROXY_READ_TIMEOUT = float(os.getenv("PROXY_READ_TIMEOUT", "60"))
+PROXY_WRITE_TIMEOUT = float(os.getenv("PROXY_WRITE_TIMEOUT", "60"))
+PROXY_POOL_TIMEOUT = float(os.getenv("PROXY_POOL_TIMEOUT", "5"))
+
+# 负载均衡策略: p2c（两次随机选择）/ least_outstanding（最少未完成请求）
+LOAD_BALANCER_STRATEGY = os.getenv("LOAD_BALANCER_STRATEGY", "p2c")
+
+# 主动健康检查：路径、间隔与超时（秒），连续失败多少次判为不健康；只有 2xx 响应视为健康
+# HEALTH_CHECK_PATHS 按服务覆盖路径，如 "frontend=/,knowledge=/health"（前端开发服务器没有 /health）
+HEALTH_CHECK_PATH = os.getenv("HEALTH_CHECK_PATH", "/health")
+HEALTH_CHECK_PATHS = {
+    service.strip(): path.strip()
+    for service, path in (
+        item.split("=", 1)
+        for item in os.getenv("HEALTH_CHECK_PATHS", "frontend=/").split(",")
+        if "=" in item
+    )
+}
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+HEALTH_CHECK_UNHEALTHY_THRESHOLD = int(os.getenv("HEALTH_CHECK_UNHEALTHY_THRESHOLD", "2"))
+
+# 被动异常剔除：错误率 / 延迟阈值、最少请求数与基础剔除时间（秒）
+OUTLIER_ERROR_RATE = float(os.getenv("OUTLIER_ERROR_RATE", "0.5"))
+OUTLIER_LATENCY_MS = float(os.getenv("OUTLIER_LATENCY_MS", "5000"))
+OUTLIER_MIN_REQUESTS = int(os.getenv("OUTLIER_MIN_REQUESTS", "10"))
+OUTLIER_EJECTION_SECONDS = float(os.getenv("OUTLIER_EJECTION_SECONDS", "30"))
+
+# 熔断器：连续失败次数阈值、打开持续时间（秒）、单实例最大未完成请求数
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_MAX_OUTSTANDING = int(os.getenv("CIRCUIT_MAX_OUTSTANDING", "100"))
+
+# 响应缓存（默认关闭）：按路由前缀配置 TTL（秒），如 "/knowledge/search=30,/agents=10,/user/=60"
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_TTLS = {
+    prefix.strip(): float(ttl)
+    for prefix, ttl in (
+        item.split("=", 1)
+        for item in os.getenv("RESPONSE_CACHE_TTLS", "/knowledge/search=30,/agents=10,/user/=60").split(",")
+        if "=" in item
+    )
+}
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+# 参与缓存键的请求头（逗号分隔）
+RESPONSE_CACHE_VARY_HEADERS = [
+    header.strip().lower()
+    for header in os.getenv("RESPONSE_CACHE_VARY_HEADERS", "authorization,accept,accept-encoding").split(",")
+    if header.strip()
+]
+
+# 网关本地 JWT 验证：算法与 auth-service 一致；HS* 使用共享密钥，RS*/ES* 从 auth-service 的 JWKS 获取公钥
+AUTH_ENABLED = os.getenv("AUTH_ENABLED", "true").lower() == "true"
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key")
+JWKS_PATH = os.getenv("JWKS_PATH", "/auth/.well-known/jwks.json")
+# 已验证令牌缓存的条目上限（条目在令牌 exp 时过期）
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+# 传给下游的可信身份头，客户端自带的同名头会被丢弃
+TRUSTED_IDENTITY_HEADER = os.getenv("TRUSTED_IDENTITY_HEADER", "X-Authenticated-User")
+# 公开的认证路由：客户端可能仍带着过期令牌登录或注册，这些路由上无效令牌按匿名处理
+PUBLIC_AUTH_ROUTES = [
+    path.strip() for path in os.getenv("PUBLIC_AUTH_ROUTES", "/auth/token,/auth/register").split(",") if path.strip()
+]
+
+# 准入控制：按路由前缀的令牌桶限流，格式 "前缀=每秒速率:突发容量"，如 "/agents=20:40,/knowledge=100:200"
+ROUTE_RATE_LIMITS = {
+    prefix.strip(): limit
+    for prefix, limit in (
+        item.split("=", 1)
+        for item in os.getenv("ROUTE_RATE_LIMITS", "").split(",")
+        if "=" in item
+    )
+}
+# 每个客户端（已验证用户，否则为来源 IP）的令牌桶 "每秒速率:突发容量"，留空表示不限；跟踪的客户端数上限
+CLIENT_RATE_LIMIT = os.getenv("CLIENT_RATE_LIMIT", "")
+CLIENT_RATE_LIMIT_MAX_CLIENTS = int(os.getenv("CLIENT_RATE_LIMIT_MAX_CLIENTS", "10000"))
+# 每个上游服务的最大并发请求数，如 "agent=32,knowledge=64"，未配置的服务不限
+UPSTREAM_CONCURRENCY_LIMITS = {
+    service.strip(): int(limit)
+    for service, limit in (
+        item.split("=", 1)
+        for item in os.getenv("UPSTREAM_CONCURRENCY_LIMITS", "").split(",")
+        if "=" in item
+    )
+}
+# 优先通道：为交互式流量保留的并发比例；匹配这些路由前缀，或已验证用户带 PRIORITY_HEADER: interactive 的请求走优先通道
+PRIORITY_RESERVE = float(os.getenv("PRIORITY_RESERVE", "0.2"))
+PRIORITY_ROUTES = [prefix.strip() for prefix in os.getenv("PRIORITY_ROUTES", "").split(",") if prefix.strip()]
+PRIORITY_HEADER = os.getenv("PRIORITY_HEADER", "X-Priority")
+# 并发已满时 503 响应的 Retry-After（秒）
+OVERLOAD_RETRY_AFTER = int(os.getenv("OVERLOAD_RETRY_AFTER", "1"))
+
+# WebSocket 中继：单条消息上限（字节）、每个连接的接收队列长度（条）与发送缓冲高水位（字节）
+WS_MAX_MESSAGE_BYTES = int(os.getenv("WS_MAX_MESSAGE_BYTES", str(1024 * 1024)))
+WS_MAX_QUEUE = int(os.getenv("WS_MAX_QUEUE", "16"))
+WS_WRITE_LIMIT = int(os.getenv("WS_WRITE_LIMIT", str(64 * 1024)))
+# 到上游的 WebSocket 心跳间隔与超时（秒），用于及时发现断开的空闲连接
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+WS_PING_TIMEOUT = float(os.getenv("WS_PING_TIMEOUT", "20"))
@@ -1,8 +1,29 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import HTTPConnection
+from typing import Dict, List, Tuple, Union
 import httpx
 import logging
-from typing import Dict
+import math
+from .config import (
+    SERVICE_ROUTES, PROXY_MAX_CONNECTIONS, PROXY_MAX_KEEPALIVE_CONNECTIONS, PROXY_KEEPALIVE_EXPIRY,
+    PROXY_CONNECT_TIMEOUT, PROXY_READ_TIMEOUT, PROXY_WRITE_TIMEOUT, PROXY_POOL_TIMEOUT,
+    LOAD_BALANCER_STRATEGY, HEALTH_CHECK_PATH, HEALTH_CHECK_PATHS, HEALTH_CHECK_INTERVAL, HEALTH_CHECK_TIMEOUT,
+    HEALTH_CHECK_UNHEALTHY_THRESHOLD, OUTLIER_ERROR_RATE, OUTLIER_LATENCY_MS, OUTLIER_MIN_REQUESTS,
+    OUTLIER_EJECTION_SECONDS, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_OPEN_SECONDS, CIRCUIT_MAX_OUTSTANDING,
+    SERVICE_ALIASES, RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_TTLS, RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_MAX_ENTRY_BYTES, RESPONSE_CACHE_VARY_HEADERS, AUTH_ENABLED, JWT_ALGORITHM,
+    JWT_SECRET_KEY, JWKS_PATH, TOKEN_CACHE_MAX_ENTRIES, TRUSTED_IDENTITY_HEADER, PUBLIC_AUTH_ROUTES, ROUTE_RATE_LIMITS,
+    CLIENT_RATE_LIMIT, CLIENT_RATE_LIMIT_MAX_CLIENTS, UPSTREAM_CONCURRENCY_LIMITS, PRIORITY_RESERVE,
+    PRIORITY_ROUTES, PRIORITY_HEADER, OVERLOAD_RETRY_AFTER, WS_MAX_MESSAGE_BYTES, WS_MAX_QUEUE,
+    WS_WRITE_LIMIT, WS_PING_INTERVAL, WS_PING_TIMEOUT
+)
+from .admission import RateLimiter, parse_rate
+from .auth import TokenError, TokenVerifier
+from .cache import CachedResponse, ResponseCache
+from .proxy import UpstreamPool
+from .websocket_proxy import WebSocketRelay
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -19,44 +40,267 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 服务路由配置
-SERVICE_ROUTES: Dict[str, str] = {
-    "auth": "http://localhost:8101",
-    "user": "http://localhost:8102",
-    "agent": "http://localhost:8103",
-    "knowledge": "http://localhost:8104",
-    "frontend": "http://localhost:8105"
-}
+# 每个上游实例一个长期存在的连接池，请求与响应均流式转发
+upstreams = UpstreamPool(
+    SERVICE_ROUTES,
+    limits=httpx.Limits(
+        max_connections=PROXY_MAX_CONNECTIONS,
+        max_keepalive_connections=PROXY_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=PROXY_KEEPALIVE_EXPIRY
+    ),
+    timeout=httpx.Timeout(
+        connect=PROXY_CONNECT_TIMEOUT,
+        read=PROXY_READ_TIMEOUT,
+        write=PROXY_WRITE_TIMEOUT,
+        pool=PROXY_POOL_TIMEOUT
+    ),
+    strategy=LOAD_BALANCER_STRATEGY,
+    breaker_options={
+        "failure_threshold": CIRCUIT_FAILURE_THRESHOLD,
+        "open_seconds": CIRCUIT_OPEN_SECONDS,
+        "max_outstanding": CIRCUIT_MAX_OUTSTANDING
+    },
+    ejection_options={
+        "ejection_seconds": OUTLIER_EJECTION_SECONDS,
+        "error_rate_threshold": OUTLIER_ERROR_RATE,
+        "latency_threshold_ms": OUTLIER_LATENCY_MS,
+        "min_requests": OUTLIER_MIN_REQUESTS
+    },
+    concurrency_limits=UPSTREAM_CONCURRENCY_LIMITS,
+    priority_reserve=PRIORITY_RESERVE,
+    retry_after=OVERLOAD_RETRY_AFTER
+)
+
+# agent 会话的 WebSocket 中继，与 HTTP 转发共用实例池、健康检查与熔断
+websocket_relay = WebSocketRelay(
+    upstreams,
+    open_timeout=PROXY_CONNECT_TIMEOUT,
+    max_message_bytes=WS_MAX_MESSAGE_BYTES,
+    max_queue=WS_MAX_QUEUE,
+    write_limit=WS_WRITE_LIMIT,
+    ping_interval=WS_PING_INTERVAL,
+    ping_timeout=WS_PING_TIMEOUT
+)
+
+# 准入控制：超出限流的请求立即返回 429，不再转发给下游排队
+rate_limiter = RateLimiter(
+    {prefix: parse_rate(limit) for prefix, limit in ROUTE_RATE_LIMITS.items()},
+    client_limit=parse_rate(CLIENT_RATE_LIMIT),
+    max_clients=CLIENT_RATE_LIMIT_MAX_CLIENTS
+)
+
+# 幂等 GET 的响应缓存（可选）
+response_cache = ResponseCache(
+    RESPONSE_CACHE_TTLS,
+    max_bytes=RESPONSE_CACHE_MAX_BYTES,
+    max_entry_bytes=RESPONSE_CACHE_MAX_ENTRY_BYTES,
+    vary_headers=tuple(RESPONSE_CACHE_VARY_HEADERS)
+) if RESPONSE_CACHE_ENABLED else None
+
+async def _fetch_jwks() -> Dict:
+    response = await upstreams.request("auth", "GET", JWKS_PATH)
+    response.raise_for_status()
+    return response.json()
+
+# 网关本地验证 JWT，并把验证后的身份通过可信头传给下游
+token_verifier = TokenVerifier(
+    algorithm=JWT_ALGORITHM,
+    secret_key=JWT_SECRET_KEY,
+    fetch_jwks=_fetch_jwks,
+    max_entries=TOKEN_CACHE_MAX_ENTRIES
+) if AUTH_ENABLED else None
+identity_header = TRUSTED_IDENTITY_HEADER.lower().encode()
+
+@app.on_event("startup")
+async def startup():
+    upstreams.start_health_checks(
+        path=HEALTH_CHECK_PATH,
+        paths=HEALTH_CHECK_PATHS,
+        interval=HEALTH_CHECK_INTERVAL,
+        timeout=HEALTH_CHECK_TIMEOUT,
+        unhealthy_threshold=HEALTH_CHECK_UNHEALTHY_THRESHOLD
+    )
+
+@app.on_event("shutdown")
+async def shutdown():
+    await upstreams.close()
+
+async def _prepend(chunks: List[bytes], iterator):
+    try:
+        for chunk in chunks:
+            yield chunk
+        async for chunk in iterator:
+            yield chunk
+    finally:
+        await iterator.aclose()
+
+async def _buffered_forward(
+    request: Request,
+    service: str,
+    identity: List[Tuple[bytes, bytes]],
+    priority: bool = False
+) -> Union[CachedResponse, Response]:
+    """转发请求并把响应体读入内存供缓存使用；超过单条缓存上限时停止缓冲，改为流式返回"""
+    response = await upstreams.forward(request, service, identity, strip_headers=(identity_header,), priority=priority)
+    if not hasattr(response, "body_iterator"):
+        return CachedResponse(response.status_code, response.raw_headers, response.body)
+    length = dict(response.raw_headers).get(b"content-length")
+    if length is not None and length.isdigit() and int(length) > response_cache.max_entry_bytes:
+        return response
+    iterator = response.body_iterator
+    chunks: List[bytes] = []
+    size = 0
+    try:
+        async for chunk in iterator:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > response_cache.max_entry_bytes:
+                # 已读取的部分与剩余的流一起返回
+                response.body_iterator = _prepend(chunks, iterator)
+                return response
+    except BaseException:
+        await iterator.aclose()
+        raise
+    return CachedResponse(response.status_code, response.raw_headers, b"".join(chunks))
+
+def _unauthorized(detail: str) -> JSONResponse:
+    return JSONResponse(status_code=401, content={"detail": detail}, headers={"WWW-Authenticate": "Bearer"})
+
+def _client_key(request: HTTPConnection, identity: List[Tuple[bytes, bytes]]) -> str:
+    """限流使用的客户端标识：已验证用户，否则为来源 IP"""
+    if identity:
+        return identity[0][1].decode()
+    return request.client.host if request.client else ""
+
+def _is_priority(request: Request, identity: List[Tuple[bytes, bytes]]) -> bool:
+    """交互式流量走优先通道；请求头只对已验证用户生效，防止匿名客户端占用保留容量"""
+    if any(request.url.path.startswith(prefix) for prefix in PRIORITY_ROUTES):
+        return True
+    return bool(identity) and request.headers.get(PRIORITY_HEADER, "").lower() == "interactive"
 
 @app.middleware("http")
 async def route_middleware(request: Request, call_next):
     path = request.url.path
     service = path.split("/")[1] if len(path.split("/")) > 1 else "frontend"
+    service = SERVICE_ALIASES.get(service, service)
     
-    if service in SERVICE_ROUTES:
-        target_url = f"{SERVICE_ROUTES[service]}{path}"
-        logger.info(f"Routing request to {target_url}")
-        
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.request(
-                    method=request.method,
-                    url=target_url,
-                    headers=dict(request.headers),
-                    content=await request.body()
-                )
-                return response
-        except Exception as e:
-            logger.error(f"Error routing request to {service}: {str(e)}")
-            return {"error": f"Service {service} is not available"}
+    if service in upstreams:
+        logger.info(f"Routing {request.method} {path} to {service}")
+        identity: List[Tuple[bytes, bytes]] = []
+        if token_verifier is not None:
+            # 令牌校验在网关完成，auth-service 只处理登录
+            if path == "/auth/verify" and request.method == "GET":
+                try:
+                    claims = await token_verifier.verify(request.query_params.get("token", ""))
+                except TokenError:
+                    return _unauthorized("Invalid token")
+                return JSONResponse({"username": claims["sub"]})
+            try:
+                identity = await token_verifier.identity_headers(request.headers.get("authorization"), identity_header)
+            except TokenError as e:
+                if path not in PUBLIC_AUTH_ROUTES:
+                    return _unauthorized(str(e))
+                logger.info(f"Ignoring invalid token on public route {path}: {str(e)}")
+
+        client = _client_key(request, identity)
+        wait = rate_limiter.check(path, client)
+        if wait:
+            logger.warning(f"Rate limited {request.method} {path} from {client}")
+            return JSONResponse(
+                status_code=429,
+                content={"error": "Too many requests"},
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
+        priority = _is_priority(request, identity)
+
+        async def forward():
+            return await upstreams.forward(request, service, identity, strip_headers=(identity_header,), priority=priority)
+
+        if response_cache is None:
+            return await forward()
+        if request.method == "GET":
+            ttl = response_cache.ttl_for(path)
+            if ttl:
+                return await response_cache.serve(request, service, ttl, lambda: _buffered_forward(request, service, identity, priority))
+            return await forward()
+        if request.method in ("HEAD", "OPTIONS"):
+            return await forward()
+        # 写请求前后各失效一次：前者防止命中旧数据，后者丢弃写入期间加载的结果
+        response_cache.invalidate(service)
+        response = await forward()
+        response_cache.invalidate(service)
+        return response
     
     return await call_next(request)
 
+@app.websocket("/ws/{client_id}")
+async def websocket_proxy(websocket: WebSocket, client_id: str):
+    """中继 agent-service 的 WebSocket 会话，按 client_id 粘性路由到同一实例"""
+    identity: List[Tuple[bytes, bytes]] = []
+    if token_verifier is not None:
+        # 浏览器无法为 WebSocket 设置 Authorization 头，也接受 ?token= 查询参数
+        authorization = websocket.headers.get("authorization")
+        if not authorization and websocket.query_params.get("token"):
+            authorization = f"Bearer {websocket.query_params['token']}"
+        try:
+            identity = await token_verifier.identity_headers(authorization, identity_header)
+        except TokenError:
+            await websocket.close(code=1008)
+            return
+    client = _client_key(websocket, identity)
+    if rate_limiter.check(websocket.url.path, client):
+        logger.warning(f"Rate limited WebSocket {websocket.url.path} from {client}")
+        await websocket.close(code=1013)
+        return
+    # 令牌已在网关验证，不随查询串转发给上游（避免出现在上游的访问日志中）
+    await websocket_relay.relay(
+        websocket, "agent", client_id, identity, strip_headers=(identity_header,), strip_params=("token",)
+    )
+
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
     return {"status": "healthy"}
 
+@app.get("/admin/upstreams")
+async def upstream_stats():
+    """各上游服务实例的健康状态、熔断状态与请求统计"""
+    return upstreams.get_stats()
+
+@app.get("/admin/cache")
+async def cache_stats():
+    """响应缓存统计"""
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.get_stats()}
+
+@app.get("/admin/auth")
+async def auth_stats():
+    """网关令牌验证统计"""
+    if token_verifier is None:
+        return {"enabled": False}
+    return {"enabled": True, **token_verifier.get_stats()}
+
+@app.get("/admin/websockets")
+async def websocket_stats():
+    """WebSocket 中继统计"""
+    return websocket_relay.get_stats()
+
+@app.get("/admin/admission")
+async def admission_stats():
+    """准入控制统计：限流拒绝次数与各上游的并发占用"""
+    return {
+        **rate_limiter.get_stats(),
+        "upstreams": {
+            service: {
+                "outstanding": balancer.outstanding,
+                "max_concurrency": balancer.max_concurrency,
+                "shed": balancer.shed
+            }
+            for service, balancer in upstreams.balancers.items()
+        }
+    }
+
 @app.get("/")
 async def root():
     """根路径重定向到API文档"""
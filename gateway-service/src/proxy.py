@@ -0,0 +1,206 @@
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import asyncio
+import httpx
+import logging
+from .balancer import CircuitBreaker, Instance, LoadBalancer
+
+logger = logging.getLogger(__name__)
+
+# 逐跳头部只对单个连接有效，代理不得转发（RFC 7230 6.1）
+HOP_BY_HOP_HEADERS = {
+    b"connection",
+    b"keep-alive",
+    b"proxy-authenticate",
+    b"proxy-authorization",
+    b"te",
+    b"trailer",
+    b"transfer-encoding",
+    b"upgrade"
+}
+
+def filter_headers(raw_headers: Iterable[Tuple[bytes, bytes]], drop: Iterable[bytes] = ()) -> List[Tuple[bytes, bytes]]:
+    """去掉逐跳头部以及 Connection 头中列出的头部，保留重复头（如 Set-Cookie）"""
+    headers = [(key.lower(), value) for key, value in raw_headers]
+    excluded = set(HOP_BY_HOP_HEADERS) | set(drop)
+    for key, value in headers:
+        if key == b"connection":
+            excluded.update(token.strip().lower() for token in value.split(b","))
+    return [(key, value) for key, value in headers if key not in excluded]
+
+class UpstreamPool:
+    """为每个上游服务维护实例池，每个实例一个长期存在的 httpx.AsyncClient
+
+    连接池复用 keep-alive 连接，请求体和响应体都按块流式转发，内存占用与消息大小无关。
+    实例由 LoadBalancer 选择，受主动健康检查、被动异常剔除与熔断器保护。
+    """
+
+    def __init__(
+        self,
+        routes: Dict[str, List[str]],
+        limits: httpx.Limits,
+        timeout: httpx.Timeout,
+        strategy: str = "p2c",
+        breaker_options: Optional[Dict] = None,
+        ejection_options: Optional[Dict] = None,
+        concurrency_limits: Optional[Dict[str, int]] = None,
+        priority_reserve: float = 0.0,
+        retry_after: int = 1
+    ):
+        self.routes = routes
+        self.retry_after = retry_after
+        self.balancers = {
+            service: LoadBalancer(
+                service,
+                [
+                    Instance(
+                        url,
+                        httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout),
+                        CircuitBreaker(**(breaker_options or {}))
+                    )
+                    for url in urls
+                ],
+                strategy=strategy,
+                max_concurrency=(concurrency_limits or {}).get(service, 0),
+                priority_reserve=priority_reserve,
+                **(ejection_options or {})
+            )
+            for service, urls in routes.items()
+        }
+        self._health_task: Optional[asyncio.Task] = None
+
+    def __contains__(self, service: str) -> bool:
+        return service in self.balancers
+
+    def start_health_checks(
+        self,
+        path: str = "/health",
+        interval: float = 5,
+        timeout: float = 2,
+        unhealthy_threshold: int = 2,
+        paths: Optional[Dict[str, str]] = None
+    ) -> None:
+        """启动后台任务，周期性探测所有实例的健康检查端点（paths 按服务覆盖默认路径）"""
+        paths = paths or {}
+
+        async def loop() -> None:
+            while True:
+                await asyncio.gather(*(
+                    balancer.probe(paths.get(service, path), timeout, unhealthy_threshold)
+                    for service, balancer in self.balancers.items()
+                ))
+                await asyncio.sleep(interval)
+
+        self._health_task = asyncio.ensure_future(loop())
+
+    async def request(self, service: str, method: str, path: str, **kwargs) -> httpx.Response:
+        """网关自身向上游服务发起的请求（如获取 JWKS），同样经过负载均衡"""
+        balancer = self.balancers[service]
+        instance = balancer.choose()
+        if instance is None:
+            raise httpx.ConnectError(f"No available instance for {service}")
+        started = instance.begin()
+        try:
+            response = await instance.client.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            balancer.observe(instance, started, success=False)
+            raise
+        finally:
+            instance.end()
+        balancer.observe(instance, started, success=response.status_code < 500)
+        return response
+
+    async def forward(
+        self,
+        request: Request,
+        service: str,
+        extra_headers: Sequence[Tuple[bytes, bytes]] = (),
+        strip_headers: Iterable[bytes] = (),
+        priority: bool = False
+    ) -> Response:
+        """把请求流式转发到上游服务的一个实例，并以流的形式返回上游响应
+
+        strip_headers 中的请求头不会转发（如客户端伪造的可信身份头），extra_headers 附加在最后。
+        服务并发已满时直接返回 503（priority 请求可使用保留容量），不在网关排队。
+        """
+        balancer = self.balancers[service]
+        if not balancer.admit(priority):
+            logger.warning(f"Shedding {request.method} {request.url.path}: {service} is at its concurrency limit")
+            return JSONResponse(
+                status_code=503,
+                content={"error": f"Service {service} is overloaded"},
+                headers={"Retry-After": str(self.retry_after)}
+            )
+        url = request.url.path
+        if request.url.query:
+            url = f"{url}?{request.url.query}"
+        forwarded_for = request.headers.get("x-forwarded-for")
+        if request.client is not None:
+            client_host = request.client.host
+            forwarded_for = f"{forwarded_for}, {client_host}" if forwarded_for else client_host
+        headers = filter_headers(request.headers.raw, drop=(b"host", b"x-forwarded-for", *strip_headers))
+        if forwarded_for:
+            headers.append((b"x-forwarded-for", forwarded_for.encode()))
+        headers.append((b"x-forwarded-host", request.headers.get("host", "").encode()))
+        headers.append((b"x-forwarded-proto", request.url.scheme.encode()))
+        headers.extend(extra_headers)
+        # 没有请求体的请求不附带空的分块流
+        has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+
+        instance = balancer.choose()
+        # 连接失败时请求尚未发出，可以换一个实例重试一次
+        for attempt in range(2):
+            if instance is None:
+                logger.error(f"No available instance for {service}")
+                return JSONResponse(status_code=503, content={"error": f"Service {service} is not available"})
+            upstream_request = instance.client.build_request(
+                request.method,
+                url,
+                headers=headers,
+                content=request.stream() if has_body else None
+            )
+            started = instance.begin()
+            try:
+                upstream_response = await instance.client.send(upstream_request, stream=True)
+                break
+            except httpx.ConnectError as e:
+                instance.end()
+                balancer.observe(instance, started, success=False)
+                logger.error(f"Error connecting to {service} instance {instance.url}: {str(e)}")
+                instance = balancer.choose(exclude=instance) if attempt == 0 else None
+            except httpx.TimeoutException as e:
+                instance.end()
+                balancer.observe(instance, started, success=False)
+                logger.error(f"Timeout routing request to {service} instance {instance.url}: {str(e)}")
+                return JSONResponse(status_code=504, content={"error": f"Service {service} timed out"})
+            except httpx.HTTPError as e:
+                instance.end()
+                balancer.observe(instance, started, success=False)
+                logger.error(f"Error routing request to {service} instance {instance.url}: {str(e)}")
+                return JSONResponse(status_code=502, content={"error": f"Service {service} is not available"})
+        balancer.observe(instance, started, success=upstream_response.status_code < 500)
+
+        async def body():
+            # 响应流结束或客户端断开时都会执行 finally，释放连接与未完成计数
+            try:
+                async for chunk in upstream_response.aiter_raw():
+                    yield chunk
+            finally:
+                instance.end()
+                await upstream_response.aclose()
+
+        response = StreamingResponse(body(), status_code=upstream_response.status_code)
+        # 原样转发（可能已压缩的）响应体，Content-Length / Content-Encoding 保持不变
+        response.raw_headers = filter_headers(upstream_response.headers.raw)
+        return response
+
+    def get_stats(self) -> Dict:
+        return {service: balancer.get_stats() for service, balancer in self.balancers.items()}
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for balancer in self.balancers.values():
+            for instance in balancer.instances:
+                await instance.client.aclose()
@@ -0,0 +1,195 @@
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+from typing import Dict, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode
+import asyncio
+import logging
+import websockets
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+from .proxy import UpstreamPool, filter_headers
+
+logger = logging.getLogger(__name__)
+
+# 握手相关的请求头由到上游的新连接重新生成，不能透传
+HANDSHAKE_HEADERS = (
+    b"host",
+    b"sec-websocket-key",
+    b"sec-websocket-version",
+    b"sec-websocket-extensions",
+    b"sec-websocket-protocol",
+    b"x-forwarded-for"
+)
+
+def _close_code(code: Optional[int], abnormal: int = 1011) -> int:
+    """把收到的关闭码转换成可以在关闭帧中发送的关闭码（1005/1006/1015 只能本地报告）"""
+    if code in (None, 1005):
+        return 1000
+    if code in (1006, 1015):
+        return abnormal
+    return code
+
+class WebSocketRelay:
+    """在客户端与上游服务之间中继 WebSocket 帧
+
+    - 按 key（如 client_id）做粘性路由，同一客户端重连后仍落在同一实例上，实例故障时换到下一个
+    - 两个方向各一个任务并发转发；每个方向同一时间只有一帧在途，上游库的接收队列（max_queue）
+      和发送缓冲（write_limit）都有上限，缓冲满时停止读取，由 TCP 把背压传回发送方
+    - 任意一方关闭时把关闭码传给另一方
+    """
+
+    def __init__(
+        self,
+        upstreams: UpstreamPool,
+        open_timeout: float = 5,
+        max_message_bytes: int = 1024 * 1024,
+        max_queue: int = 16,
+        write_limit: int = 64 * 1024,
+        ping_interval: Optional[float] = 20,
+        ping_timeout: Optional[float] = 20
+    ):
+        self.upstreams = upstreams
+        self.open_timeout = open_timeout
+        self.max_message_bytes = max_message_bytes
+        self.max_queue = max_queue
+        self.write_limit = write_limit
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.active = 0
+        self.total = 0
+        self.failures = 0
+
+    def _headers(
+        self,
+        websocket: WebSocket,
+        extra_headers: Sequence[Tuple[bytes, bytes]],
+        strip_headers: Sequence[bytes]
+    ) -> list:
+        headers = filter_headers(websocket.headers.raw, drop=(*HANDSHAKE_HEADERS, *strip_headers))
+        forwarded_for = websocket.headers.get("x-forwarded-for")
+        if websocket.client is not None:
+            client_host = websocket.client.host
+            forwarded_for = f"{forwarded_for}, {client_host}" if forwarded_for else client_host
+        if forwarded_for:
+            headers.append((b"x-forwarded-for", forwarded_for.encode()))
+        headers.append((b"x-forwarded-host", websocket.headers.get("host", "").encode()))
+        headers.extend(extra_headers)
+        return [(key.decode("latin-1"), value.decode("latin-1")) for key, value in headers]
+
+    async def _connect(self, url: str, headers: list, subprotocols: Sequence[str]):
+        return await websockets.connect(
+            url,
+            extra_headers=headers,
+            subprotocols=subprotocols or None,
+            open_timeout=self.open_timeout,
+            max_size=self.max_message_bytes,
+            max_queue=self.max_queue,
+            write_limit=self.write_limit,
+            ping_interval=self.ping_interval,
+            ping_timeout=self.ping_timeout
+        )
+
+    async def relay(
+        self,
+        websocket: WebSocket,
+        service: str,
+        key: str,
+        extra_headers: Sequence[Tuple[bytes, bytes]] = (),
+        strip_headers: Sequence[bytes] = (),
+        strip_params: Sequence[str] = ()
+    ) -> None:
+        """连接上游实例后接受客户端连接并双向转发，直到任意一方关闭
+
+        strip_params 中的查询参数（如浏览器放在 URL 里的令牌）不会转发给上游。
+        """
+        balancer = self.upstreams.balancers[service]
+        path = websocket.url.path
+        query = websocket.url.query
+        if query and strip_params:
+            params = parse_qsl(query, keep_blank_values=True)
+            if any(name in strip_params for name, _ in params):
+                query = urlencode([(name, value) for name, value in params if name not in strip_params])
+        if query:
+            path = f"{path}?{query}"
+        headers = self._headers(websocket, extra_headers, strip_headers)
+        subprotocols = websocket.scope.get("subprotocols", [])
+
+        candidate = balancer.choose_sticky(key)
+        instance = upstream = None
+        # 握手失败时上游尚未处理该连接，可以换一个实例重试一次
+        for attempt in range(2):
+            if candidate is None:
+                break
+            started = candidate.begin()
+            try:
+                upstream = await self._connect("ws" + candidate.url[len("http"):] + path, headers, subprotocols)
+            except (OSError, asyncio.TimeoutError, InvalidHandshake) as e:
+                balancer.observe(candidate, started, success=False)
+                logger.error(f"Error opening WebSocket to {service} instance {candidate.url}: {str(e)}")
+            finally:
+                candidate.end()
+            if upstream is not None:
+                balancer.observe(candidate, started, success=True)
+                instance = candidate
+                break
+            candidate = balancer.choose_sticky(key, exclude=candidate) if attempt == 0 else None
+        if upstream is None:
+            self.failures += 1
+            logger.error(f"No available instance for WebSocket to {service}")
+            # 未接受的连接被关闭时，客户端收到握手拒绝
+            await websocket.close(code=1013)
+            return
+
+        await websocket.accept(subprotocol=upstream.subprotocol)
+        self.active += 1
+        self.total += 1
+        instance.websockets += 1
+        try:
+            await self._pump(websocket, upstream)
+        finally:
+            self.active -= 1
+            instance.websockets -= 1
+
+    async def _pump(self, websocket: WebSocket, upstream) -> None:
+        async def client_to_upstream() -> None:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    await upstream.close(code=_close_code(message.get("code"), abnormal=1001))
+                    return
+                if message.get("text") is not None:
+                    await upstream.send(message["text"])
+                elif message.get("bytes") is not None:
+                    await upstream.send(message["bytes"])
+
+        async def upstream_to_client() -> None:
+            async for data in upstream:
+                if isinstance(data, str):
+                    await websocket.send_text(data)
+                else:
+                    await websocket.send_bytes(data)
+
+        tasks = [asyncio.ensure_future(client_to_upstream()), asyncio.ensure_future(upstream_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, (ConnectionClosed, asyncio.CancelledError)):
+                logger.error(f"Error relaying WebSocket frames: {str(result)}")
+
+        await upstream.close()
+        if websocket.application_state == WebSocketState.CONNECTED and websocket.client_state == WebSocketState.CONNECTED:
+            try:
+                await websocket.close(code=_close_code(upstream.close_code))
+            except RuntimeError:
+                # 客户端已经断开
+                pass
+
+    def get_stats(self) -> Dict:
+        return {
+            "active": self.active,
+            "total": self.total,
+            "failures": self.failures
+        }
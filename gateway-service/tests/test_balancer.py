@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+
+from src.balancer import CircuitBreaker, Instance, LoadBalancer
+
+
+def make_instance(url="http://a", handler=None, **breaker_options):
+    transport = httpx.MockTransport(handler or (lambda request: httpx.Response(200)))
+    client = httpx.AsyncClient(base_url=url, transport=transport)
+    return Instance(url, client, CircuitBreaker(**breaker_options))
+
+
+def fail(instance, times):
+    for _ in range(times):
+        started = instance.begin()
+        instance.end()
+        instance.record(started, success=False)
+
+
+def test_breaker_opens_after_consecutive_failures_and_half_opens():
+    instance = make_instance(failure_threshold=3, open_seconds=30)
+
+    fail(instance, 2)
+    assert instance.breaker.state == "closed" and instance.available
+    fail(instance, 1)
+    assert instance.breaker.state == "open" and not instance.available
+
+    # 打开期结束：只放行一个试探请求
+    instance.breaker.opened_at -= 30
+    assert instance.available
+    started = instance.begin()
+    assert instance.breaker.state == "half_open"
+    assert not instance.available
+
+    # 试探失败重新打开，试探成功则关闭
+    instance.end()
+    instance.record(started, success=False)
+    assert instance.breaker.state == "open" and not instance.available
+    instance.breaker.opened_at -= 30
+    started = instance.begin()
+    instance.end()
+    instance.record(started, success=True)
+    assert instance.breaker.state == "closed" and instance.available
+
+
+def test_outlier_is_ejected_but_last_instance_is_kept():
+    a, b = make_instance("http://a"), make_instance("http://b")
+    balancer = LoadBalancer("knowledge", [a, b], min_requests=4, error_rate_threshold=0.5)
+
+    for instance in (a, b):
+        for _ in range(4):
+            started = instance.begin()
+            instance.end()
+            balancer.observe(instance, started, success=False)
+
+    assert a.ejected and a.ejections == 1
+    # b 是最后一个未剔除的实例，不会被剔除
+    assert not b.ejected
+    assert balancer.choose() is b
+
+
+def test_probe_only_treats_2xx_as_healthy():
+    async def scenario():
+        statuses = {"http://a": 200, "http://b": 404}
+        a = make_instance("http://a", lambda request: httpx.Response(statuses["http://a"]))
+        b = make_instance("http://b", lambda request: httpx.Response(statuses["http://b"]))
+        balancer = LoadBalancer("auth", [a, b])
+
+        for _ in range(2):
+            await balancer.probe("/health", timeout=1, unhealthy_threshold=2)
+        assert a.healthy and not b.healthy
+
+        statuses["http://b"] = 204
+        await balancer.probe("/health", timeout=1, unhealthy_threshold=2)
+        assert b.healthy
+
+    asyncio.run(scenario())
@@ -0,0 +1,101 @@
+import asyncio
+
+from starlette.requests import Request
+
+from src.cache import CachedResponse, ResponseCache
+
+
+def make_request(path="/knowledge/search", headers=None):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("gateway", 80),
+        "path": path,
+        "query_string": b"q=refund",
+        "headers": [(key.encode(), value.encode()) for key, value in (headers or {}).items()]
+    })
+
+
+def ok(body=b"result"):
+    return CachedResponse(200, [(b"content-type", b"application/json")], body)
+
+
+def test_cancelled_leader_releases_waiters():
+    async def scenario():
+        cache = ResponseCache({"/knowledge": 30})
+        started = asyncio.Event()
+        calls = []
+
+        async def slow_load():
+            calls.append("leader")
+            started.set()
+            await asyncio.sleep(3600)
+
+        async def load():
+            calls.append("waiter")
+            return ok()
+
+        leader = asyncio.create_task(cache.serve(make_request(), "knowledge", 30, slow_load))
+        await started.wait()
+        waiters = [asyncio.create_task(cache.serve(make_request(), "knowledge", 30, load)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        responses = await asyncio.wait_for(asyncio.gather(*waiters), timeout=1)
+
+        assert leader.cancelled()
+        assert [response.status_code for response in responses] == [200, 200, 200]
+        # 一个等待者接替加载，其余等待者共享它的结果
+        assert calls == ["leader", "waiter"]
+        assert not cache._inflight
+
+    asyncio.run(scenario())
+
+
+def test_write_during_load_is_not_cached():
+    async def scenario():
+        cache = ResponseCache({"/knowledge": 30})
+        release = asyncio.Event()
+
+        async def load():
+            await release.wait()
+            return ok(b"stale")
+
+        pending = asyncio.create_task(cache.serve(make_request(), "knowledge", 30, load))
+        await asyncio.sleep(0)
+        cache.invalidate("knowledge")
+        release.set()
+        response = await pending
+
+        assert response.body == b"stale"
+        assert cache.get_stats()["entries"] == 0
+
+        async def fresh():
+            return ok(b"fresh")
+
+        response = await cache.serve(make_request(), "knowledge", 30, fresh)
+        assert response.body == b"fresh"
+        assert cache.get_stats()["entries"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_matching_if_none_match_is_answered_from_cache():
+    async def scenario():
+        cache = ResponseCache({"/knowledge": 30})
+
+        async def load():
+            return ok()
+
+        first = await cache.serve(make_request(), "knowledge", 30, load)
+        etag = first.headers["etag"]
+
+        async def unexpected():
+            raise AssertionError("upstream should not be called")
+
+        response = await cache.serve(make_request(headers={"if-none-match": etag}), "knowledge", 30, unexpected)
+        assert response.status_code == 304
+        assert response.headers["x-cache"] == "HIT"
+        assert cache.get_stats()["not_modified"] == 1
+
+    asyncio.run(scenario())
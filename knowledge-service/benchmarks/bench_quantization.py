@@ -0,0 +1,62 @@
+"""压缩存储（int8 / pq）召回率、延迟与每向量内存对比
+
+在 knowledge-service 目录下运行:
+    python -m benchmarks.bench_quantization --size 100000 --rerank 1,4,10
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_ann_recall import clustered_vectors, fill, run_queries
+from src.quantization import ProductQuantizer, ScalarQuantizer
+from src.vector_store import VectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--subvectors", type=int, default=48)
+    parser.add_argument("--rerank", default="1,4,10")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((args.clusters, args.dimension), dtype=np.float32)
+    data = clustered_vectors(rng, centers, args.size)
+    queries = clustered_vectors(rng, centers, args.queries)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        exact = VectorStore(dimension=args.dimension, data_dir=f"{data_dir}/exact")
+        fill(exact, data, args.batch_size)
+        truth, exact_ms = run_queries(exact, queries, args.limit)
+
+        print(f"{'mode':>12} {'bytes/vec':>10} {'recall@' + str(args.limit):>10} {'latency_ms':>11}")
+        print(f"{'float32':>12} {4 * args.dimension:>10} {1.0:>10.3f} {exact_ms:>11.2f}")
+
+        quantizers = {
+            "int8": lambda: ScalarQuantizer(),
+            "pq": lambda: ProductQuantizer(subvectors=args.subvectors),
+        }
+        for name, make in quantizers.items():
+            store = VectorStore(dimension=args.dimension, data_dir=f"{data_dir}/{name}", quantizer=make())
+            start = time.perf_counter()
+            fill(store, data, args.batch_size)
+            build_s = time.perf_counter() - start
+            bytes_per_vector = store.get_stats()["quantization"]["bytes_per_vector"]
+            for factor in (int(f) for f in args.rerank.split(",")):
+                store.rerank_factor = factor
+                found, ms = run_queries(store, queries, args.limit)
+                recall = np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(truth, found)])
+                label = f"{name}/r{factor}"
+                print(f"{label:>12} {bytes_per_vector:>10} {recall:>10.3f} {ms:>11.2f}")
+            print(f"{'':>12} ({name} build incl. training: {build_s:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""分片检索吞吐随分片（进程）数的扩展性
+
+数据按 id 哈希分布到各分片，多个客户端线程并发发起检索，统计每秒查询数。
+分片数不超过 CPU 核数时吞吐应接近线性增长；为排除 BLAS 自身多线程的干扰，
+建议以 OPENBLAS_NUM_THREADS=1 运行。
+
+在 knowledge-service 目录下运行:
+    OPENBLAS_NUM_THREADS=1 python -m benchmarks.bench_sharding --size 400000 --shards 1,2,4,8
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.bench_ann_recall import clustered_vectors, fill
+from src.shards import ShardedVectorStore
+from src.vector_store import VectorStore
+
+
+def throughput(store, queries, limit, clients):
+    """clients 个线程并发逐条检索，返回 (每秒查询数, 平均延迟毫秒)"""
+    def run(chunk):
+        latencies = []
+        for query in chunk:
+            start = time.perf_counter()
+            store.search(query, limit)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = [t for chunk in pool.map(run, np.array_split(queries, clients)) for t in chunk]
+    elapsed = time.perf_counter() - start
+    return len(queries) / elapsed, np.mean(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=400000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--shards", default="1,2,4,8")
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((args.clusters, args.dimension), dtype=np.float32)
+    data = clustered_vectors(rng, centers, args.size)
+    queries = clustered_vectors(rng, centers, args.queries)
+    print(f"cpu cores: {os.cpu_count()}")
+
+    baseline = VectorStore(dimension=args.dimension)
+    fill(baseline, data, args.batch_size)
+    qps, latency = throughput(baseline, queries, args.limit, args.clients)
+    print(f"{'shards':>10} {'qps':>10} {'latency_ms':>11} {'speedup':>8}")
+    print(f"{'in-proc':>10} {qps:>10.1f} {latency:>11.2f} {1.0:>8.2f}")
+
+    for num_shards in (int(n) for n in args.shards.split(",")):
+        # 积压上限不低于客户端数，任何分片都不应被跳过，否则吞吐里混入了部分结果
+        store = ShardedVectorStore(
+            num_shards, {"dimension": args.dimension}, timeout_ms=60000, max_backlog=args.clients
+        )
+        try:
+            fill(store, data, args.batch_size)
+            store.search(queries[0], args.limit)
+            shard_qps, latency = throughput(store, queries, args.limit, args.clients)
+            stats = store.get_stats()
+            skipped = stats["shard_skipped"] + stats["shard_timeouts"]
+            print(f"{num_shards:>10} {shard_qps:>10.1f} {latency:>11.2f} {shard_qps / qps:>8.2f}")
+            if skipped:
+                raise SystemExit(f"{skipped} shard search(es) were skipped or timed out, qps counts partial results")
+        finally:
+            store.shutdown()
+
+
+if __name__ == "__main__":
+    main()
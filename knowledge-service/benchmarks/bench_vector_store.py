@@ -0,0 +1,75 @@
+"""VectorStore 检索性能基准
+
+在 knowledge-service 目录下运行:
+    python -m benchmarks.bench_vector_store --sizes 1000,10000,100000,1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.document import Document
+from src.vector_store import VectorStore
+
+
+def naive_search(embeddings, query, limit):
+    """旧实现：逐文档计算余弦相似度再全量排序"""
+    similarities = [
+        np.dot(query, emb) / (np.linalg.norm(query) * np.linalg.norm(emb))
+        for emb in embeddings
+    ]
+    return np.argsort(similarities)[-limit:][::-1]
+
+
+def build_store(size, dimension, batch_size, rng):
+    store = VectorStore(dimension=dimension)
+    start = time.perf_counter()
+    for offset in range(0, size, batch_size):
+        count = min(batch_size, size - offset)
+        vectors = rng.standard_normal((count, dimension), dtype=np.float32)
+        documents = [Document.construct(id=str(offset + i), content="", metadata={}) for i in range(count)]
+        store.add_documents(documents, vectors)
+    return store, time.perf_counter() - start
+
+
+def time_queries(fn, queries):
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--naive-max", type=int, default=100000,
+                        help="超过该规模时跳过旧实现（太慢）")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, args.dimension), dtype=np.float32)
+
+    print(f"{'size':>10} {'ingest_s':>10} {'search_ms':>10} {'naive_ms':>10} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        store, ingest = build_store(size, args.dimension, args.batch_size, rng)
+        fast = time_queries(lambda q: store.search(q, args.limit), queries)
+
+        naive = float("nan")
+        if size <= args.naive_max:
+            rows = list(store.embeddings)
+            naive = time_queries(lambda q: naive_search(rows, q, args.limit), queries[:3])
+            # 校验两种实现给出相同的 top-k
+            expected = naive_search(rows, queries[0], args.limit)
+            got = [int(r["document"].id) for r in store.search(queries[0], args.limit)]
+            assert list(expected) == got, "top-k mismatch between naive and vectorized search"
+
+        print(f"{size:>10} {ingest:>10.2f} {fast:>10.2f} {naive:>10.2f} {naive / fast:>8.1f}")
+        del store
+
+
+if __name__ == "__main__":
+    main()
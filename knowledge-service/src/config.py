@@ -0,0 +1,52 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 向量索引: flat 为精确检索, ivf 为倒排近似检索
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "256"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+
+# 持久化目录（为空时只保存在内存中）与段数量上限
+KNOWLEDGE_DATA_DIR = os.getenv("KNOWLEDGE_DATA_DIR", "")
+MAX_SEGMENTS = int(os.getenv("MAX_SEGMENTS", "8"))
+# 持久化时写入先缓冲在内存中，攒够行数或经过间隔（毫秒）后写成一个段；未落盘的写入在崩溃时丢失，
+# SEGMENT_FLUSH_ROWS=1 时每次写入都立即落盘
+SEGMENT_FLUSH_ROWS = int(os.getenv("SEGMENT_FLUSH_ROWS", "256"))
+SEGMENT_FLUSH_INTERVAL_MS = float(os.getenv("SEGMENT_FLUSH_INTERVAL_MS", "1000"))
+
+# 批量导入时每批嵌入和写入的文档数
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "256"))
+
+# 嵌入缓存：内存层字节上限；启用持久化目录时可把缓存写到磁盘，磁盘层按字节预算淘汰最久未访问的条目
+EMBEDDING_CACHE_BYTES = int(os.getenv("EMBEDDING_CACHE_BYTES", str(64 * 1024 * 1024)))
+EMBEDDING_CACHE_DISK = os.getenv("EMBEDDING_CACHE_DISK", "true").lower() == "true"
+EMBEDDING_CACHE_DISK_BYTES = int(os.getenv("EMBEDDING_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+
+# 建立倒排索引、可在检索时过滤的元数据字段（逗号分隔）
+METADATA_INDEX_KEYS = [key.strip() for key in os.getenv("METADATA_INDEX_KEYS", "").split(",") if key.strip()]
+
+# 向量压缩: none / int8 / pq（需要 KNOWLEDGE_DATA_DIR 保存全精度向量用于重排）
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", "48"))
+QUANTIZATION_RERANK_FACTOR = int(os.getenv("QUANTIZATION_RERANK_FACTOR", "10"))
+
+# 大文档流式上传时的分块大小与重叠（字符数）
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+
+# 检索执行器：微批时间窗口、每批最大查询数、线程池大小
+SEARCH_BATCH_WINDOW_MS = float(os.getenv("SEARCH_BATCH_WINDOW_MS", "2"))
+SEARCH_MAX_BATCH_SIZE = int(os.getenv("SEARCH_MAX_BATCH_SIZE", "32"))
+SEARCH_POOL_SIZE = int(os.getenv("SEARCH_POOL_SIZE", "4"))
+
+# 删除文档的墓碑比例超过阈值且数量足够时，后台压实存储并重建索引
+COMPACTION_TOMBSTONE_RATIO = float(os.getenv("COMPACTION_TOMBSTONE_RATIO", "0.2"))
+COMPACTION_MIN_DELETED = int(os.getenv("COMPACTION_MIN_DELETED", "1000"))
+
+# 分片数（大于 1 时启用多进程分片检索）与分片检索超时（毫秒），超时的分片被跳过；
+# 仍有超时检索在执行、且积压的检索达到 SHARD_MAX_BACKLOG 的分片不再接收新检索，直到它追上
+KNOWLEDGE_SHARDS = int(os.getenv("KNOWLEDGE_SHARDS", "1"))
+SHARD_TIMEOUT_MS = float(os.getenv("SHARD_TIMEOUT_MS", "2000"))
+SHARD_MAX_BACKLOG = int(os.getenv("SHARD_MAX_BACKLOG", "4"))
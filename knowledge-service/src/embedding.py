@@ -1,22 +1,64 @@
 import numpy as np
-from typing import List
+from typing import List, Optional
 import logging
+from .embedding_cache import EmbeddingCache, cache_key
 
 logger = logging.getLogger(__name__)
 
 class EmbeddingModel:
-    def __init__(self, dimension: int = 384):
+    def __init__(
+        self,
+        dimension: int = 384,
+        model_name: str = "random-baseline",
+        cache: Optional[EmbeddingCache] = None
+    ):
         self.dimension = dimension
+        self.model_name = model_name
+        self.cache = cache
         logger.info(f"Embedding model initialized with dimension {dimension}")
-    
+
+    @property
+    def model_id(self) -> str:
+        """模型标识，参与缓存键计算，换模型后旧缓存自然失效"""
+        return f"{self.model_name}:{self.dimension}"
+
     def embed_text(self, text: str) -> np.ndarray:
         """将文本转换为向量嵌入"""
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """批量转换文本为向量嵌入，返回 (len(texts), dimension) 矩阵
+
+        命中缓存的文本直接复用；未命中的文本去重后整批计算一次。
+        """
+        if self.cache is None:
+            return self._compute_batch(texts)
+
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        pending = {}
+        for i, text in enumerate(texts):
+            key = cache_key(text, self.model_id)
+            if key in pending:
+                pending[key][1].append(i)
+                continue
+            vector = self.cache.get(key)
+            if vector is not None:
+                embeddings[i] = vector
+            else:
+                pending[key] = (text, [i])
+
+        if pending:
+            computed = self._compute_batch([text for text, _ in pending.values()])
+            for (key, (_, positions)), vector in zip(pending.items(), computed):
+                self.cache.put(key, vector)
+                embeddings[positions] = vector
+        return embeddings
+
+    def _compute_batch(self, texts: List[str]) -> np.ndarray:
+        """模型前向计算"""
         # 这里使用简单的随机向量作为示例
-        # 实际应用中应该使用预训练的语言模型
-        embedding = np.random.randn(self.dimension)
-        embedding = embedding / np.linalg.norm(embedding)
-        return embedding
-    
-    def embed_batch(self, texts: List[str]) -> List[np.ndarray]:
-        """批量转换文本为向量嵌入"""
-        return [self.embed_text(text) for text in texts] 
\ No newline at end of file
+        # 实际应用中应该使用预训练的语言模型，整批一次前向计算
+        embeddings = np.random.randn(len(texts), self.dimension).astype(np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
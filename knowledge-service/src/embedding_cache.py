@@ -0,0 +1,186 @@
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """缓存键用的文本规范化：只折叠空白；大小写和全角/半角可能改变模型的分词，保持原样"""
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+def cache_key(text: str, model_id: str) -> str:
+    """内容寻址键：模型标识 + 规范化文本的 SHA-256"""
+    payload = f"{model_id}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+class EmbeddingCache:
+    """嵌入缓存：进程内按字节数限制的 LRU，可选磁盘层（重启后仍可命中）
+
+    磁盘层以文件修改时间作为最后访问时间（命中时更新），总字节数超过 max_disk_bytes 时
+    删除最久未访问的文件，直到降到预算的 90%。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        directory: Optional[str] = None,
+        max_disk_bytes: int = 1024 * 1024 * 1024
+    ):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            # 统计已有文件的大小可能较慢，放到后台线程
+            threading.Thread(target=self._scan_disk, daemon=True).start()
+
+    def _path(self, key: str) -> str:
+        # 两级目录分散文件，避免单目录下文件过多
+        return os.path.join(self.directory, key[:2], key + ".f32")
+
+    def _disk_files(self) -> List[Tuple[float, int, str]]:
+        """列出磁盘层的缓存文件：(最后访问时间, 字节数, 路径)"""
+        files = []
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if not entry.name.endswith(".f32"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _scan_disk(self) -> None:
+        try:
+            total = sum(size for _, size, _ in self._disk_files())
+        except OSError as e:
+            logger.warning(f"Failed to scan embedding cache directory: {str(e)}")
+            return
+        with self._lock:
+            self._disk_bytes += total
+        self._maybe_prune()
+
+    def _maybe_prune(self) -> None:
+        """磁盘层超过字节预算时删除最久未访问的文件；已有线程在清理时直接返回"""
+        if self._disk_bytes <= self.max_disk_bytes or not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            files = sorted(self._disk_files())
+            total = sum(size for _, size, _ in files)
+            target = self.max_disk_bytes * 0.9
+            removed = 0
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+            with self._lock:
+                # 以重新统计的结果为准，纠正累计误差
+                self._disk_bytes = total
+                self.disk_evictions += removed
+            if removed:
+                logger.info(f"Pruned {removed} embedding cache file(s), {total} bytes left on disk")
+        except OSError as e:
+            logger.warning(f"Failed to prune embedding cache directory: {str(e)}")
+        finally:
+            self._prune_lock.release()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        """放入内存 LRU 并按字节上限淘汰最久未用的条目（需持有锁）"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = vector
+        self._bytes += vector.nbytes
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+        if self.directory:
+            path = self._path(key)
+            try:
+                vector = np.fromfile(path, dtype=np.float32)
+                # 更新修改时间，作为磁盘层淘汰依据的最后访问时间
+                os.utime(path)
+            except (OSError, ValueError):
+                vector = None
+            if vector is not None and vector.size:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, vector)
+                return vector
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        # 复制一份，避免缓存条目引用整批结果矩阵
+        vector = np.array(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+        if self.directory:
+            path = self._path(key)
+            if os.path.exists(path):
+                return
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                vector.tofile(tmp_path)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Failed to write embedding cache entry {key}: {str(e)}")
+                return
+            with self._lock:
+                self._disk_bytes += vector.nbytes
+            self._maybe_prune()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "disk_enabled": bool(self.directory),
+                "disk_bytes": self._disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "disk_evictions": self.disk_evictions
+            }
@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class _PendingSearch:
+    __slots__ = ("query", "limit", "nprobe", "filters", "future")
+
+    def __init__(self, query: str, limit: int, nprobe: Optional[int], filters: Optional[Dict], future):
+        self.query = query
+        self.limit = limit
+        self.nprobe = nprobe
+        self.filters = filters
+        self.future = future
+
+class SearchExecutor:
+    """检索执行器：把 CPU 密集的嵌入与打分移出事件循环，并对查询做微批处理
+
+    在 batch_window_ms 内到达的查询（最多 max_batch_size 条）合并为一批，
+    在线程池中一次性嵌入，并按 (nprobe, filters) 分组调用 VectorStore.search_batch，
+    精确检索时即为一次矩阵-矩阵乘法。NumPy 计算期间释放 GIL，多个批次可并行。
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        embedding_model,
+        batch_window_ms: float = 2.0,
+        max_batch_size: int = 32,
+        pool_size: int = 4
+    ):
+        self.vector_store = vector_store
+        self.embedding_model = embedding_model
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self.pool_size = max(1, pool_size)
+        self._pool = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="search")
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._in_flight = 0
+        self.batches = 0
+        self.queries = 0
+        self.max_observed_batch = 0
+
+    def _ensure_started(self) -> None:
+        """在当前事件循环中惰性启动分发任务"""
+        if self._dispatcher is None or self._dispatcher.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.pool_size)
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    async def search(
+        self,
+        query: str,
+        limit: int = 5,
+        nprobe: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        """提交一条查询，等待所在批次完成后返回该查询的 top-k"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingSearch(query, limit, nprobe, filters, future))
+        return await future
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # 线程池占满时在此等待，新查询继续在队列中累积成更大的批次
+            await self._slots.acquire()
+            self._in_flight += 1
+            asyncio.ensure_future(self._execute(batch))
+
+    async def _execute(self, batch: List[_PendingSearch]) -> None:
+        try:
+            outcomes = await asyncio.get_running_loop().run_in_executor(self._pool, self._run_batch, batch)
+        except Exception as e:
+            outcomes = [e] * len(batch)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+        self.batches += 1
+        self.queries += len(batch)
+        self.max_observed_batch = max(self.max_observed_batch, len(batch))
+        for pending, outcome in zip(batch, outcomes):
+            if pending.future.done():
+                continue
+            if isinstance(outcome, Exception):
+                pending.future.set_exception(outcome)
+            else:
+                pending.future.set_result(outcome)
+
+    def _run_batch(self, batch: List[_PendingSearch]) -> List[Any]:
+        """在工作线程中执行：整批嵌入，再按检索参数分组批量打分"""
+        start = time.perf_counter()
+        embeddings = self.embedding_model.embed_batch([pending.query for pending in batch])
+        groups: Dict[Any, List[int]] = {}
+        for i, pending in enumerate(batch):
+            key = (pending.nprobe, json.dumps(pending.filters, sort_keys=True) if pending.filters else None)
+            groups.setdefault(key, []).append(i)
+
+        outcomes: List[Any] = [None] * len(batch)
+        for positions in groups.values():
+            first = batch[positions[0]]
+            limit = max(batch[i].limit for i in positions)
+            try:
+                results = self.vector_store.search_batch(
+                    embeddings[positions], limit, nprobe=first.nprobe, filters=first.filters
+                )
+                for i, result in zip(positions, results):
+                    outcomes[i] = result[:max(batch[i].limit, 0)]
+            except Exception as e:
+                for i in positions:
+                    outcomes[i] = e
+
+        logger.debug(f"Search batch of {len(batch)} finished in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return outcomes
+
+    def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        self._pool.shutdown(wait=False)
+
+    def get_stats(self) -> Dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight_batches": self._in_flight,
+            "batches": self.batches,
+            "queries": self.queries,
+            "average_batch_size": self.queries / self.batches if self.batches else 0.0,
+            "max_batch_size_observed": self.max_observed_batch,
+            "batch_window_ms": self.batch_window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "pool_size": self.pool_size
+        }
@@ -0,0 +1,179 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class FlatIndex:
+    """精确检索：不做候选裁剪，由 VectorStore 对全部向量打分"""
+
+    index_type = "flat"
+    needs_training = False
+
+    def add(self, vectors: np.ndarray, start_row: int) -> None:
+        """登记新增的向量（精确检索无需处理）"""
+        pass
+
+    def build(self, blocks: Sequence[Tuple[int, np.ndarray]]) -> None:
+        """根据已有向量重建索引（精确检索无需处理）"""
+        pass
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> Optional[np.ndarray]:
+        """返回候选行号，None 表示全部行"""
+        return None
+
+    def reset(self) -> None:
+        pass
+
+    def get_stats(self) -> Dict:
+        return {"type": self.index_type}
+
+class IVFIndex:
+    """倒排文件索引：球面 k-means 粗量化，检索时只扫描最近的 nprobe 个簇"""
+
+    index_type = "ivf"
+
+    def __init__(
+        self,
+        nlist: int = 256,
+        nprobe: int = 8,
+        train_size: Optional[int] = None,
+        iterations: int = 10,
+        seed: int = 0
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        # 每个簇至少约 39 个训练样本，k-means 才比较稳定
+        self.train_size = train_size or nlist * 39
+        self.iterations = iterations
+        self.seed = seed
+        self.reset()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def needs_training(self) -> bool:
+        """未训练且已积累足够向量时需要调用 build"""
+        return not self.is_trained and self._untrained_rows >= self.train_size
+
+    def reset(self) -> None:
+        self.centroids: Optional[np.ndarray] = None
+        self._untrained_rows = 0
+        self._lists: List[np.ndarray] = []
+        self._list_sizes: Optional[np.ndarray] = None
+
+    def _assign(self, vectors: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        """将向量分配到最相似的簇中心，分块计算以限制内存"""
+        assignments = np.empty(vectors.shape[0], dtype=np.int64)
+        for start in range(0, vectors.shape[0], chunk_size):
+            block = vectors[start:start + chunk_size]
+            assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    def train(self, vectors: np.ndarray) -> None:
+        """用球面 k-means 训练簇中心"""
+        rng = np.random.default_rng(self.seed)
+        if vectors.shape[0] > self.train_size:
+            sample = vectors[rng.choice(vectors.shape[0], self.train_size, replace=False)]
+        else:
+            sample = np.asarray(vectors)
+        nlist = min(self.nlist, sample.shape[0])
+
+        centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            self.centroids = centroids
+            assignments = self._assign(sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+            # 空簇重新随机选取一个样本作为中心
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        self.centroids = centroids
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._list_sizes = np.zeros(nlist, dtype=np.int64)
+        logger.info(f"IVF index trained with {nlist} lists on {sample.shape[0]} vectors")
+
+    def _append(self, rows: np.ndarray, assignments: np.ndarray) -> None:
+        """把行号追加到各自的倒排列表，列表容量成倍增长"""
+        order = np.argsort(assignments, kind="stable")
+        rows, assignments = rows[order], assignments[order]
+        lists, starts = np.unique(assignments, return_index=True)
+        ends = np.append(starts[1:], len(rows))
+        for list_id, start, end in zip(lists, starts, ends):
+            size = self._list_sizes[list_id]
+            needed = size + (end - start)
+            storage = self._lists[list_id]
+            if needed > storage.shape[0]:
+                grown = np.empty(max(needed, storage.shape[0] * 2, 16), dtype=np.int64)
+                grown[:size] = storage[:size]
+                storage = self._lists[list_id] = grown
+            storage[size:needed] = rows[start:end]
+            self._list_sizes[list_id] = needed
+
+    def add(self, vectors: np.ndarray, start_row: int) -> None:
+        """登记从 start_row 开始的一批新向量；未训练时只记录行数"""
+        if not self.is_trained:
+            self._untrained_rows = max(self._untrained_rows, start_row + vectors.shape[0])
+            return
+        if vectors.shape[0]:
+            rows = np.arange(start_row, start_row + vectors.shape[0], dtype=np.int64)
+            self._append(rows, self._assign(vectors))
+
+    def build(self, blocks: Sequence[Tuple[int, np.ndarray]]) -> None:
+        """用 (起始行号, 向量矩阵) 分块数据训练簇中心并重建全部倒排列表
+
+        向量不足 train_size 时保持未训练状态，检索退化为精确扫描。
+        """
+        self.reset()
+        total = sum(matrix.shape[0] for _, matrix in blocks)
+        if total < self.train_size:
+            self._untrained_rows = total
+            return
+        rng = np.random.default_rng(self.seed)
+        rows = np.sort(rng.choice(total, self.train_size, replace=False))
+        sample = np.concatenate([
+            matrix[rows[(rows >= start) & (rows < start + matrix.shape[0])] - start]
+            for start, matrix in blocks
+        ])
+        self.train(sample)
+        for start, matrix in blocks:
+            self.add(matrix, start)
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> Optional[np.ndarray]:
+        """返回最近 nprobe 个簇中的行号；未训练时返回 None（退化为精确检索）"""
+        if not self.is_trained:
+            return None
+        nprobe = max(1, min(self.nprobe if nprobe is None else nprobe, self.centroids.shape[0]))
+        centroid_scores = self.centroids @ query
+        if nprobe < centroid_scores.shape[0]:
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(centroid_scores.shape[0])
+        return np.concatenate([self._lists[i][:self._list_sizes[i]] for i in probe])
+
+    def get_stats(self) -> Dict:
+        stats = {
+            "type": self.index_type,
+            "trained": self.is_trained,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe
+        }
+        if self.is_trained:
+            stats["largest_list"] = int(self._list_sizes.max())
+        return stats
+
+def create_index(index_type: str = "flat", **kwargs):
+    """根据配置创建向量索引"""
+    if index_type == "flat":
+        return FlatIndex()
+    if index_type == "ivf":
+        return IVFIndex(**kwargs)
+    raise ValueError(f"Unknown vector index type: {index_type}")
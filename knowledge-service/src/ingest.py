@@ -0,0 +1,169 @@
+from typing import AsyncIterator, List, Tuple, TypeVar, Union
+import asyncio
+import codecs
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+async def iter_text(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """把字节流增量解码为 UTF-8 文本（正确处理跨块的多字节字符）"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in stream:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+async def iter_records(
+    stream: AsyncIterator[bytes]
+) -> AsyncIterator[Tuple[int, Union[dict, Exception]]]:
+    """流式解析请求体中的记录，逐条产出 (序号, 记录或解析错误)
+
+    支持 NDJSON（每行一条）和 JSON 数组两种格式，根据第一个非空白字符自动识别。
+    NDJSON 中的坏行只影响该行；JSON 数组一旦出现语法错误便无法重新同步，解析到此为止。
+    """
+    texts = iter_text(stream)
+    buffer = ""
+    async for text in texts:
+        buffer += text
+        if buffer.lstrip(_WHITESPACE):
+            break
+    buffer = buffer.lstrip(_WHITESPACE)
+    if not buffer:
+        return
+
+    if buffer.startswith("["):
+        async for item in _iter_array(texts, buffer[1:]):
+            yield item
+    else:
+        async for item in _iter_ndjson(texts, buffer):
+            yield item
+
+async def _iter_ndjson(texts: AsyncIterator[str], buffer: str):
+    index = 0
+
+    def parse(line: str):
+        try:
+            return json.loads(line)
+        except ValueError as e:
+            return ValueError(f"Invalid JSON: {e}")
+
+    while True:
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                yield index, parse(line)
+                index += 1
+        try:
+            buffer += await texts.__anext__()
+        except StopAsyncIteration:
+            break
+    if buffer.strip():
+        yield index, parse(buffer)
+
+async def _iter_array(texts: AsyncIterator[str], buffer: str):
+    index = 0
+    position = 0
+    finished = False
+    while True:
+        # 尽可能多地从缓冲区中解出完整的数组元素
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE + ",":
+                position += 1
+            if position >= len(buffer):
+                break
+            if buffer[position] == "]":
+                return
+            try:
+                record, position = _decoder.raw_decode(buffer, position)
+            except ValueError as e:
+                if finished:
+                    yield index, ValueError(f"Invalid JSON array element: {e}")
+                    return
+                break
+            yield index, record
+            index += 1
+        if finished:
+            yield index, ValueError("Unterminated JSON array")
+            return
+        # 丢弃已解析部分，避免缓冲区无限增长
+        buffer, position = buffer[position:], 0
+        try:
+            buffer += await texts.__anext__()
+        except StopAsyncIteration:
+            finished = True
+
+async def iter_chunks(
+    texts: AsyncIterator[str],
+    chunk_size: int = 1000,
+    overlap: int = 200
+) -> AsyncIterator[Tuple[int, str]]:
+    """把增量到达的文本切成相互重叠的块，产出 (起始字符偏移, 块文本)
+
+    尽量在 chunk_size 附近的空白处断开以免截断单词；缓冲区最多保留一个块，
+    内存占用与文档总大小无关。
+    """
+    if chunk_size <= 0 or overlap < 0 or overlap > chunk_size // 2:
+        raise ValueError("chunk_size must be positive and overlap at most half of it")
+    buffer = ""
+    offset = 0
+    emitted = False
+    async for text in texts:
+        buffer += text
+        while len(buffer) >= chunk_size:
+            split = chunk_size
+            boundary = max(buffer.rfind(" ", 0, chunk_size), buffer.rfind("\n", 0, chunk_size))
+            if boundary > chunk_size // 2:
+                split = boundary + 1
+            yield offset, buffer[:split]
+            emitted = True
+            advance = max(split - overlap, 1)
+            buffer = buffer[advance:]
+            offset += advance
+    # 末尾剩余部分：若只是上一块的重叠内容则不再单独成块
+    if buffer.strip() and (not emitted or len(buffer) > overlap):
+        yield offset, buffer
+
+async def batched(items: AsyncIterator[T], size: int) -> AsyncIterator[List[T]]:
+    """把异步迭代器按固定大小分批"""
+    batch: List[T] = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def prefetch(items: AsyncIterator[T], depth: int = 2) -> AsyncIterator[T]:
+    """在后台任务中提前读取最多 depth 项，使读取上传与嵌入/写入并行且有界"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+    done = object()
+
+    async def produce():
+        try:
+            async for item in items:
+                await queue.put(item)
+            await queue.put(done)
+        except Exception as e:
+            await queue.put(e)
+
+    task = asyncio.ensure_future(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        task.cancel()
@@ -1,8 +1,30 @@
-from fastapi import FastAPI, HTTPException
-from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from typing import Dict, List, Optional, Tuple
+import json
 import logging
+import os
+import uuid
 from .vector_store import VectorStore
+from .index import create_index
+from .quantization import create_quantizer
+from .embedding import EmbeddingModel
+from .embedding_cache import EmbeddingCache
+from .executor import SearchExecutor
+from .shards import ShardedVectorStore
 from .document import Document, DocumentCreate
+from .ingest import batched, iter_chunks, iter_records, iter_text, prefetch
+from .metadata_index import FilterError
+from .config import (
+    VECTOR_INDEX_TYPE, IVF_NLIST, IVF_NPROBE, KNOWLEDGE_DATA_DIR, MAX_SEGMENTS,
+    SEGMENT_FLUSH_ROWS, SEGMENT_FLUSH_INTERVAL_MS,
+    BULK_BATCH_SIZE, EMBEDDING_CACHE_BYTES, EMBEDDING_CACHE_DISK, EMBEDDING_CACHE_DISK_BYTES, METADATA_INDEX_KEYS,
+    VECTOR_QUANTIZATION, PQ_SUBVECTORS, QUANTIZATION_RERANK_FACTOR, CHUNK_SIZE, CHUNK_OVERLAP,
+    SEARCH_BATCH_WINDOW_MS, SEARCH_MAX_BATCH_SIZE, SEARCH_POOL_SIZE,
+    COMPACTION_TOMBSTONE_RATIO, COMPACTION_MIN_DELETED, KNOWLEDGE_SHARDS, SHARD_TIMEOUT_MS,
+    SHARD_MAX_BACKLOG
+)
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -10,8 +32,71 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Knowledge Service")
 
-# 初始化向量存储
-vector_store = VectorStore()
+# 初始化向量存储和嵌入模型
+cache_dir = None
+if KNOWLEDGE_DATA_DIR and EMBEDDING_CACHE_DISK:
+    cache_dir = os.path.join(KNOWLEDGE_DATA_DIR, "embedding_cache")
+embedding_model = EmbeddingModel(
+    cache=EmbeddingCache(
+        max_bytes=EMBEDDING_CACHE_BYTES,
+        directory=cache_dir,
+        max_disk_bytes=EMBEDDING_CACHE_DISK_BYTES
+    )
+)
+index_options = {"nlist": IVF_NLIST, "nprobe": IVF_NPROBE} if VECTOR_INDEX_TYPE == "ivf" else {}
+if KNOWLEDGE_SHARDS > 1:
+    # 分片模式：文档按 id 哈希分布到多个工作进程，检索时并发分发再合并
+    vector_store = ShardedVectorStore(
+        KNOWLEDGE_SHARDS,
+        {
+            "dimension": embedding_model.dimension,
+            "index_type": VECTOR_INDEX_TYPE,
+            "index_options": index_options,
+            "data_dir": KNOWLEDGE_DATA_DIR or None,
+            "max_segments": MAX_SEGMENTS,
+            "metadata_keys": METADATA_INDEX_KEYS,
+            "quantization": VECTOR_QUANTIZATION,
+            "quantizer_options": {"subvectors": PQ_SUBVECTORS},
+            "rerank_factor": QUANTIZATION_RERANK_FACTOR,
+            "compaction_ratio": COMPACTION_TOMBSTONE_RATIO,
+            "compaction_min_deleted": COMPACTION_MIN_DELETED,
+            "flush_rows": SEGMENT_FLUSH_ROWS,
+            "flush_interval": SEGMENT_FLUSH_INTERVAL_MS / 1000
+        },
+        timeout_ms=SHARD_TIMEOUT_MS,
+        max_backlog=SHARD_MAX_BACKLOG
+    )
+else:
+    vector_store = VectorStore(
+        dimension=embedding_model.dimension,
+        index=create_index(VECTOR_INDEX_TYPE, **index_options),
+        data_dir=KNOWLEDGE_DATA_DIR or None,
+        max_segments=MAX_SEGMENTS,
+        metadata_keys=METADATA_INDEX_KEYS,
+        quantizer=create_quantizer(VECTOR_QUANTIZATION, subvectors=PQ_SUBVECTORS),
+        rerank_factor=QUANTIZATION_RERANK_FACTOR,
+        compaction_ratio=COMPACTION_TOMBSTONE_RATIO,
+        compaction_min_deleted=COMPACTION_MIN_DELETED,
+        flush_rows=SEGMENT_FLUSH_ROWS,
+        flush_interval=SEGMENT_FLUSH_INTERVAL_MS / 1000
+    )
+# 检索在线程池中执行并做微批处理，避免阻塞事件循环
+search_executor = SearchExecutor(
+    vector_store,
+    embedding_model,
+    batch_window_ms=SEARCH_BATCH_WINDOW_MS,
+    max_batch_size=SEARCH_MAX_BATCH_SIZE,
+    pool_size=SEARCH_POOL_SIZE
+)
+
+@app.on_event("shutdown")
+async def shutdown():
+    search_executor.shutdown()
+    if isinstance(vector_store, ShardedVectorStore):
+        vector_store.shutdown()
+    else:
+        # 写出尚未落盘的写入
+        vector_store.close()
 
 @app.post("/knowledge/documents")
 async def add_document(document: DocumentCreate):
@@ -21,23 +106,160 @@ async def add_document(document: DocumentCreate):
             content=document.content,
             metadata=document.metadata
         )
-        vector = await vector_store.embed(doc.content)
-        result = await vector_store.add(vector, doc.metadata)
+        result = (await run_in_threadpool(_embed_and_store, [doc]))[0]
         return {"success": True, "document_id": result}
     except Exception as e:
         logger.error(f"Error adding document: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _embed_and_store(documents: List[Document]) -> List[str]:
+    """整批嵌入并在一次加锁操作中写入向量存储"""
+    embeddings = embedding_model.embed_batch([doc.content for doc in documents])
+    return vector_store.add_documents(documents, embeddings)
+
+def _ingest_batch(batch: List[Tuple[int, Document]]) -> List[Dict]:
+    """批量导入的一批；失败时整批记为错误"""
+    try:
+        ids = _embed_and_store([doc for _, doc in batch])
+        return [{"index": index, "document_id": doc_id} for (index, _), doc_id in zip(batch, ids)]
+    except Exception as e:
+        logger.error(f"Error ingesting batch of {len(batch)} documents: {str(e)}")
+        return [{"index": index, "error": str(e)} for index, _ in batch]
+
+@app.post("/knowledge/documents/bulk")
+async def bulk_add_documents(request: Request):
+    """批量导入文档，请求体为 NDJSON 或 JSON 数组，按批嵌入和写入"""
+    try:
+        results = []
+        batch: List[Tuple[int, Document]] = []
+        async for index, record in iter_records(request.stream()):
+            if isinstance(record, Exception):
+                results.append({"index": index, "error": str(record)})
+                continue
+            try:
+                document = DocumentCreate.parse_obj(record)
+            except ValidationError as e:
+                results.append({"index": index, "error": str(e)})
+                continue
+            batch.append((index, Document(content=document.content, metadata=document.metadata)))
+            if len(batch) >= BULK_BATCH_SIZE:
+                results.extend(await run_in_threadpool(_ingest_batch, batch))
+                batch = []
+        if batch:
+            results.extend(await run_in_threadpool(_ingest_batch, batch))
+
+        results.sort(key=lambda item: item["index"])
+        failed = sum(1 for item in results if "error" in item)
+        return {
+            "success": failed == 0,
+            "inserted": len(results) - failed,
+            "failed": failed,
+            "results": results
+        }
+    except Exception as e:
+        logger.error(f"Error in bulk ingestion: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/knowledge/documents/stream")
+async def stream_document(
+    request: Request,
+    metadata: Optional[str] = Query(None, description="JSON 元数据，会附加到每个分块"),
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP
+):
+    """流式上传大文档：请求体为纯文本，边读取边分块、批量嵌入并写入
+
+    每个分块作为独立文档存储，元数据中的 parent_id / chunk_index / char_offset
+    指向原文档及其位置。
+    """
+    try:
+        parent_metadata = json.loads(metadata) if metadata else {}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="metadata must be valid JSON")
+    if not isinstance(parent_metadata, dict):
+        raise HTTPException(status_code=400, detail="metadata must be a JSON object")
+    if chunk_size <= 0 or chunk_overlap < 0 or chunk_overlap > chunk_size // 2:
+        raise HTTPException(status_code=400, detail="chunk_overlap must be between 0 and chunk_size / 2")
+
+    parent_id = uuid.uuid4().hex
+    stored = 0
+    try:
+        chunks = iter_chunks(iter_text(request.stream()), chunk_size, chunk_overlap)
+        async for batch in prefetch(batched(chunks, BULK_BATCH_SIZE)):
+            documents = [
+                Document(
+                    content=text,
+                    metadata={
+                        **parent_metadata,
+                        "parent_id": parent_id,
+                        "chunk_index": stored + i,
+                        "char_offset": offset
+                    }
+                )
+                for i, (offset, text) in enumerate(batch)
+            ]
+            await run_in_threadpool(_embed_and_store, documents)
+            stored += len(documents)
+        return {"success": True, "document_id": parent_id, "chunks": stored}
+    except Exception as e:
+        logger.error(f"Error streaming document {parent_id} after {stored} chunks: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/knowledge/documents/{document_id}")
+async def upsert_document(document_id: str, document: DocumentCreate):
+    """按 id 插入或替换文档"""
+    try:
+        doc = Document(
+            id=document_id,
+            content=document.content,
+            metadata=document.metadata
+        )
+        result = (await run_in_threadpool(_embed_and_store, [doc]))[0]
+        return {"success": True, "document_id": result}
+    except Exception as e:
+        logger.error(f"Error upserting document {document_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/knowledge/documents/{document_id}")
+async def delete_document(document_id: str):
+    """按 id 删除文档"""
+    try:
+        deleted = await run_in_threadpool(vector_store.delete_document, document_id)
+    except Exception as e:
+        logger.error(f"Error deleting document {document_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"success": True, "document_id": document_id}
+
 @app.get("/knowledge/search")
-async def search_documents(query: str, limit: int = 5):
-    """搜索相关文档"""
+async def search_documents(
+    query: str,
+    limit: int = 5,
+    nprobe: Optional[int] = None,
+    filter: Optional[str] = Query(None, description="JSON 元数据过滤表达式")
+):
+    """搜索相关文档
+
+    nprobe 越大召回越高、延迟越大（仅对 ivf 索引生效）；
+    filter 示例: {"category": "faq", "lang": {"$in": ["en", "zh"]}, "year": {"$gte": 2020}}
+    """
+    if nprobe is not None and nprobe < 1:
+        raise HTTPException(status_code=400, detail="nprobe must be at least 1")
+    filters = None
+    if filter:
+        try:
+            filters = json.loads(filter)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="filter must be valid JSON")
     try:
-        vector = await vector_store.embed(query)
-        results = await vector_store.search(vector, limit)
+        results = await search_executor.search(query, limit, nprobe=nprobe, filters=filters)
         return {
             "success": True,
             "results": results
         }
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error searching documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -46,7 +268,10 @@ async def search_documents(query: str, limit: int = 5):
 async def get_stats():
     """获取知识库统计信息"""
     try:
-        stats = await vector_store.get_stats()
+        # 分片模式下要等待各分片进程，放到线程池中执行
+        stats = await run_in_threadpool(vector_store.get_stats)
+        stats["embedding_cache"] = embedding_model.cache.get_stats()
+        stats["search_executor"] = search_executor.get_stats()
         return {
             "success": True,
             "stats": stats
@@ -55,16 +280,30 @@ async def get_stats():
         logger.error(f"Error getting stats: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/knowledge/version")
+async def get_version():
+    """知识库版本，任何写入后都会变化，供下游缓存判断结果是否过期"""
+    try:
+        return {"version": await run_in_threadpool(vector_store.version)}
+    except Exception as e:
+        logger.error(f"Error getting version: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.delete("/knowledge/clear")
 async def clear_knowledge_base():
     """清空知识库"""
     try:
-        await vector_store.clear()
+        await run_in_threadpool(vector_store.clear)
         return {"success": True}
     except Exception as e:
         logger.error(f"Error clearing knowledge base: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/health")
+async def health_check():
+    """健康检查端点"""
+    return {"status": "healthy"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8004) 
\ No newline at end of file
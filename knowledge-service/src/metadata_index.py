@@ -0,0 +1,197 @@
+import numpy as np
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import logging
+
+logger = logging.getLogger(__name__)
+
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+
+class FilterError(ValueError):
+    """过滤表达式无效或引用了未建索引的字段"""
+    pass
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _check_values(key: str, values: List[Any]) -> List[Any]:
+    """等值 / IN 条件只接受标量值；列表或对象无法在倒排表中查找"""
+    for value in values:
+        if not isinstance(value, (str, int, float, bool)) and value is not None:
+            raise FilterError(f"Filter values for '{key}' must be strings, numbers, booleans or null")
+    return values
+
+class MetadataIndex:
+    """元数据倒排索引
+
+    对选定的元数据字段维护 值 -> 行号数组 的倒排表（列表值按元素分别索引），
+    数值字段额外维护一列与行号对齐的 float64 数组，用于范围查询。
+    过滤表达式在打分前被解析为候选行号，检索只需对命中行打分。
+    """
+
+    def __init__(self, keys: Sequence[str] = ()):
+        self.keys = list(keys)
+        self.reset()
+
+    def reset(self) -> None:
+        self._postings: Dict[str, Dict[Any, array]] = {key: {} for key in self.keys}
+        self._numeric: Dict[str, np.ndarray] = {}
+        self._rows = 0
+
+    def _numeric_column(self, key: str, rows: int) -> np.ndarray:
+        """返回至少容纳 rows 行的数值列，缺失值为 NaN，容量成倍增长"""
+        column = self._numeric.get(key)
+        if column is None or column.shape[0] < rows:
+            capacity = max(rows, 1024 if column is None else column.shape[0] * 2)
+            grown = np.full(capacity, np.nan)
+            if column is not None:
+                grown[:column.shape[0]] = column
+            column = self._numeric[key] = grown
+        return column
+
+    def add(self, metadatas: Iterable[Dict], start_row: int) -> None:
+        """登记从 start_row 开始的一批文档元数据"""
+        row = start_row
+        for metadata in metadatas:
+            for key in self.keys:
+                if key not in metadata:
+                    continue
+                value = metadata[key]
+                for item in (value if isinstance(value, list) else [value]):
+                    try:
+                        self._postings[key].setdefault(item, array("q")).append(row)
+                    except TypeError:
+                        # 不可哈希的值（如嵌套字典）不参与索引
+                        continue
+                if _is_number(value):
+                    self._numeric_column(key, row + 1)[row] = value
+            row += 1
+        self._rows = max(self._rows, row)
+
+    def export(self) -> Dict:
+        """导出倒排表与数值列（可 JSON 序列化），随磁盘段一起保存"""
+        numeric = {}
+        for key, column in self._numeric.items():
+            column = column[:self._rows]
+            rows = np.flatnonzero(~np.isnan(column))
+            numeric[key] = [rows.tolist(), column[rows].tolist()]
+        return {
+            "keys": self.keys,
+            "rows": self._rows,
+            "postings": {
+                key: [[value, rows.tolist()] for value, rows in postings.items()]
+                for key, postings in self._postings.items()
+            },
+            "numeric": numeric
+        }
+
+    def load(self, data: Dict, start_row: int, keep: Optional[np.ndarray] = None) -> int:
+        """合入 export 导出的数据，行号整体偏移 start_row，返回登记的行数
+
+        keep 为保留行掩码：被丢弃的行不登记，其后的行号依次前移（压实与合并时使用）。
+        """
+        rows = data["rows"]
+        if keep is None:
+            remap = np.arange(start_row, start_row + rows, dtype=np.int64)
+            kept = rows
+        else:
+            keep = np.asarray(keep, dtype=bool)
+            remap = np.cumsum(keep, dtype=np.int64) - 1 + start_row
+            kept = int(keep.sum())
+        for key in self.keys:
+            postings = self._postings[key]
+            for value, value_rows in data["postings"].get(key, []):
+                value_rows = np.asarray(value_rows, dtype=np.int64)
+                if keep is not None:
+                    value_rows = value_rows[keep[value_rows]]
+                if value_rows.shape[0]:
+                    postings.setdefault(value, array("q")).extend(remap[value_rows].tolist())
+            if key in data["numeric"]:
+                value_rows, values = data["numeric"][key]
+                value_rows = np.asarray(value_rows, dtype=np.int64)
+                values = np.asarray(values, dtype=np.float64)
+                if keep is not None:
+                    mask = keep[value_rows]
+                    value_rows, values = value_rows[mask], values[mask]
+                if value_rows.shape[0]:
+                    self._numeric_column(key, start_row + kept)[remap[value_rows]] = values
+        self._rows = max(self._rows, start_row + kept)
+        return kept
+
+    def _postings_rows(self, key: str, values: List[Any]) -> np.ndarray:
+        # 复制而非 frombuffer 视图：视图存活时 array 无法再追加
+        arrays = [
+            np.array(self._postings[key][value], dtype=np.int64)
+            for value in values
+            if value in self._postings[key]
+        ]
+        if not arrays:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(arrays))
+
+    def _range_rows(self, key: str, condition: Dict) -> np.ndarray:
+        column = self._numeric.get(key)
+        if column is None:
+            return np.empty(0, dtype=np.int64)
+        column = column[:self._rows]
+        mask = ~np.isnan(column)
+        for operator, bound in condition.items():
+            if not _is_number(bound):
+                raise FilterError(f"Range bound for '{key}' must be a number")
+            if operator == "$gt":
+                mask &= column > bound
+            elif operator == "$gte":
+                mask &= column >= bound
+            elif operator == "$lt":
+                mask &= column < bound
+            elif operator == "$lte":
+                mask &= column <= bound
+        return np.flatnonzero(mask)
+
+    def _resolve_condition(self, key: str, condition: Any) -> np.ndarray:
+        if key not in self._postings:
+            raise FilterError(f"Metadata field '{key}' is not indexed")
+        if isinstance(condition, list):
+            return self._postings_rows(key, _check_values(key, condition))
+        if not isinstance(condition, dict):
+            return self._postings_rows(key, _check_values(key, [condition]))
+
+        unknown = set(condition) - RANGE_OPERATORS - {"$eq", "$in"}
+        if unknown:
+            raise FilterError(f"Unsupported filter operator(s): {', '.join(sorted(unknown))}")
+        rows: Optional[np.ndarray] = None
+        if "$eq" in condition:
+            rows = self._postings_rows(key, _check_values(key, [condition["$eq"]]))
+        if "$in" in condition:
+            if not isinstance(condition["$in"], list):
+                raise FilterError(f"'$in' for '{key}' expects a list")
+            matched = self._postings_rows(key, _check_values(key, condition["$in"]))
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        ranges = {op: bound for op, bound in condition.items() if op in RANGE_OPERATORS}
+        if ranges:
+            matched = self._range_rows(key, ranges)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows if rows is not None else np.empty(0, dtype=np.int64)
+
+    def resolve(self, filters: Dict[str, Any]) -> np.ndarray:
+        """把过滤表达式解析为升序的候选行号数组，多个字段之间为 AND 关系
+
+        支持 {"k": v}（相等）、{"k": [v1, v2]} 或 {"k": {"$in": [...]}}（IN）、
+        以及 {"k": {"$gte": a, "$lt": b}}（数值范围）。
+        """
+        if not isinstance(filters, dict):
+            raise FilterError("Filter must be a JSON object")
+        rows: Optional[np.ndarray] = None
+        for key, condition in filters.items():
+            matched = self._resolve_condition(key, condition)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+            if rows.shape[0] == 0:
+                break
+        return rows if rows is not None else np.arange(self._rows, dtype=np.int64)
+
+    def get_stats(self) -> Dict:
+        return {
+            "keys": self.keys,
+            "distinct_values": {key: len(postings) for key, postings in self._postings.items()},
+            "numeric_keys": sorted(self._numeric)
+        }
@@ -0,0 +1,235 @@
+from abc import ABC, abstractmethod
+import numpy as np
+from typing import Dict, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 编码时每次处理的行数，限制临时数组的大小
+ENCODE_CHUNK_ROWS = 65536
+
+def _kmeans(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """欧氏距离 k-means，返回 (k, dim) 的簇中心"""
+    centroids = data[rng.choice(data.shape[0], k, replace=False)].copy()
+    for _ in range(iterations):
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2，||x||^2 与 argmin 无关
+        distances = (centroids ** 2).sum(axis=1) - 2 * data @ centroids.T
+        assignments = np.argmin(distances, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, data)
+        counts = np.bincount(assignments, minlength=k)
+        empty = counts == 0
+        counts[empty] = 1
+        centroids = sums / counts[:, None]
+        if empty.any():
+            centroids[empty] = data[rng.choice(data.shape[0], int(empty.sum()), replace=False)]
+    return centroids.astype(np.float32)
+
+class _Quantizer(ABC):
+    """量化器公共部分：训练前积累行数，训练后维护与全局行号对齐的可增长编码矩阵"""
+
+    quantization_type = ""
+    # 扫描时每块的行数：块越小临时数组越能留在 CPU 缓存中
+    scan_chunk_rows = 4096
+
+    def __init__(self, train_size: int = 10000, seed: int = 0):
+        self.train_size = train_size
+        self.seed = seed
+        self.reset()
+
+    @property
+    @abstractmethod
+    def is_trained(self) -> bool:
+        pass
+
+    @property
+    def needs_training(self) -> bool:
+        return not self.is_trained and self._untrained_rows >= self.train_size
+
+    @property
+    @abstractmethod
+    def bytes_per_vector(self) -> int:
+        pass
+
+    @property
+    @abstractmethod
+    def _code_shape(self) -> Tuple[int, ...]:
+        """每个向量编码的形状"""
+        pass
+
+    def reset(self) -> None:
+        self._codes: Optional[np.ndarray] = None
+        self._size = 0
+        self._untrained_rows = 0
+
+    @abstractmethod
+    def train(self, sample: np.ndarray) -> None:
+        """用样本向量训练量化参数"""
+        pass
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """把一批向量编码为 _code_shape 形状的编码"""
+        pass
+
+    @abstractmethod
+    def _scan(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """计算查询与一块编码的近似内积"""
+        pass
+
+    def add(self, vectors: np.ndarray, start_row: int) -> None:
+        """编码从 start_row 开始的一批新向量；未训练时只记录行数"""
+        if not self.is_trained:
+            self._untrained_rows = max(self._untrained_rows, start_row + vectors.shape[0])
+            return
+        required = start_row + vectors.shape[0]
+        if self._codes is None or required > self._codes.shape[0]:
+            capacity = max(required, 1024 if self._codes is None else self._codes.shape[0] * 2)
+            codes = np.empty((capacity,) + self._code_shape, dtype=self._code_dtype)
+            if self._size:
+                codes[:self._size] = self._codes[:self._size]
+            self._codes = codes
+        for start in range(0, vectors.shape[0], ENCODE_CHUNK_ROWS):
+            chunk = np.asarray(vectors[start:start + ENCODE_CHUNK_ROWS], dtype=np.float32)
+            self._codes[start_row + start:start_row + start + chunk.shape[0]] = self.encode(chunk)
+        self._size = max(self._size, required)
+
+    def build(self, blocks: Sequence[Tuple[int, np.ndarray]]) -> None:
+        """用 (起始行号, 向量矩阵) 分块数据训练并编码全部行；数据不足时保持未训练"""
+        self.reset()
+        total = sum(matrix.shape[0] for _, matrix in blocks)
+        if total < self.train_size:
+            self._untrained_rows = total
+            return
+        rng = np.random.default_rng(self.seed)
+        rows = np.sort(rng.choice(total, self.train_size, replace=False))
+        sample = np.concatenate([
+            matrix[rows[(rows >= start) & (rows < start + matrix.shape[0])] - start]
+            for start, matrix in blocks
+        ]).astype(np.float32)
+        self.train(sample)
+        for start, matrix in blocks:
+            self.add(matrix, start)
+        logger.info(f"{self.quantization_type} quantizer trained, encoded {self._size} vectors")
+
+    def score(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """在压缩编码上计算近似相似度（rows 为 None 时扫描全部行）"""
+        codes = self._codes[:self._size] if rows is None else self._codes[rows]
+        scores = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], self.scan_chunk_rows):
+            end = start + self.scan_chunk_rows
+            scores[start:end] = self._scan(codes[start:end], query)
+        return scores
+
+    def get_stats(self, dimension: Optional[int]) -> Dict:
+        full = 4 * (dimension or 0)
+        stats = {"type": self.quantization_type, "trained": self.is_trained}
+        if self.is_trained:
+            stats.update({
+                "bytes_per_vector": self.bytes_per_vector,
+                "full_precision_bytes_per_vector": full,
+                "compression_ratio": full / self.bytes_per_vector,
+                "code_bytes": self._size * self.bytes_per_vector
+            })
+        return stats
+
+class ScalarQuantizer(_Quantizer):
+    """int8 标量量化：每个维度按训练样本的最大绝对值线性映射到 [-127, 127]"""
+
+    quantization_type = "int8"
+    scan_chunk_rows = 1024
+    _code_dtype = np.int8
+
+    def reset(self) -> None:
+        super().reset()
+        self.scale: Optional[np.ndarray] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.scale is not None
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return self.scale.shape[0]
+
+    @property
+    def _code_shape(self) -> Tuple[int, ...]:
+        return (self.scale.shape[0],)
+
+    def train(self, sample: np.ndarray) -> None:
+        scale = np.abs(sample).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        self.scale = scale.astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def _scan(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # x ≈ code * scale，故 x.q ≈ code . (q * scale)
+        return codes.astype(np.float32) @ (query * self.scale)
+
+class ProductQuantizer(_Quantizer):
+    """乘积量化：向量切成 m 段，每段用 256 个中心的码本编码为 1 字节，查询时查表求和"""
+
+    quantization_type = "pq"
+    scan_chunk_rows = 16384
+    _code_dtype = np.uint8
+
+    def __init__(self, subvectors: int = 48, iterations: int = 10, train_size: int = 10000, seed: int = 0):
+        self.subvectors = subvectors
+        self.iterations = iterations
+        super().__init__(train_size=max(train_size, 256), seed=seed)
+
+    def reset(self) -> None:
+        super().reset()
+        self.codebooks: Optional[np.ndarray] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return self.subvectors
+
+    @property
+    def _code_shape(self) -> Tuple[int, ...]:
+        return (self.subvectors,)
+
+    def train(self, sample: np.ndarray) -> None:
+        dimension = sample.shape[1]
+        if dimension % self.subvectors:
+            raise ValueError(f"Dimension {dimension} is not divisible by {self.subvectors} PQ subvectors")
+        rng = np.random.default_rng(self.seed)
+        parts = sample.reshape(sample.shape[0], self.subvectors, -1)
+        self.codebooks = np.stack([
+            _kmeans(parts[:, j], 256, self.iterations, rng) for j in range(self.subvectors)
+        ])
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        parts = vectors.reshape(vectors.shape[0], self.subvectors, -1)
+        codes = np.empty((vectors.shape[0], self.subvectors), dtype=np.uint8)
+        for j in range(self.subvectors):
+            centroids = self.codebooks[j]
+            distances = (centroids ** 2).sum(axis=1) - 2 * parts[:, j] @ centroids.T
+            codes[:, j] = np.argmin(distances, axis=1)
+        return codes
+
+    def _scan(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # 非对称距离计算：先算查询每段与 256 个中心的内积表，再按编码查表求和
+        table = np.einsum("md,mkd->mk", query.reshape(self.subvectors, -1), self.codebooks)
+        scores = np.zeros(codes.shape[0], dtype=np.float32)
+        for j in range(self.subvectors):
+            scores += table[j].take(codes[:, j])
+        return scores
+
+def create_quantizer(quantization_type: str = "none", **kwargs):
+    """根据配置创建量化器，none 表示只保存全精度向量"""
+    if quantization_type in ("", "none"):
+        return None
+    if quantization_type == "int8":
+        kwargs.pop("subvectors", None)
+        return ScalarQuantizer(**kwargs)
+    if quantization_type == "pq":
+        return ProductQuantizer(**kwargs)
+    raise ValueError(f"Unknown vector quantization type: {quantization_type}")
@@ -0,0 +1,412 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+import json
+import logging
+import os
+import threading
+import uuid
+from .document import Document
+from .metadata_index import MetadataIndex
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+SEGMENT_SUFFIXES = (".vec", ".off", ".docs", ".meta")
+TOMBSTONE_PREFIX = "tomb_"
+
+def _fsync_write(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _write_catalog(base_path: str, ids: List[str], metadata_index: MetadataIndex) -> None:
+    """写出段的目录文件（文档 id 与元数据倒排表）
+
+    目录可由 .docs 重建，不做 fsync；写临时文件后替换，读者不会看到写了一半的文件。
+    """
+    catalog = metadata_index.export()
+    catalog["ids"] = ids
+    tmp_path = base_path + ".meta.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(catalog, f)
+    os.replace(tmp_path, base_path + ".meta")
+
+class Segment:
+    """磁盘上的不可变段
+
+    - seg_XXXXXXXX.vec: 原始 float32 向量 (rows x dimension)
+    - seg_XXXXXXXX.off: int64 偏移数组 (rows + 1)，指向 .docs 中每条记录的起止位置
+    - seg_XXXXXXXX.docs: 依次拼接的文档 JSON 记录
+    - seg_XXXXXXXX.meta: 段目录，按行排列的文档 id 与选定元数据字段的倒排表
+
+    前三个文件以只读 memmap 打开，多个 worker 进程共享页缓存；启动时只读取 .meta，不解码文档记录。
+    """
+
+    def __init__(self, directory: str, segment_id: int, dimension: int):
+        self.segment_id = segment_id
+        self.base_path = os.path.join(directory, f"seg_{segment_id:08d}")
+        self.offsets = np.memmap(self.base_path + ".off", dtype=np.int64, mode="r")
+        self.rows = self.offsets.shape[0] - 1
+        self.vectors = np.memmap(
+            self.base_path + ".vec", dtype=np.float32, mode="r", shape=(self.rows, dimension)
+        )
+        self._records = np.memmap(self.base_path + ".docs", dtype=np.uint8, mode="r")
+
+    @property
+    def paths(self) -> List[str]:
+        return [self.base_path + suffix for suffix in SEGMENT_SUFFIXES]
+
+    def record(self, row: int) -> bytes:
+        """返回第 row 条文档的原始 JSON 记录"""
+        return self._records[self.offsets[row]:self.offsets[row + 1]].tobytes()
+
+    def document(self, row: int) -> Document:
+        return Document.parse_raw(self.record(row))
+
+    def catalog(self, metadata_keys: Sequence[str]) -> Tuple[List[str], Dict]:
+        """返回本段按行排列的文档 id 与元数据倒排数据（格式见 MetadataIndex.export）
+
+        .meta 缺失（旧版本写入的段）、损坏或索引字段已变更时，逐条解码文档记录重建并回写。
+        """
+        try:
+            with open(self.base_path + ".meta") as f:
+                catalog = json.load(f)
+            if catalog["rows"] == self.rows and sorted(catalog["keys"]) == sorted(metadata_keys):
+                return catalog["ids"], catalog
+        except (OSError, ValueError, KeyError):
+            pass
+        ids: List[str] = []
+        metadata_index = MetadataIndex(metadata_keys)
+        metadatas = []
+        for row in range(self.rows):
+            record = json.loads(self.record(row))
+            ids.append(record["id"])
+            metadatas.append(record.get("metadata") or {})
+        metadata_index.add(metadatas, 0)
+        try:
+            _write_catalog(self.base_path, ids, metadata_index)
+        except OSError as e:
+            logger.warning(f"Could not write catalog for {self.base_path}: {str(e)}")
+        logger.info(f"Rebuilt catalog for {self.base_path}")
+        return ids, metadata_index.export()
+
+    @staticmethod
+    def write(
+        directory: str,
+        segment_id: int,
+        vectors: np.ndarray,
+        documents: List[Document],
+        metadata_keys: Sequence[str] = ()
+    ) -> None:
+        """把一批向量和文档写成新段（调用方负责更新清单）"""
+        base_path = os.path.join(directory, f"seg_{segment_id:08d}")
+        records = [document.json().encode() for document in documents]
+        lengths = np.fromiter((len(r) for r in records), dtype=np.int64, count=len(records))
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        _fsync_write(base_path + ".vec", np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        _fsync_write(base_path + ".docs", b"".join(records))
+        _fsync_write(base_path + ".off", offsets.tobytes())
+        metadata_index = MetadataIndex(metadata_keys)
+        metadata_index.add((document.metadata for document in documents), 0)
+        _write_catalog(base_path, [document.id for document in documents], metadata_index)
+
+    @staticmethod
+    def merge(
+        directory: str,
+        segment_id: int,
+        segments: List["Segment"],
+        chunk_rows: int = 65536,
+        keep: Optional[List[np.ndarray]] = None,
+        metadata_keys: Sequence[str] = ()
+    ) -> int:
+        """按顺序合并若干段为一个新段，分块拷贝以限制内存
+
+        keep 为每段的保留行掩码（压实时丢弃已删除的行），返回新段的行数。
+        新段的目录由各段目录拼接得出，不解码文档记录。
+        """
+        base_path = os.path.join(directory, f"seg_{segment_id:08d}")
+        masks = keep or [None] * len(segments)
+        with open(base_path + ".vec", "wb") as f:
+            for segment, mask in zip(segments, masks):
+                for start in range(0, segment.rows, chunk_rows):
+                    chunk = np.asarray(segment.vectors[start:start + chunk_rows])
+                    if mask is not None:
+                        chunk = chunk[mask[start:start + chunk_rows]]
+                    f.write(chunk.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        with open(base_path + ".docs", "wb") as f:
+            for segment, mask in zip(segments, masks):
+                if mask is None:
+                    f.write(segment._records[:segment.offsets[-1]].tobytes())
+                    offsets.append(segment.offsets[1:] + base)
+                    base += int(segment.offsets[-1])
+                    continue
+                rows = np.flatnonzero(mask)
+                for row in rows:
+                    f.write(segment.record(int(row)))
+                lengths = segment.offsets[rows + 1] - segment.offsets[rows]
+                offsets.append(np.cumsum(lengths) + base)
+                base += int(lengths.sum())
+            f.flush()
+            os.fsync(f.fileno())
+        offsets = np.concatenate(offsets).astype(np.int64)
+        _fsync_write(base_path + ".off", offsets.tobytes())
+
+        ids: List[str] = []
+        metadata_index = MetadataIndex(metadata_keys)
+        for segment, mask in zip(segments, masks):
+            segment_ids, catalog = segment.catalog(metadata_keys)
+            metadata_index.load(catalog, len(ids), keep=mask)
+            ids.extend(segment_ids if mask is None else [i for i, kept in zip(segment_ids, mask) if kept])
+        _write_catalog(base_path, ids, metadata_index)
+        return offsets.shape[0] - 1
+
+class SegmentStore:
+    """管理数据目录下的只追加段和清单文件，并在后台合并段以限制段数量
+
+    已删除行的全局行号追加写入清单登记的墓碑文件 tomb_XXXXXXXX.del（int64），
+    相邻段合并不改变行号；压实重排行号时换用新的墓碑文件。
+    """
+
+    def __init__(self, directory: str, max_segments: int = 8, metadata_keys: Sequence[str] = ()):
+        self.directory = directory
+        self.max_segments = max(1, max_segments)
+        # 段目录中建倒排表的元数据字段
+        self.metadata_keys = list(metadata_keys)
+        self.dimension: Optional[int] = None
+        self.segments: List[Segment] = []
+        self._next_id = 1
+        self._tombstone_id = 0
+        # 数据目录的标识，与 next_id、墓碑文件一起构成内容版本
+        self.store_id = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        # 合并与压实互斥：压实期间暂停合并，保证段列表的前缀不变
+        self.maintenance_lock = threading.Lock()
+        self._merge_thread: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def _tombstone_path(self, tombstone_id: int) -> str:
+        return os.path.join(self.directory, f"{TOMBSTONE_PREFIX}{tombstone_id:08d}.del")
+
+    def _load(self) -> None:
+        """读取清单并映射所有段，清理未登记的残留文件"""
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            self.dimension = manifest["dimension"]
+            self._next_id = manifest["next_id"]
+            self._tombstone_id = manifest.get("tombstones", 0)
+            self.store_id = manifest.get("store_id", self.store_id)
+            self.segments = [
+                Segment(self.directory, segment_id, self.dimension)
+                for segment_id in manifest["segments"]
+            ]
+        live = {path for segment in self.segments for path in segment.paths}
+        if self._tombstone_id:
+            live.add(self._tombstone_path(self._tombstone_id))
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(("seg_", TOMBSTONE_PREFIX)) and path not in live:
+                os.remove(path)
+        logger.info(f"Mapped {len(self.segments)} segment(s) from {self.directory}")
+
+    def _write_manifest(self) -> None:
+        manifest = {
+            "dimension": self.dimension,
+            "next_id": self._next_id,
+            "segments": [segment.segment_id for segment in self.segments],
+            "tombstones": self._tombstone_id,
+            "store_id": self.store_id
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        _fsync_write(tmp_path, json.dumps(manifest).encode())
+        os.replace(tmp_path, self.manifest_path)
+
+    def append(self, vectors: np.ndarray, documents: List[Document]) -> Segment:
+        """把一批文档写成新段并登记到清单"""
+        with self._lock:
+            segment_id = self._next_id
+            self._next_id += 1
+        Segment.write(self.directory, segment_id, vectors, documents, self.metadata_keys)
+        with self._lock:
+            self.dimension = vectors.shape[1]
+            segment = Segment(self.directory, segment_id, self.dimension)
+            # 整体替换列表，读者持有的旧快照不受影响
+            self.segments = self.segments + [segment]
+            self._write_manifest()
+        self.maybe_merge()
+        return segment
+
+    def load_tombstones(self) -> np.ndarray:
+        """读取已删除行的全局行号"""
+        if not self._tombstone_id:
+            return np.empty(0, dtype=np.int64)
+        path = self._tombstone_path(self._tombstone_id)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=np.int64)
+        with open(path, "rb") as f:
+            data = f.read()
+        # 忽略崩溃时写了一半的末尾记录
+        return np.frombuffer(data[:len(data) - len(data) % 8], dtype=np.int64).copy()
+
+    def add_tombstones(self, rows: np.ndarray) -> None:
+        """追加已删除行的行号（首次删除时创建墓碑文件并登记到清单）"""
+        with self._lock:
+            if not self._tombstone_id:
+                self._tombstone_id = self._next_id
+                self._next_id += 1
+                _fsync_write(self._tombstone_path(self._tombstone_id), b"")
+                self._write_manifest()
+            with open(self._tombstone_path(self._tombstone_id), "ab") as f:
+                f.write(np.asarray(rows, dtype=np.int64).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+    def write_compacted(self, segments: List[Segment], keep: List[np.ndarray]) -> Optional[Segment]:
+        """把 segments 中保留的行写成一个新段（尚未登记到清单），没有保留行时返回 None"""
+        with self._lock:
+            segment_id = self._next_id
+            self._next_id += 1
+        rows = Segment.merge(self.directory, segment_id, segments, keep=keep, metadata_keys=self.metadata_keys)
+        if not rows:
+            self.discard(segment_id)
+            return None
+        return Segment(self.directory, segment_id, self.dimension)
+
+    def replace_compacted(
+        self,
+        old: List[Segment],
+        segment: Optional[Segment],
+        tombstones: np.ndarray
+    ) -> None:
+        """用压实后的段替换段列表前缀 old，并以重排后的行号重写墓碑文件"""
+        with self._lock:
+            obsolete = [path for s in old for path in s.paths]
+            if self._tombstone_id:
+                obsolete.append(self._tombstone_path(self._tombstone_id))
+            self._tombstone_id = 0
+            if tombstones.shape[0]:
+                self._tombstone_id = self._next_id
+                self._next_id += 1
+                _fsync_write(
+                    self._tombstone_path(self._tombstone_id),
+                    np.asarray(tombstones, dtype=np.int64).tobytes()
+                )
+            self.segments = ([segment] if segment is not None else []) + self.segments[len(old):]
+            self._write_manifest()
+        for path in obsolete:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def discard(self, segment_id: int) -> None:
+        """删除未登记到清单的段文件"""
+        base_path = os.path.join(self.directory, f"seg_{segment_id:08d}")
+        for suffix in SEGMENT_SUFFIXES:
+            if os.path.exists(base_path + suffix):
+                os.remove(base_path + suffix)
+
+    def maybe_merge(self) -> None:
+        """段数量超过上限时启动后台合并线程"""
+        if len(self.segments) <= self.max_segments:
+            return
+        with self._lock:
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return
+            self._merge_thread = threading.Thread(target=self._merge_loop, daemon=True)
+            self._merge_thread.start()
+
+    def _merge_loop(self) -> None:
+        while len(self.segments) > self.max_segments:
+            try:
+                with self.maintenance_lock:
+                    if not self._merge_once():
+                        return
+            except Exception as e:
+                logger.error(f"Error merging segments: {str(e)}")
+                return
+
+    def _merge_once(self) -> bool:
+        """合并行数之和最小的一对相邻段；相邻合并不改变全局行号"""
+        with self._lock:
+            segments = self.segments
+            if len(segments) < 2:
+                return False
+            sizes = [a.rows + b.rows for a, b in zip(segments, segments[1:])]
+            position = int(np.argmin(sizes))
+            pair = segments[position:position + 2]
+            segment_id = self._next_id
+            self._next_id += 1
+
+        Segment.merge(self.directory, segment_id, pair, metadata_keys=self.metadata_keys)
+
+        with self._lock:
+            current = self.segments[position:position + 2]
+            merged = len(current) == 2 and current[0] is pair[0] and current[1] is pair[1]
+            if merged:
+                segment = Segment(self.directory, segment_id, self.dimension)
+                self.segments = self.segments[:position] + [segment] + self.segments[position + 2:]
+                self._write_manifest()
+                obsolete = pair[0].paths + pair[1].paths
+            else:
+                # 合并期间段列表被修改（例如被清空），放弃本次结果
+                obsolete = []
+                self.discard(segment_id)
+        # 已映射旧段的读者仍可访问（文件删除后映射依然有效）
+        for path in obsolete:
+            if os.path.exists(path):
+                os.remove(path)
+        if merged:
+            logger.info(f"Merged segments into seg_{segment_id:08d}, {len(self.segments)} segment(s) left")
+        return merged
+
+    def clear(self) -> None:
+        """删除所有段并重置清单"""
+        with self._lock:
+            obsolete = [path for segment in self.segments for path in segment.paths]
+            if self._tombstone_id:
+                obsolete.append(self._tombstone_path(self._tombstone_id))
+            self._tombstone_id = 0
+            self.segments = []
+            self.dimension = None
+            # 清空后版本也要变化
+            self._next_id += 1
+            self._write_manifest()
+        for path in obsolete:
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def read_version(directory: str) -> str:
+        """由磁盘上的清单与墓碑文件得出内容版本
+
+        每次追加、删除、清空都会改变 next_id 或墓碑文件长度；直接读磁盘，
+        共享同一数据目录的所有进程看到一致的版本。
+        """
+        try:
+            with open(os.path.join(directory, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return "empty"
+        tombstone_id = manifest.get("tombstones", 0)
+        tombstone_path = os.path.join(directory, f"{TOMBSTONE_PREFIX}{tombstone_id:08d}.del")
+        deleted = os.path.getsize(tombstone_path) // 8 if tombstone_id and os.path.exists(tombstone_path) else 0
+        return f"{manifest.get('store_id', '')}.{manifest['next_id']}.{tombstone_id}.{deleted}"
+
+    def version(self) -> str:
+        return self.read_version(self.directory)
+
+    def get_stats(self) -> Dict:
+        return {
+            "segments": len(self.segments),
+            "max_segments": self.max_segments,
+            "directory": self.directory
+        }
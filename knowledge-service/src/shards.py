@@ -0,0 +1,267 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional
+import hashlib
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+import zlib
+from .document import Document
+from .index import create_index
+from .metadata_index import FilterError
+from .quantization import create_quantizer
+from .vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# 工作进程内的分片存储，由 _init_shard 创建
+_store: Optional[VectorStore] = None
+
+def _shard_dir(data_dir: str, shard: int) -> str:
+    return os.path.join(data_dir, f"shard_{shard:02d}")
+
+def _init_shard(config: Dict, shard: int) -> None:
+    """工作进程初始化：按配置创建本分片的 VectorStore（持久化时各分片使用独立子目录）"""
+    global _store
+    data_dir = config.get("data_dir")
+    _store = VectorStore(
+        dimension=config.get("dimension"),
+        index=create_index(config.get("index_type", "flat"), **config.get("index_options", {})),
+        data_dir=_shard_dir(data_dir, shard) if data_dir else None,
+        max_segments=config.get("max_segments", 8),
+        metadata_keys=config.get("metadata_keys", ()),
+        quantizer=create_quantizer(config.get("quantization", "none"), **config.get("quantizer_options", {})),
+        rerank_factor=config.get("rerank_factor", 10),
+        compaction_ratio=config.get("compaction_ratio", 0.2),
+        compaction_min_deleted=config.get("compaction_min_deleted", 1000),
+        flush_rows=config.get("flush_rows", 256),
+        flush_interval=config.get("flush_interval", 1.0)
+    )
+
+def _shard_add(documents: List[Document], embeddings: np.ndarray) -> List[str]:
+    return _store.add_documents(documents, embeddings)
+
+def _shard_delete(document_ids: List[str]) -> int:
+    return _store.delete_documents(document_ids)
+
+def _shard_search(
+    queries: np.ndarray,
+    limit: int,
+    nprobe: Optional[int],
+    filters: Optional[Dict[str, Any]]
+) -> List[List[Dict]]:
+    return _store.search_batch(queries, limit, nprobe=nprobe, filters=filters)
+
+def _shard_stats() -> Dict:
+    return _store.get_stats()
+
+def _shard_clear() -> None:
+    _store.clear()
+
+def _shard_version() -> str:
+    return _store.version()
+
+def _shard_close() -> None:
+    _store.close()
+
+class ShardedVectorStore:
+    """分片向量存储：文档按 id 哈希分布到多个本地工作进程
+
+    每个分片是独立进程中的 VectorStore，持久化时各自 memmap 自己的段目录（页缓存在进程间共享）。
+    检索时协调者把查询并发分发到所有分片，用堆合并各分片已排好序的 top-k；
+    超过 timeout_ms 未返回的分片被跳过，返回其余分片的部分结果，其尚未开始执行的检索被取消；
+    仍有超时检索在执行、且积压达到 max_backlog 的分片暂不接收新检索，慢分片的队列不会无限增长，
+    正常分片在高并发下不会因积压被跳过。
+    """
+
+    def __init__(self, num_shards: int, config: Dict, timeout_ms: float = 2000, max_backlog: int = 4):
+        self.num_shards = num_shards
+        self.timeout = timeout_ms / 1000
+        self.max_backlog = max_backlog
+        self.dimension = config.get("dimension")
+        self.timeouts = 0
+        self.failures = 0
+        self.skipped = 0
+        # 每个分片已提交但未完成的检索数，以及其中已超时仍在执行的检索数
+        self._backlog = [0] * num_shards
+        self._overdue = [0] * num_shards
+        self._overdue_futures = set()
+        self._backlog_lock = threading.Lock()
+        # 每个分片一个单 worker 进程池：分片状态常驻在进程内，请求按到达顺序执行
+        context = multiprocessing.get_context("spawn")
+        self._shards = [
+            ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_shard, initargs=(config, shard))
+            for shard in range(num_shards)
+        ]
+        logger.info(f"Sharded vector store started with {num_shards} shard process(es)")
+
+    def _shard_of(self, document_id: str) -> int:
+        # crc32 在各进程和重启之间稳定，内置 hash() 则会随机化
+        return zlib.crc32(document_id.encode()) % self.num_shards
+
+    def _gather(self, fn, *args) -> List[Any]:
+        """在所有分片上执行并等待全部完成"""
+        futures = [shard.submit(fn, *args) for shard in self._shards]
+        return [future.result() for future in futures]
+
+    def _submit_search(self, shard: int, *args):
+        """向分片提交检索；分片仍有超时检索在执行且积压已达上限时返回 None"""
+        with self._backlog_lock:
+            if self._overdue[shard] and self._backlog[shard] >= self.max_backlog:
+                return None
+            self._backlog[shard] += 1
+        future = self._shards[shard].submit(_shard_search, *args)
+        future.add_done_callback(lambda done: self._search_done(shard, done))
+        return future
+
+    def _mark_overdue(self, shard: int, future) -> None:
+        """记录已超时但无法取消、仍在分片中执行的检索"""
+        with self._backlog_lock:
+            if not future.done():
+                self._overdue[shard] += 1
+                self._overdue_futures.add(future)
+
+    def _search_done(self, shard: int, future) -> None:
+        with self._backlog_lock:
+            self._backlog[shard] -= 1
+            if future in self._overdue_futures:
+                self._overdue_futures.remove(future)
+                self._overdue[shard] -= 1
+
+    def add_document(self, document: Document, embedding: np.ndarray) -> str:
+        """添加文档和其向量嵌入（id 已存在时替换旧文档）"""
+        return self.add_documents([document], np.asarray(embedding).reshape(1, -1))[0]
+
+    def add_documents(self, documents: List[Document], embeddings: np.ndarray) -> List[str]:
+        """按 id 哈希把一批文档拆分到各分片并发写入"""
+        embeddings = np.asarray(embeddings)
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(documents):
+            raise ValueError("Expected one embedding row per document")
+        for document in documents:
+            if document.id is None:
+                document.id = uuid.uuid4().hex
+
+        positions: Dict[int, List[int]] = {}
+        for i, document in enumerate(documents):
+            positions.setdefault(self._shard_of(document.id), []).append(i)
+        futures = [
+            self._shards[shard].submit(_shard_add, [documents[i] for i in rows], embeddings[rows])
+            for shard, rows in positions.items()
+        ]
+        for future in futures:
+            future.result()
+        return [document.id for document in documents]
+
+    def delete_documents(self, document_ids: Iterable[str]) -> int:
+        """把待删除的 id 路由到各自所在的分片"""
+        routed: Dict[int, List[str]] = {}
+        for document_id in set(document_ids):
+            routed.setdefault(self._shard_of(document_id), []).append(document_id)
+        futures = [self._shards[shard].submit(_shard_delete, ids) for shard, ids in routed.items()]
+        return sum(future.result() for future in futures)
+
+    def delete_document(self, document_id: str) -> bool:
+        """按 id 删除单个文档，文档不存在时返回 False"""
+        return self.delete_documents([document_id]) == 1
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        limit: int = 5,
+        nprobe: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        """搜索最相似的文档"""
+        return self.search_batch(np.asarray(query_embedding).reshape(1, -1), limit, nprobe, filters)[0]
+
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        limit: int = 5,
+        nprobe: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict]]:
+        """整批查询分发到所有分片，各分片返回每条查询的 top-k 后按相似度堆合并"""
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        futures = {}
+        for shard in range(self.num_shards):
+            future = self._submit_search(shard, queries, limit, nprobe, filters)
+            if future is None:
+                self.skipped += 1
+                logger.warning(f"Shard {shard} is behind on timed-out searches, skipping it")
+            else:
+                futures[future] = shard
+        done, pending = wait(futures, timeout=self.timeout)
+        if pending:
+            self.timeouts += len(pending)
+            # 还在排队的检索直接取消；已在执行的无法中断，记为超时在途，由积压上限兜底
+            for future in pending:
+                if not future.cancel():
+                    self._mark_overdue(futures[future], future)
+            logger.warning(f"{len(pending)} of {self.num_shards} shard(s) timed out, returning partial results")
+
+        shard_results = []
+        for future in futures:
+            if future not in done:
+                continue
+            try:
+                shard_results.append(future.result())
+            except FilterError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Shard search failed: {str(e)}")
+
+        results = []
+        for i in range(queries.shape[0]):
+            # 各分片结果已按相似度降序排列，heapq.merge 只需取前 limit 个
+            merged = heapq.merge(*(hits[i] for hits in shard_results), key=lambda hit: -hit["similarity"])
+            results.append(list(itertools.islice(merged, limit)))
+        return results
+
+    def version(self) -> str:
+        """内容版本：各分片版本（含尚未落盘的写入）的摘要；分片超过 timeout 未返回时抛出 TimeoutError"""
+        futures = [shard.submit(_shard_version) for shard in self._shards]
+        versions = "|".join(future.result(timeout=self.timeout) for future in futures)
+        return hashlib.sha1(versions.encode()).hexdigest()[:16]
+
+    def get_stats(self) -> Dict:
+        """汇总各分片的统计信息；超过 timeout 未返回的分片记为不可用"""
+        futures = [shard.submit(_shard_stats) for shard in self._shards]
+        done, pending = wait(futures, timeout=self.timeout)
+        for future in pending:
+            future.cancel()
+        shards = [future.result() if future in done else {"unavailable": True} for future in futures]
+        available = [stats for stats in shards if not stats.get("unavailable")]
+        total = sum(stats["total_documents"] for stats in available)
+        return {
+            "total_documents": total,
+            "average_embedding_dim": self.dimension if total else 0,
+            "deleted_documents": sum(stats["deleted_documents"] for stats in available),
+            "unavailable_shards": len(shards) - len(available),
+            "shard_timeouts": self.timeouts,
+            "shard_failures": self.failures,
+            "shard_skipped": self.skipped,
+            "shard_backlog": list(self._backlog),
+            "shard_overdue": list(self._overdue),
+            "shards": shards
+        }
+
+    def clear(self) -> None:
+        """清空所有分片"""
+        self._gather(_shard_clear)
+        logger.info("Sharded vector store cleared")
+
+    def shutdown(self) -> None:
+        """写出各分片尚未落盘的数据后停止工作进程"""
+        for future in [shard.submit(_shard_close) for shard in self._shards]:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Error flushing shard: {str(e)}")
+        for shard in self._shards:
+            shard.shutdown(wait=False, cancel_futures=True)
@@ -1,56 +1,659 @@
 import numpy as np
-from typing import List, Dict, Optional
+from contextlib import nullcontext
+from typing import Any, Iterable, List, Dict, Optional, Sequence, Tuple
+import bisect
+import copy
 import logging
+import threading
+import uuid
 from .document import Document
+from .index import FlatIndex
+from .metadata_index import MetadataIndex
+from .rwlock import ReadWriteLock
+from .segments import SegmentStore
 
 logger = logging.getLogger(__name__)
 
+# 批量精确检索时每次打分的行数，限制 (行数 x 查询数) 得分矩阵的大小
+BATCH_SCAN_ROWS = 65536
+
 class VectorStore:
-    def __init__(self):
-        self.documents: List[Document] = []
-        self.embeddings: List[np.ndarray] = []
-        logger.info("Vector store initialized")
-    
-    def add_document(self, document: Document, embedding: np.ndarray) -> None:
-        """添加文档和其向量嵌入"""
-        self.documents.append(document)
-        self.embeddings.append(embedding)
-        logger.info(f"Added document with ID: {document.id}")
-    
-    def search(self, query_embedding: np.ndarray, limit: int = 5) -> List[Dict]:
-        """搜索最相似的文档"""
-        if not self.documents:
+    def __init__(
+        self,
+        dimension: Optional[int] = None,
+        initial_capacity: int = 1024,
+        index=None,
+        data_dir: Optional[str] = None,
+        max_segments: int = 8,
+        metadata_keys: Sequence[str] = (),
+        quantizer=None,
+        rerank_factor: int = 10,
+        compaction_ratio: float = 0.2,
+        compaction_min_deleted: int = 1000,
+        flush_rows: int = 256,
+        flush_interval: float = 1.0
+    ):
+        self._configured_dimension = dimension
+        self._initial_capacity = max(1, initial_capacity)
+        # 内存中的尾部数据：预先归一化的 float32 矩阵，容量按倍数增长，只有前 _tail_size 行有效
+        self._tail: Optional[np.ndarray] = None
+        self._tail_size = 0
+        self._tail_documents: List[Document] = []
+        # 可插拔的候选索引（flat 精确检索 / ivf 近似检索）
+        self.index = index or FlatIndex()
+        # 选定元数据字段的倒排索引，用于检索前过滤
+        self.metadata_index = MetadataIndex(metadata_keys)
+        # 可选的压缩编码（int8 / pq）：在编码上粗排，再用磁盘上的全精度向量重排
+        if quantizer is not None and not data_dir:
+            raise ValueError("Quantized storage requires data_dir for the full-precision vectors")
+        self.quantizer = quantizer
+        self.rerank_factor = max(1, rerank_factor)
+        # 配置了数据目录时，写入先进入内存尾部，攒够 flush_rows 行或经过 flush_interval 秒后
+        # 整体落盘为一个不可变段，重启后直接 memmap 映射；flush_rows <= 1 时每次写入都立即落盘。
+        # 尚未落盘的写入在进程崩溃时丢失
+        self.segment_store = SegmentStore(data_dir, max_segments, metadata_keys) if data_dir else None
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self._flush_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        # 上次落盘后只改变了内存状态的写入次数，计入内容版本
+        self._unflushed_writes = 0
+        self.dimension = dimension
+        # 墓碑位图：与全局行号对齐，删除只置位，检索时屏蔽；文档 id -> 存活行号
+        self._deleted = np.zeros(0, dtype=bool)
+        self._deleted_count = 0
+        self._rows_by_id: Dict[str, int] = {}
+        # 墓碑比例超过 compaction_ratio 且数量不少于 compaction_min_deleted 时后台压实
+        self.compaction_ratio = compaction_ratio
+        self.compaction_min_deleted = compaction_min_deleted
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        self.compactions = 0
+        # 每次清空或压实后递增，压实据此放弃基于过期快照的结果
+        self._generation = 0
+        # 纯内存模式的内容版本：进程内随机前缀加写入次数
+        self._version_epoch = uuid.uuid4().hex[:8]
+        self._writes = 0
+        # 读写锁：检索并发执行；写入与清空独占，每批文档在一次加锁操作中完成追加
+        self._rwlock = ReadWriteLock()
+        if self.segment_store is not None and self.segment_store.dimension is not None:
+            self._check_dimension(self.segment_store.dimension)
+            self.index.build(self._blocks())
+            if self.quantizer is not None:
+                self.quantizer.build(self._blocks())
+            self._load_records()
+        logger.info(f"Vector store initialized with {self.index.index_type} index, {self._live_size} document(s)")
+
+    @property
+    def _segments(self) -> list:
+        return self.segment_store.segments if self.segment_store is not None else []
+
+    @property
+    def _size(self) -> int:
+        return sum(segment.rows for segment in self._segments) + self._tail_size
+
+    @property
+    def _disk_size(self) -> int:
+        return sum(segment.rows for segment in self._segments)
+
+    @property
+    def _live_size(self) -> int:
+        return self._size - self._deleted_count
+
+    def _blocks(self) -> List[Tuple[int, np.ndarray]]:
+        """按全局行号顺序返回 (起始行号, 向量矩阵)：先是各磁盘段，最后是内存尾部"""
+        blocks = []
+        start = 0
+        for segment in self._segments:
+            blocks.append((start, segment.vectors))
+            start += segment.rows
+        if self._tail_size:
+            blocks.append((start, self._tail[:self._tail_size]))
+        return blocks
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """返回当前所有文档的归一化向量（纯内存模式下为视图，存在磁盘段时会拼接复制）"""
+        blocks = self._blocks()
+        if not blocks:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        if len(blocks) == 1:
+            return blocks[0][1]
+        return np.concatenate([matrix for _, matrix in blocks])
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """按行做 L2 归一化，零向量保持为零"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """用 argpartition 选出得分最高的 k 个下标，并按得分降序排列"""
+        k = min(k, scores.shape[0])
+        if k < scores.shape[0]:
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(scores.shape[0])
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    def _reserve(self, count: int) -> None:
+        """确保内存尾部还能容纳 count 行，容量不足时成倍扩容"""
+        required = self._tail_size + count
+        capacity = 0 if self._tail is None else self._tail.shape[0]
+        if required <= capacity:
+            return
+        new_capacity = max(capacity, self._initial_capacity)
+        while new_capacity < required:
+            new_capacity *= 2
+        matrix = np.empty((new_capacity, self.dimension), dtype=np.float32)
+        if self._tail_size:
+            matrix[:self._tail_size] = self._tail[:self._tail_size]
+        self._tail = matrix
+
+    def _check_dimension(self, dimension: int) -> None:
+        if self.dimension is None:
+            self.dimension = dimension
+        elif dimension != self.dimension:
+            raise ValueError(
+                f"Embedding dimension {dimension} does not match store dimension {self.dimension}"
+            )
+
+    def _score(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """计算查询与指定行（None 表示全部行）的余弦相似度"""
+        blocks = self._blocks()
+        if rows is None:
+            return np.concatenate([matrix @ query for _, matrix in blocks])
+        scores = np.empty(rows.shape[0], dtype=np.float32)
+        for start, matrix in blocks:
+            mask = (rows >= start) & (rows < start + matrix.shape[0])
+            if mask.any():
+                scores[mask] = matrix[rows[mask] - start] @ query
+        return scores
+
+    def _document(self, row: int) -> Document:
+        """按全局行号读取文档，磁盘段中的文档按需从 memmap 解码"""
+        segments = self._segments
+        starts = np.cumsum([0] + [segment.rows for segment in segments])
+        if row >= starts[-1]:
+            return self._tail_documents[row - starts[-1]]
+        position = bisect.bisect_right(starts, row) - 1
+        return segments[position].document(row - starts[position])
+
+    @staticmethod
+    def _load_catalogs(metadata_index: MetadataIndex, segments: Sequence, start_row: int) -> List[str]:
+        """把各段目录中的元数据倒排表合入 metadata_index，返回按行排列的文档 id"""
+        ids: List[str] = []
+        for segment in segments:
+            segment_ids, catalog = segment.catalog(metadata_index.keys)
+            metadata_index.load(catalog, start_row + len(ids))
+            ids.extend(segment_ids)
+        return ids
+
+    def _reserve_tombstones(self, rows: int) -> None:
+        """确保墓碑位图至少覆盖 rows 行，容量成倍增长"""
+        if self._deleted.shape[0] >= rows:
+            return
+        deleted = np.zeros(max(rows, 1024, self._deleted.shape[0] * 2), dtype=bool)
+        deleted[:self._deleted.shape[0]] = self._deleted
+        self._deleted = deleted
+
+    def _mark_deleted(self, rows: Sequence[int], persist: bool = True) -> None:
+        """在墓碑位图中标记已删除的行（持久化模式下磁盘段中的行同时追加到墓碑文件）
+
+        内存尾部的行在落盘时再登记墓碑。
+        """
+        if not len(rows):
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        self._deleted[rows] = True
+        self._deleted_count += rows.shape[0]
+        if persist and self.segment_store is not None:
+            on_disk = rows[rows < self._disk_size]
+            if on_disk.shape[0]:
+                self.segment_store.add_tombstones(on_disk)
+            if on_disk.shape[0] < rows.shape[0]:
+                self._unflushed_writes += 1
+
+    def _load_records(self) -> None:
+        """启动时读取各段目录，重建 id 映射、元数据倒排索引与墓碑位图（不解码文档记录）"""
+        size = self._size
+        self.metadata_index.reset()
+        ids = self._load_catalogs(self.metadata_index, self._segments, 0)
+
+        self._reserve_tombstones(size)
+        tombstones = self.segment_store.load_tombstones()
+        tombstones = np.unique(tombstones[tombstones < size])
+        self._mark_deleted(tombstones, persist=False)
+        # 更新写入新行后、标记旧行前崩溃会留下重复 id：保留最后写入的一行
+        duplicates = []
+        for row, document_id in enumerate(ids):
+            previous = self._rows_by_id.get(document_id)
+            if previous is not None and not self._deleted[previous]:
+                duplicates.append(previous)
+            self._rows_by_id[document_id] = row
+        self._mark_deleted(duplicates)
+        for row in tombstones:
+            if self._rows_by_id.get(ids[row]) == row:
+                del self._rows_by_id[ids[row]]
+
+    def add_document(self, document: Document, embedding: np.ndarray) -> str:
+        """添加文档和其向量嵌入（id 已存在时替换旧文档）"""
+        return self.add_documents([document], np.asarray(embedding).reshape(1, -1))[0]
+
+    def add_documents(self, documents: List[Document], embeddings: np.ndarray) -> List[str]:
+        """批量添加文档，向量一次性追加到内存尾部（持久化模式下尾部攒够 flush_rows 行即落盘）
+
+        id 已存在的文档视为更新：新行写入后旧行立即标记为墓碑，读者不会同时看到新旧两版。
+        """
+        embeddings = np.asarray(embeddings)
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(documents):
+            raise ValueError("Expected one embedding row per document")
+        if not documents:
             return []
-        
-        # 计算余弦相似度
-        similarities = [
-            np.dot(query_embedding, doc_embedding) / 
-            (np.linalg.norm(query_embedding) * np.linalg.norm(doc_embedding))
-            for doc_embedding in self.embeddings
-        ]
-        
-        # 获取最相似的文档
-        top_indices = np.argsort(similarities)[-limit:][::-1]
-        
-        results = []
-        for idx in top_indices:
-            results.append({
-                "document": self.documents[idx],
-                "similarity": float(similarities[idx])
-            })
-        
-        logger.info(f"Search completed, found {len(results)} results")
+        for document in documents:
+            if document.id is None:
+                document.id = uuid.uuid4().hex
+
+        # 归一化在锁外完成，锁内只做追加
+        vectors = self._normalize(embeddings)
+        with self._rwlock.write():
+            self._check_dimension(vectors.shape[1])
+            start_row = self._size
+            self._reserve(len(documents))
+            self._tail[self._tail_size:self._tail_size + len(documents)] = vectors
+            self._tail_size += len(documents)
+            self._tail_documents.extend(documents)
+            if self.segment_store is not None:
+                self._unflushed_writes += 1
+
+            self.index.add(vectors, start_row)
+            self.metadata_index.add((document.metadata for document in documents), start_row)
+            if self.index.needs_training:
+                self.index.build(self._blocks())
+            if self.quantizer is not None:
+                self.quantizer.add(vectors, start_row)
+                if self.quantizer.needs_training:
+                    self.quantizer.build(self._blocks())
+
+            self._reserve_tombstones(self._size)
+            replaced = []
+            for row, document in enumerate(documents, start_row):
+                previous = self._rows_by_id.get(document.id)
+                if previous is not None:
+                    replaced.append(previous)
+                self._rows_by_id[document.id] = row
+            self._mark_deleted(replaced)
+            self._writes += 1
+            if self.segment_store is not None and self._tail_size >= self.flush_rows:
+                self._flush_tail()
+        if self.segment_store is not None and self._tail_size:
+            self._schedule_flush()
+        logger.info(f"Added {len(documents)} document(s), replaced {len(replaced)}, total {self._live_size}")
+        if replaced:
+            self.maybe_compact()
+        return [document.id for document in documents]
+
+    def _flush_tail(self) -> None:
+        """把内存尾部写成一个磁盘段（需持有写锁）；全局行号不变，索引无需改动"""
+        if self.segment_store is None or not self._tail_size:
+            return
+        start = self._disk_size
+        self.segment_store.append(self._tail[:self._tail_size], self._tail_documents)
+        deleted = np.flatnonzero(self._deleted[start:start + self._tail_size]) + start
+        if deleted.shape[0]:
+            self.segment_store.add_tombstones(deleted)
+        self._tail = None
+        self._tail_size = 0
+        self._tail_documents = []
+        self._unflushed_writes = 0
+
+    def flush(self) -> None:
+        """立即把尚未落盘的写入写成磁盘段"""
+        with self._rwlock.write():
+            self._flush_tail()
+
+    def _schedule_flush(self) -> None:
+        """flush_interval 秒后在后台落盘（已有待执行的定时落盘时不重复安排）"""
+        if self.flush_interval <= 0:
+            return
+        with self._flush_lock:
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(self.flush_interval, self._flush_in_background)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _flush_in_background(self) -> None:
+        with self._flush_lock:
+            self._flush_timer = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing vector store: {str(e)}")
+            self._schedule_flush()
+
+    def close(self) -> None:
+        """停止定时落盘并写出剩余数据"""
+        with self._flush_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        self.flush()
+
+    def delete_documents(self, document_ids: Iterable[str]) -> int:
+        """按 id 删除文档，返回实际删除的数量
+
+        只在墓碑位图中置位，检索时屏蔽这些行；空间与索引由后台压实回收。
+        """
+        with self._rwlock.write():
+            rows = [self._rows_by_id.pop(document_id) for document_id in set(document_ids)
+                    if document_id in self._rows_by_id]
+            self._mark_deleted(rows)
+            if rows:
+                self._writes += 1
+        if rows:
+            logger.info(f"Deleted {len(rows)} document(s), {self._deleted_count} tombstone(s)")
+            self.maybe_compact()
+        return len(rows)
+
+    def delete_document(self, document_id: str) -> bool:
+        """按 id 删除单个文档，文档不存在时返回 False"""
+        return self.delete_documents([document_id]) == 1
+
+    def maybe_compact(self) -> None:
+        """墓碑比例超过阈值时启动后台压实线程"""
+        deleted = self._deleted_count
+        if deleted < self.compaction_min_deleted or deleted < self.compaction_ratio * self._size:
+            return
+        with self._compaction_lock:
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(target=self._compact_in_background, daemon=True)
+            self._compaction_thread.start()
+
+    def _compact_in_background(self) -> None:
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"Error compacting vector store: {str(e)}")
+
+    def compact(self) -> bool:
+        """物理移除墓碑行，重建密集存储与各索引
+
+        读锁下取快照，重写存储和重建索引时不持锁，检索照常进行；
+        最后在写锁内补上压实期间新增的行与删除，再整体替换。
+        """
+        paused = self.segment_store.maintenance_lock if self.segment_store is not None else nullcontext()
+        with paused:
+            with self._rwlock.read():
+                if not self._deleted_count:
+                    return False
+                generation = self._generation
+                # 持久化模式只压实磁盘段，内存尾部与之后落盘的段都按压实期间新增的行处理
+                size = self._disk_size if self.segment_store is not None else self._size
+                keep = ~self._deleted[:size]
+                segments = list(self._segments)
+                tail = self._tail
+                tail_size = self._tail_size
+                tail_documents = self._tail_documents[:tail_size]
+            live = int(keep.sum())
+
+            # 1. 只保留存活行，重写为一个新段（或新的内存矩阵）
+            segment = None
+            compacted_documents: List[Document] = []
+            if self.segment_store is not None:
+                masks, start = [], 0
+                for old in segments:
+                    masks.append(keep[start:start + old.rows])
+                    start += old.rows
+                segment = self.segment_store.write_compacted(segments, masks)
+                blocks = [(0, segment.vectors)] if segment is not None else []
+            else:
+                compacted = tail[:tail_size][keep]
+                compacted_documents = [document for document, kept in zip(tail_documents, keep) if kept]
+                blocks = [(0, compacted)] if live else []
+                metadatas = (document.metadata for document in compacted_documents)
+
+            # 2. 在新数据上重建索引，旧索引继续服务检索
+            index = copy.copy(self.index)
+            index.reset()
+            index.build(blocks)
+            quantizer = None
+            if self.quantizer is not None:
+                quantizer = copy.copy(self.quantizer)
+                quantizer.build(blocks)
+            metadata_index = MetadataIndex(self.metadata_index.keys)
+            if metadata_index.keys:
+                if self.segment_store is not None:
+                    self._load_catalogs(metadata_index, [segment] if segment is not None else [], 0)
+                else:
+                    metadata_index.add((document.metadata for document in compacted_documents), 0)
+
+            # 3. 写锁内合入压实期间的变化并替换
+            with self._rwlock.write():
+                if self._generation != generation:
+                    if segment is not None:
+                        self.segment_store.discard(segment.segment_id)
+                    return False
+                removed = size - live
+                remap = np.cumsum(keep) - 1
+                # 压实期间新删除的行按新行号重新登记
+                tombstones = np.concatenate([
+                    remap[np.flatnonzero(self._deleted[:size] & keep)],
+                    np.flatnonzero(self._deleted[size:self._size]) + size - removed
+                ]).astype(np.int64)
+
+                if self.segment_store is not None:
+                    appended = self._segments[len(segments):]
+                    # 内存尾部的墓碑在落盘时再登记
+                    disk_rows = live + sum(s.rows for s in appended)
+                    self.segment_store.replace_compacted(segments, segment, tombstones[tombstones < disk_rows])
+                    if metadata_index.keys:
+                        self._load_catalogs(metadata_index, appended, live)
+                        metadata_index.add((document.metadata for document in self._tail_documents), disk_rows)
+                else:
+                    appended_vectors = self._tail[tail_size:self._tail_size]
+                    appended_documents = self._tail_documents[tail_size:]
+                    self._tail = None
+                    self._tail_size = 0
+                    self._reserve(live + len(appended_documents))
+                    self._tail[:live] = compacted
+                    self._tail[live:live + len(appended_documents)] = appended_vectors
+                    self._tail_size = live + len(appended_documents)
+                    self._tail_documents = compacted_documents + appended_documents
+                    if metadata_index.keys:
+                        metadata_index.add((document.metadata for document in appended_documents), live)
+
+                for start, matrix in self._blocks():
+                    if start + matrix.shape[0] > live:
+                        offset = max(live - start, 0)
+                        index.add(matrix[offset:], start + offset)
+                        if quantizer is not None:
+                            quantizer.add(matrix[offset:], start + offset)
+                if index.needs_training:
+                    index.build(self._blocks())
+                if quantizer is not None and quantizer.needs_training:
+                    quantizer.build(self._blocks())
+                self.index = index
+                self.quantizer = quantizer
+                self.metadata_index = metadata_index
+
+                self._deleted = np.zeros(0, dtype=bool)
+                self._deleted_count = 0
+                self._reserve_tombstones(self._size)
+                self._mark_deleted(tombstones, persist=False)
+                self._rows_by_id = {
+                    document_id: int(remap[row]) if row < size else row - removed
+                    for document_id, row in self._rows_by_id.items()
+                }
+                self._generation += 1
+                self.compactions += 1
+        if self.segment_store is not None:
+            self.segment_store.maybe_merge()
+        logger.info(f"Compacted vector store: removed {removed} row(s), {self._size} row(s) left")
+        return True
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        limit: int = 5,
+        nprobe: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        """搜索最相似的文档
+
+        nprobe 控制近似索引的召回率/延迟权衡；filters 为元数据过滤表达式，
+        先解析为候选行再打分，选择性越高需要打分的行越少。
+        """
+        return self.search_batch(np.asarray(query_embedding).reshape(1, -1), limit, nprobe, filters)[0]
+
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        limit: int = 5,
+        nprobe: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict]]:
+        """一次检索多条查询，返回每条查询各自的 top-k
+
+        精确检索且无过滤时，整批查询合并为一次矩阵-矩阵乘法。
+        """
+        # 向量已预先归一化，余弦相似度只需矩阵乘法
+        queries = self._normalize(np.asarray(query_embeddings).reshape(len(query_embeddings), -1))
+        with self._rwlock.read():
+            if not self._live_size or limit <= 0:
+                return [[] for _ in range(queries.shape[0])]
+            self._check_dimension(queries.shape[1])
+
+            # 索引给出候选行（None 表示全部），只对候选行打分
+            candidates = [self.index.candidates(query, nprobe) for query in queries]
+            quantized = self.quantizer is not None and self.quantizer.is_trained
+            if not filters and not quantized and all(rows is None for rows in candidates):
+                hits = self._exact_batch(queries, limit)
+            else:
+                hits = [
+                    self._search_rows(query, rows, limit, filters)
+                    for query, rows in zip(queries, candidates)
+                ]
+            results = [
+                [
+                    {"document": self._document(int(row)), "similarity": float(score)}
+                    for row, score in zip(rows, scores)
+                ]
+                for rows, scores in hits
+            ]
+
+        logger.info(f"Search completed for {len(results)} queries")
         return results
-    
+
+    def _exact_batch(self, queries: np.ndarray, limit: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """分块计算 (行 x 查询) 得分矩阵，每块按列部分选择 top-k，最后逐查询合并"""
+        candidate_rows, candidate_scores = [], []
+        for start, matrix in self._blocks():
+            for offset in range(0, matrix.shape[0], BATCH_SCAN_ROWS):
+                scores = matrix[offset:offset + BATCH_SCAN_ROWS] @ queries.T
+                if self._deleted_count:
+                    first = start + offset
+                    scores[self._deleted[first:first + scores.shape[0]]] = -np.inf
+                k = min(limit, scores.shape[0])
+                if k < scores.shape[0]:
+                    top = np.argpartition(-scores, k - 1, axis=0)[:k]
+                else:
+                    top = np.broadcast_to(np.arange(scores.shape[0])[:, None], scores.shape)
+                candidate_rows.append(top + start + offset)
+                candidate_scores.append(np.take_along_axis(scores, top, axis=0))
+        rows = np.concatenate(candidate_rows)
+        scores = np.concatenate(candidate_scores)
+        hits = []
+        for j in range(queries.shape[0]):
+            top = self._top_k(scores[:, j], limit)
+            top = top[np.isfinite(scores[top, j])]
+            hits.append((rows[top, j], scores[top, j]))
+        return hits
+
+    def _search_rows(
+        self,
+        query: np.ndarray,
+        rows: Optional[np.ndarray],
+        limit: int,
+        filters: Optional[Dict[str, Any]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """在候选行上检索单条查询，返回 (行号, 得分)"""
+        if filters:
+            allowed = self.metadata_index.resolve(filters)
+            if rows is None or allowed.shape[0] <= rows.shape[0]:
+                # 过滤结果比索引候选更少时直接对其精确打分
+                rows = allowed
+            else:
+                rows = np.intersect1d(rows, allowed)
+        # 候选行已知时直接剔除墓碑行，全量扫描时把墓碑行的得分置为 -inf
+        deleted = self._deleted[:self._size] if self._deleted_count else None
+        if rows is not None and deleted is not None:
+            rows = rows[~deleted[rows]]
+        if rows is not None and rows.shape[0] == 0:
+            return rows, np.empty(0, dtype=np.float32)
+        if self.quantizer is not None and self.quantizer.is_trained:
+            # 在压缩编码上粗排，只取少量候选从磁盘读取全精度向量重排
+            approximate = self.quantizer.score(query, rows)
+            if rows is None and deleted is not None:
+                approximate[deleted] = -np.inf
+            shortlist = self._top_k(approximate, limit * self.rerank_factor)
+            rows = shortlist if rows is None else rows[shortlist]
+        similarities = self._score(query, rows)
+        if rows is None and deleted is not None:
+            similarities[deleted] = -np.inf
+
+        # 部分选择出最相似的文档
+        top = self._top_k(similarities, limit)
+        top = top[np.isfinite(similarities[top])]
+        return (top if rows is None else rows[top]), similarities[top]
+
+    def version(self) -> str:
+        """内容版本，任何写入、删除或清空后都会变化；持久化模式下由数据目录得出，多个进程一致"""
+        if self.segment_store is not None:
+            if self._unflushed_writes:
+                return f"{self.segment_store.version()}+{self._version_epoch}.{self._writes}"
+            return self.segment_store.version()
+        return f"{self._version_epoch}.{self._writes}"
+
     def get_stats(self) -> Dict:
         """获取知识库统计信息"""
-        return {
-            "total_documents": len(self.documents),
-            "average_embedding_dim": len(self.embeddings[0]) if self.embeddings else 0
+        size = self._live_size
+        stats = {
+            "total_documents": size,
+            "average_embedding_dim": self.dimension if size else 0,
+            "deleted_documents": self._deleted_count,
+            "compactions": self.compactions,
+            "index": self.index.get_stats(),
+            "metadata_index": self.metadata_index.get_stats()
         }
-    
+        if self.quantizer is not None:
+            stats["quantization"] = self.quantizer.get_stats(self.dimension)
+        if self.segment_store is not None:
+            stats["storage"] = self.segment_store.get_stats()
+            stats["storage"]["unflushed_documents"] = self._tail_size
+        return stats
+
     def clear(self) -> None:
         """清空知识库"""
-        self.documents.clear()
-        self.embeddings.clear()
-        logger.info("Vector store cleared") 
\ No newline at end of file
+        with self._rwlock.write():
+            if self.segment_store is not None:
+                self.segment_store.clear()
+            self._tail = None
+            self._tail_size = 0
+            self._tail_documents = []
+            self._unflushed_writes = 0
+            self._deleted = np.zeros(0, dtype=bool)
+            self._deleted_count = 0
+            self._rows_by_id = {}
+            self._generation += 1
+            self._writes += 1
+            self.dimension = self._configured_dimension
+            self.index.reset()
+            self.metadata_index.reset()
+            if self.quantizer is not None:
+                self.quantizer.reset()
+        logger.info("Vector store cleared")
@@ -0,0 +1,115 @@
+import glob
+import os
+
+import numpy as np
+
+from src.document import Document
+from src.vector_store import VectorStore
+
+DIMENSION = 16
+
+
+def open_store(data_dir, **kwargs):
+    options = {"dimension": DIMENSION, "max_segments": 3, "metadata_keys": ["group"], "compaction_min_deleted": 1}
+    options.update(kwargs)
+    return VectorStore(data_dir=str(data_dir), **options)
+
+
+def add(store, live, rng, ids):
+    vectors = rng.standard_normal((len(ids), DIMENSION)).astype(np.float32)
+    documents = [Document(id=i, content=f"doc {i}", metadata={"group": int(i) % 3}) for i in ids]
+    store.add_documents(documents, vectors)
+    for document, vector in zip(documents, vectors):
+        live[document.id] = (vector / np.linalg.norm(vector), document.metadata["group"])
+
+
+def brute_force(live, query, limit, group=None):
+    query = query / np.linalg.norm(query)
+    scored = [(float(vector @ query), i) for i, (vector, g) in live.items() if group is None or g == group]
+    return [i for _, i in sorted(scored, reverse=True)[:limit]]
+
+
+def mismatches(store, live, queries, limit=10):
+    count = 0
+    for query in queries:
+        if [hit["document"].id for hit in store.search(query, limit)] != brute_force(live, query, limit):
+            count += 1
+        hits = store.search(query, limit, filters={"group": 1})
+        if [hit["document"].id for hit in hits] != brute_force(live, query, limit, group=1):
+            count += 1
+    return count
+
+
+def test_persist_reopen_delete_upsert_compact_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((20, DIMENSION)).astype(np.float32)
+    live = {}
+
+    store = open_store(tmp_path, flush_rows=1)
+    for batch in range(6):
+        add(store, live, rng, [str(i) for i in range(batch * 50, batch * 50 + 50)])
+    assert mismatches(store, live, queries) == 0
+    store.close()
+
+    # 重启后从段、墓碑与元数据目录恢复
+    store = open_store(tmp_path, flush_rows=1)
+    assert mismatches(store, live, queries) == 0
+    deleted = [str(i) for i in range(0, 300, 4)]
+    assert store.delete_documents(deleted) == len(deleted)
+    for i in deleted:
+        del live[i]
+    # 覆盖写入已有 id：旧行变为墓碑
+    add(store, live, rng, [str(i) for i in range(1, 300, 8)])
+    assert mismatches(store, live, queries) == 0
+    store.close()
+
+    store = open_store(tmp_path, flush_rows=1)
+    assert mismatches(store, live, queries) == 0
+    assert store.compact()
+    assert store.get_stats()["deleted_documents"] == 0
+    assert mismatches(store, live, queries) == 0
+    store.close()
+
+    store = open_store(tmp_path, flush_rows=1)
+    assert store.get_stats()["total_documents"] == len(live)
+    assert mismatches(store, live, queries) == 0
+    store.close()
+
+
+def test_buffered_tail_flushes_on_close_and_keeps_tail_deletes(tmp_path):
+    rng = np.random.default_rng(1)
+    queries = rng.standard_normal((10, DIMENSION)).astype(np.float32)
+    live = {}
+
+    store = open_store(tmp_path, flush_rows=1000, flush_interval=3600)
+    add(store, live, rng, [str(i) for i in range(100)])
+    # 尾部的行尚未落盘就被删除，落盘后仍应是墓碑
+    store.delete_documents(["3", "4"])
+    del live["3"], live["4"]
+    assert not glob.glob(os.path.join(str(tmp_path), "*.vec*"))
+    assert mismatches(store, live, queries) == 0
+    store.close()
+
+    store = open_store(tmp_path, flush_rows=1000, flush_interval=3600)
+    assert store.get_stats()["total_documents"] == len(live)
+    assert mismatches(store, live, queries) == 0
+    store.close()
+
+
+def test_missing_metadata_catalog_is_rebuilt(tmp_path):
+    rng = np.random.default_rng(2)
+    queries = rng.standard_normal((10, DIMENSION)).astype(np.float32)
+    live = {}
+
+    store = open_store(tmp_path, flush_rows=1)
+    add(store, live, rng, [str(i) for i in range(60)])
+    store.close()
+    catalogs = glob.glob(os.path.join(str(tmp_path), "*.meta"))
+    assert catalogs
+    for path in catalogs:
+        os.remove(path)
+
+    store = open_store(tmp_path, flush_rows=1)
+    assert mismatches(store, live, queries) == 0
+    store.close()
+    assert len(glob.glob(os.path.join(str(tmp_path), "*.meta"))) == len(catalogs)
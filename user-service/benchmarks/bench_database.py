@@ -0,0 +1,153 @@
+"""user-service 数据库访问基准（SQLite）
+
+对比逐个创建与批量创建、OFFSET 与游标分页在不同深度的延迟、逐个 GET 与批量查询。
+接口请求经 ASGI 直接进入应用，包含 FastAPI 与异步 SQLAlchemy 的完整开销；分页另外单独统计
+SQL 查询本身的耗时。创建接口的耗时包含 bcrypt，其余数据直接写库填充到 --size。
+
+在 user-service 目录下运行:
+    python -m benchmarks.bench_database --size 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import func, insert, select
+
+
+def user(i):
+    return {"username": f"user{i}", "email": f"user{i}@example.com", "full_name": f"User {i}", "password": "password"}
+
+
+async def timed(func, repeat=1):
+    """执行 repeat 次，返回平均耗时（毫秒）"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+async def bench_create(client, single, bulk, batch_size):
+    start = time.perf_counter()
+    for i in range(single):
+        response = await client.post("/user/", json=user(i))
+        response.raise_for_status()
+    single_rate = single / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for offset in range(single, single + bulk, batch_size):
+        response = await client.post("/user/bulk", json=[user(i) for i in range(offset, min(offset + batch_size, single + bulk))])
+        response.raise_for_status()
+    bulk_rate = bulk / (time.perf_counter() - start)
+
+    print(f"{'create':>10} {'users/s':>10}")
+    print(f"{'single':>10} {single_rate:>10.1f}")
+    print(f"{'bulk':>10} {bulk_rate:>10.1f} ({bulk_rate / single_rate:.1f}x)")
+
+
+async def seed(size):
+    """直接写库把用户数补到 size，所有用户共用一个预先计算的哈希"""
+    from src.database import SessionLocal
+    from src.models import User
+    from src.security import hash_password
+
+    hashed_password = hash_password("password")
+    async with SessionLocal() as db:
+        start = (await db.execute(select(func.count(User.id)))).scalar()
+        for offset in range(start, size, 10000):
+            rows = [
+                {**user(i), "hashed_password": hashed_password, "is_active": True}
+                for i in range(offset, min(offset + 10000, size))
+            ]
+            for row in rows:
+                del row["password"]
+            await db.execute(insert(User), rows)
+        await db.commit()
+
+
+async def bench_pagination(client, size, limit, repeat):
+    from src.database import SessionLocal
+    from src.models import User
+
+    async with SessionLocal() as db:
+        async def offset_query(depth):
+            await db.execute(select(User).order_by(User.id).offset(depth).limit(limit))
+
+        async def keyset_query(cursor):
+            await db.execute(select(User).where(User.id > cursor).order_by(User.id).limit(limit))
+
+        print(f"{'depth':>10} {'offset_ms':>10} {'keyset_ms':>10} {'offset_sql':>11} {'keyset_sql':>11}")
+        for depth in (0, size // 4, size // 2, size - limit):
+            # 同一页：OFFSET 跳过 depth 行，游标从第 depth 行的 id 之后开始（id 从 1 连续分配）
+            offset_ms = await timed(lambda: client.get("/user/", params={"skip": depth, "limit": limit}), repeat)
+            keyset_ms = await timed(lambda: client.get("/user/page", params={"cursor": depth, "limit": limit}), repeat)
+            offset_sql = await timed(lambda: offset_query(depth), repeat)
+            keyset_sql = await timed(lambda: keyset_query(depth), repeat)
+            print(f"{depth:>10} {offset_ms:>10.2f} {keyset_ms:>10.2f} {offset_sql:>11.2f} {keyset_sql:>11.2f}")
+
+        # 逐页读完全表：OFFSET 的总代价随页数平方增长
+        pages = range(0, size, limit)
+        start = time.perf_counter()
+        for depth in pages:
+            await offset_query(depth)
+        offset_total = time.perf_counter() - start
+        start = time.perf_counter()
+        for depth in pages:
+            await keyset_query(depth)
+        keyset_total = time.perf_counter() - start
+        print(f"full scan ({len(pages)} pages, sql only): offset {offset_total:.2f}s, keyset {keyset_total:.2f}s")
+
+
+async def bench_batch_get(client, size, count, repeat):
+    ids = random.Random(0).sample(range(1, size + 1), count)
+
+    async def one_by_one():
+        for user_id in ids:
+            (await client.get(f"/user/{user_id}")).raise_for_status()
+
+    async def batch():
+        response = await client.get("/user/batch", params={"ids": ids})
+        assert len(response.json()) == count
+
+    single_ms = await timed(one_by_one, repeat)
+    batch_ms = await timed(batch, repeat)
+    print(f"get {count} users: one by one {single_ms:.2f} ms, batch {batch_ms:.2f} ms ({single_ms / batch_ms:.1f}x)")
+
+
+async def run(args):
+    from src.main import app, startup, shutdown
+
+    await startup()
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            await bench_create(client, args.single, args.bulk, args.batch_size)
+            await seed(args.size)
+            await bench_pagination(client, args.size, args.limit, args.repeat)
+            await bench_batch_get(client, args.size, args.batch_get, args.repeat)
+    finally:
+        await shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--single", type=int, default=500, help="逐个创建的用户数")
+    parser.add_argument("--bulk", type=int, default=5000, help="经批量接口创建的用户数")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--batch-get", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 应用在导入时读取配置；哈希成本调到最低，只测数据库访问
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ["BCRYPT_ROUNDS"] = "4"
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,174 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import FastAPI, Depends, HTTPException, Query, status
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import asyncio
 import logging
+import os
 from datetime import datetime
 
 from .database import get_db, engine
 from .models import Base, User
-from .schemas import UserCreate, UserUpdate, UserResponse
+from .schemas import UserCreate, UserUpdate, UserResponse, UserPage, UserCredentials, LoginRecord
+from .security import hash_executor, hash_password_async
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 创建数据库表
-Base.metadata.create_all(bind=engine)
+# 批量创建、批量查询与分页每次最多处理的用户数
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
 
 app = FastAPI(title="User Service")
 
+@app.on_event("startup")
+async def startup():
+    # 创建数据库表
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await engine.dispose()
+    hash_executor.shutdown(wait=False)
+
+async def _get_user_or_404(db: AsyncSession, user_id: int) -> User:
+    db_user = await db.get(User, user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return db_user
+
 @app.post("/user/", response_model=UserResponse)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     db_user = User(
         username=user.username,
         email=user.email,
         full_name=user.full_name,
+        hashed_password=await hash_password_async(user.password),
         created_at=datetime.utcnow()
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
+@app.post("/user/bulk", response_model=List[UserResponse])
+async def create_users(users: List[UserCreate], db: AsyncSession = Depends(get_db)):
+    """批量创建用户：一次多行 INSERT，全部成功或全部失败，按请求顺序返回"""
+    if len(users) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} users per request")
+    if not users:
+        return []
+    
+    # 哈希专用线程池的线程数有限，整批在其中排队，不会占满处理其他请求的线程池
+    hashed_passwords = await asyncio.gather(*(hash_password_async(user.password) for user in users))
+    now = datetime.utcnow()
+    rows = [
+        {
+            "username": user.username,
+            "email": user.email,
+            "full_name": user.full_name,
+            "hashed_password": hashed_password,
+            "is_active": True,
+            "created_at": now
+        }
+        for user, hashed_password in zip(users, hashed_passwords)
+    ]
+    try:
+        await db.execute(insert(User), rows)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Username or email already exists")
+    
+    result = await db.execute(select(User).where(User.username.in_([user.username for user in users])))
+    created = {db_user.username: db_user for db_user in result.scalars()}
+    return [created[user.username] for user in users]
+
+@app.get("/user/batch", response_model=List[UserResponse])
+async def get_users(ids: List[int] = Query(...), db: AsyncSession = Depends(get_db)):
+    """按 ID 批量查询（?ids=1&ids=2），一次查询代替逐个 GET /user/{id}；按请求顺序返回，不存在的 ID 被忽略"""
+    if len(ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} ids per request")
+    result = await db.execute(select(User).where(User.id.in_(set(ids))))
+    found = {db_user.id: db_user for db_user in result.scalars()}
+    return [found[user_id] for user_id in dict.fromkeys(ids) if user_id in found]
+
+@app.get("/user/page", response_model=UserPage)
+async def page_users(
+    cursor: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=MAX_BATCH_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    """按 id 游标分页：cursor 传上一页的 next_cursor，没有下一页时 next_cursor 为 null
+
+    每页都从主键索引定位起点，翻到多深都不需要扫描前面的行。
+    """
+    query = select(User).order_by(User.id).limit(limit + 1)
+    if cursor is not None:
+        query = query.where(User.id > cursor)
+    users = (await db.execute(query)).scalars().all()
+    next_cursor = users[limit - 1].id if len(users) > limit else None
+    return {"items": users[:limit], "next_cursor": next_cursor}
+
 @app.get("/user/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == user_id).first()
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    return db_user
+async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    return await _get_user_or_404(db, user_id)
 
 @app.get("/user/", response_model=List[UserResponse])
-def list_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = db.query(User).offset(skip).limit(limit).all()
-    return users
+async def list_users(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+    """OFFSET 分页，深翻页时越来越慢，请改用 /user/page"""
+    result = await db.execute(select(User).order_by(User.id).offset(skip).limit(limit))
+    return result.scalars().all()
 
 @app.put("/user/{user_id}", response_model=UserResponse)
-def update_user(user_id: int, user: UserUpdate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == user_id).first()
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
+async def update_user(user_id: int, user: UserUpdate, db: AsyncSession = Depends(get_db)):
+    db_user = await _get_user_or_404(db, user_id)
     
-    for key, value in user.dict(exclude_unset=True).items():
+    updates = user.dict(exclude_unset=True)
+    if "password" in updates:
+        updates["hashed_password"] = await hash_password_async(updates.pop("password"))
+    for key, value in updates.items():
         setattr(db_user, key, value)
     
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @app.delete("/user/{user_id}")
-def delete_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == user_id).first()
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    db_user = await _get_user_or_404(db, user_id)
+    
+    await db.delete(db_user)
+    await db.commit()
+    return {"message": "User deleted successfully"}
+
+# 内部接口：网关不转发 /internal 前缀，只供 auth-service 调用
+@app.get("/internal/users/credentials", response_model=UserCredentials)
+async def get_user_credentials(username: str, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(User).where(User.username == username))
+    db_user = result.scalars().first()
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
+    return db_user
+
+@app.post("/internal/users/{user_id}/login")
+async def record_login(user_id: int, record: LoginRecord, db: AsyncSession = Depends(get_db)):
+    """记录登录时间；提供新哈希时替换旧哈希"""
+    db_user = await _get_user_or_404(db, user_id)
     
-    db.delete(db_user)
-    db.commit()
-    return {"message": "User deleted successfully"}
+    db_user.last_login = datetime.utcnow()
+    if record.hashed_password:
+        db_user.hashed_password = record.hashed_password
+    await db.commit()
+    return {"success": True}
+
+@app.get("/health")
+async def health_check():
+    """健康检查端点"""
+    return {"status": "healthy"}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8002) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8002)
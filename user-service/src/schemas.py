@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -22,4 +22,23 @@ class UserResponse(UserBase):
     last_login: Optional[datetime] = None
 
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True
+
+class UserPage(BaseModel):
+    items: List[UserResponse]
+    # 下一页的游标，没有更多数据时为 None
+    next_cursor: Optional[int] = None
+
+class UserCredentials(BaseModel):
+    """仅供 auth-service 校验密码的内部接口使用"""
+    id: int
+    username: str
+    hashed_password: Optional[str] = None
+    is_active: bool
+
+    class Config:
+        orm_mode = True
+
+class LoginRecord(BaseModel):
+    # 哈希成本变化时 auth-service 传回的新哈希
+    hashed_password: Optional[str] = None
@@ -0,0 +1,19 @@
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+import asyncio
+import os
+
+# bcrypt 成本需与 auth-service 的 BCRYPT_ROUNDS 一致，否则用户首次登录时会被重新哈希
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# 哈希专用线程数（默认等于 CPU 核数）：批量创建只在这里排队，不占满 anyio 的公共线程池
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or os.cpu_count() or 1
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+async def hash_password_async(password: str) -> str:
+    """在哈希专用线程池中计算 bcrypt，不阻塞事件循环"""
+    return await asyncio.get_event_loop().run_in_executor(hash_executor, hash_password, password)